@@ -0,0 +1,734 @@
+"""
+Benchmark suite for the lines, the version strings, and the text insight pipeline.
+
+Run it with `python Benchmarks.py`, optionally with the names of the benchmarks to run. The results are stored as JSON
+with `--output results.json`, and compared to a previous run with `--compare old.json`, so regressions between commits
+can be found. Every result is a cost, in seconds or bytes, so lower is always better. `--full` runs the biggest sizes,
+which take a while and a few GBs of memory.
+"""
+import argparse
+import functools
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from bs4 import BeautifulSoup
+
+from Corpus import PageCorpus
+from DataScraper import CosineSummariser, ProcessSummariser, RawPage, SentenceSummariser, SimpleWebScraper, \
+    TextInsight
+from OverlappingLines import Line, LineIndex, LineSet, first_overlap, iter_overlaps, lines_overlap, paused_gc, \
+    two_lines_overlap
+from Searchers import Searcher
+from VersionString import VersionIndex, compare_version_columns, compare_version_strings, dedupe_versions, \
+    max_version, sort_versions
+
+
+class LoopbackServer:
+    """
+    Small HTTP server running on a background thread on the loopback interface, used to benchmark the network code
+    without depending on the internet. It answers every GET with the same page, and keeps the connections alive.
+    """
+
+    def __init__(self, page: bytes = b"<html><p>benchmark page</p></html>", latency: float = 0.0):
+        """
+        :param page: Body returned for every request
+        :param latency: Seconds to wait before answering each request
+        """
+        self.page = page
+        self.latency = latency
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def page_url(self, i: int) -> str:
+        return "{}page/{}".format(self.url, i)
+
+    def __enter__(self) -> 'LoopbackServer':
+        page = self.page
+        latency = self.latency
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if latency:
+                    time.sleep(latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def timed(function, repeat: int) -> float:
+    """
+    Runs the function `repeat` times, and returns the mean time of each run in seconds
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_session_pooling(requests_count: int = 200) -> dict:
+    """
+    Compares fetching the same page with a bare `requests.get`, which opens a new connection for every request, against
+    the pooled session owned by SimpleWebScraper.
+    :param requests_count: How many requests to make with each getter
+    :return: Mean seconds per request for each getter
+    """
+    with LoopbackServer() as server:
+        scraper = SimpleWebScraper()
+        scraper.fetch(server.url)
+        results = {
+            "requests.get": timed(lambda: scraper.fetch(server.url, requests.get), requests_count),
+            "pooled session": timed(lambda: scraper.fetch(server.url), requests_count),
+        }
+        scraper.close()
+    return results
+
+
+def synthetic_page(paragraphs: int, depth: int = 1, words: int = 30) -> str:
+    """
+    Builds an html page with `paragraphs` paragraphs of `words` words, each nested inside `depth` divs
+    """
+    vocabulary = ["browser", "render", "page", "python", "query", "summary", "network", "scraper", "version", "line"]
+    body = []
+    for i in range(paragraphs):
+        text = " ".join(vocabulary[(i * 7 + j) % len(vocabulary)] for j in range(words))
+        body.append("<div>" * depth + "<p>{} {}</p>".format(text, i) + "</div>" * depth)
+    return "<html><body>{}</body></html>".format("".join(body))
+
+
+def bench_cosine_summariser_reuse(calls: int = 2000, window: int = 100) -> dict:
+    """
+    Calls the same CosineSummariser over and over on different pages, and compares the time per call at the start and
+    at the end. The cost per page should stay flat no matter how many pages the summariser has seen before.
+    :param calls: How many pages to summarise
+    :param window: How many calls are averaged at the start and at the end
+    :return: Mean seconds per call on the first and on the last window
+    """
+    summariser = CosineSummariser()
+    soups = [BeautifulSoup(synthetic_page(10 + i % 5), "html.parser") for i in range(10)]
+    times = []
+    for i in range(calls):
+        start = time.perf_counter()
+        summariser.summarise(soups[i % len(soups)], "render page on a browser")
+        times.append(time.perf_counter() - start)
+    return {
+        "first calls": sum(times[:window]) / window,
+        "last calls": sum(times[-window:]) / window,
+    }
+
+
+def bench_process_summariser(pages: int = 64, processes=(1, 2, 4)) -> dict:
+    """
+    Parses and summarises the same raw pages on a ProcessSummariser with a growing number of processes, and on this
+    process, to check the throughput grows with the number of cores
+    :param pages: How many pages to summarise
+    :param processes: Numbers of processes to try
+    :return: Seconds per page for each number of processes, "in process" is without a ProcessSummariser
+    """
+    scraper = SimpleWebScraper()
+    summariser = CosineSummariser()
+    raw_pages = [RawPage("http://page/{}".format(i), synthetic_page(200, depth=5).encode()) for i in range(pages)]
+
+    start = time.perf_counter()
+    for page in raw_pages:
+        summariser.summarise(scraper.parse(page), "render page on a browser")
+    results = {"in process": (time.perf_counter() - start) / pages}
+
+    for count in processes:
+        process_summariser = ProcessSummariser(scraper, summariser, count)
+        # starts and warms up every worker before measuring
+        process_summariser.summarise_many(raw_pages[:count], "warm up")
+        start = time.perf_counter()
+        process_summariser.summarise_many(raw_pages, "render page on a browser")
+        results["{} processes".format(count)] = (time.perf_counter() - start) / pages
+        process_summariser.close()
+    return results
+
+
+def bench_lines_overlap(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)) -> dict:
+    """
+    Times lines_overlap on sets of lines that don't overlap, which is its worst case, since every line is checked
+    :param sizes: Numbers of lines to try
+    :return: Seconds to build the lines and seconds to check them, for each size
+    """
+    results = {}
+    for size in sizes:
+        starts = list(range(0, 2 * size, 2))
+        random.Random(size).shuffle(starts)
+        start = time.perf_counter()
+        lines = [Line(x, x + 1) for x in starts]
+        results["build n={}".format(size)] = time.perf_counter() - start
+        start = time.perf_counter()
+        assert not lines_overlap(*lines)
+        results["overlap n={}".format(size)] = time.perf_counter() - start
+        del lines
+    return results
+
+
+def bench_line_construction(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)) -> dict:
+    """
+    Measures the memory used by each Line, and the time to build each line with the constructor, and with the bulk
+    from_pairs and from_arrays, whose inverse is the construction throughput. Each is measured as it is, and inside
+    paused_gc, since the garbage collector takes most of the time of creating millions of objects
+    :param sizes: Numbers of lines to build
+    :return: Bytes per line, and seconds per line for each way of building them, for each size
+    """
+    import tracemalloc
+
+    import numpy as np
+
+    results = {}
+    for size in sizes:
+        starts = list(range(0, 2 * size, 2))
+        ends = [x + 1 for x in starts]
+        pairs = list(zip(starts, ends))
+        arrays = np.array(starts), np.array(ends)
+        cases = {
+            "constructor": lambda: [Line(x1, x2) for x1, x2 in pairs],
+            "from_pairs": lambda: Line.from_pairs(pairs),
+            "from_arrays": lambda: Line.from_arrays(*arrays),
+        }
+        for name, case in cases.items():
+            results["{} seconds per line n={}".format(name, size)] = timed(case, max(1, 10 ** 6 // size)) / size
+            with paused_gc():
+                results["{} paused_gc seconds per line n={}".format(name, size)] = \
+                    timed(case, max(1, 10 ** 6 // size)) / size
+
+        # only the Line objects are measured, their points already exist
+        tracemalloc.start()
+        lines = [Line(x1, x2) for x1, x2 in pairs]
+        results["bytes per line n={}".format(size)] = tracemalloc.get_traced_memory()[0] / size
+        tracemalloc.stop()
+        del lines
+    return results
+
+
+def bench_line_set(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)) -> dict:
+    """
+    Times LineSet on the same worst case as bench_lines_overlap, and measures the memory used by the lines, as a list
+    of Line objects and as a LineSet
+    :param sizes: Numbers of lines to try
+    :return: Seconds to build and check the lines, and bytes per line, for each size
+    """
+    import tracemalloc
+
+    import numpy as np
+
+    results = {}
+    for size in sizes:
+        starts = np.arange(0, 2 * size, 2)
+        np.random.RandomState(size).shuffle(starts)
+        start = time.perf_counter()
+        line_set = LineSet(starts, starts + 1)
+        results["build n={}".format(size)] = time.perf_counter() - start
+        start = time.perf_counter()
+        assert not line_set.overlaps()
+        results["overlap n={}".format(size)] = time.perf_counter() - start
+        results["bytes per line n={}".format(size)] = (line_set.x1.nbytes + line_set.x2.nbytes) / size
+
+        starts = starts.tolist()
+        tracemalloc.start()
+        lines = [Line(x, x + 1) for x in starts]
+        results["list bytes per line n={}".format(size)] = tracemalloc.get_traced_memory()[0] / size
+        tracemalloc.stop()
+        del lines, line_set
+    return results
+
+
+def bench_line_index(sizes=(10 ** 3, 10 ** 4, 10 ** 5), queries: int = 1000) -> dict:
+    """
+    Times checking many short query lines against the same set of lines, with a LineIndex and with a scan of every line
+    using two_lines_overlap
+    :param sizes: Numbers of lines on the set
+    :param queries: Number of query lines
+    :return: Seconds to build the index, and seconds per query for each approach, for each size
+    """
+    results = {}
+    for size in sizes:
+        rng = random.Random(size)
+        lines = [Line(x, x + rng.uniform(0.5, 5)) for x in (rng.uniform(0, 10 * size) for _ in range(size))]
+        query_lines = [Line(x, x + 1) for x in (rng.uniform(0, 10 * size) for _ in range(queries))]
+
+        start = time.perf_counter()
+        index = LineIndex(lines)
+        results["build n={}".format(size)] = time.perf_counter() - start
+        start = time.perf_counter()
+        found = [index.find_overlapping(query) for query in query_lines]
+        results["index query n={}".format(size)] = (time.perf_counter() - start) / queries
+
+        scanned = query_lines[:max(1, queries * 1000 // size)]
+        start = time.perf_counter()
+        expected = [[line for line in lines if two_lines_overlap(line, query)] for query in scanned]
+        results["scan query n={}".format(size)] = (time.perf_counter() - start) / len(scanned)
+        assert [sorted(lines, key=id) for lines in found[:len(scanned)]] == \
+            [sorted(lines, key=id) for lines in expected]
+    return results
+
+
+def bench_streaming_overlaps(size: int = 2 * 10 ** 5, chunk_size: int = 2 * 10 ** 4) -> dict:
+    """
+    Times and measures the peak memory of checking a stream of lines that don't overlap, already sorted and unsorted,
+    against lines_overlap on the same lines, which holds them all in memory
+    :param size: Number of lines
+    :param chunk_size: Lines kept in memory while sorting the unsorted stream
+    :return: Seconds and peak bytes of each approach
+    """
+    import tracemalloc
+
+    starts = list(range(0, 2 * size, 2))
+    shuffled = starts[:]
+    random.Random(size).shuffle(shuffled)
+    results = {}
+    cases = {
+        "lines_overlap": lambda: lines_overlap(*(Line(x, x + 1) for x in shuffled)),
+        "first_overlap sorted": lambda: first_overlap((Line(x, x + 1) for x in starts), presorted=True),
+        "first_overlap unsorted": lambda: first_overlap((Line(x, x + 1) for x in shuffled), chunk_size=chunk_size),
+        "iter_overlaps unsorted": lambda: next(iter_overlaps((Line(x, x + 1) for x in shuffled),
+                                                             chunk_size=chunk_size), None),
+    }
+    for name, case in cases.items():
+        start = time.perf_counter()
+        assert not case()
+        results["{} n={}".format(name, size)] = time.perf_counter() - start
+        # tracing the allocations slows the code down, so the memory is measured on a separate run
+        tracemalloc.start()
+        case()
+        results["{} peak bytes n={}".format(name, size)] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return results
+
+
+def bench_two_lines_overlap(calls: int = 10 ** 6) -> dict:
+    """
+    Times two_lines_overlap on pairs of lines
+    :param calls: How many pairs to check
+    :return: Seconds per call
+    """
+    line1 = Line(0, 5)
+    line2 = Line(3, 8)
+    start = time.perf_counter()
+    for _ in range(calls):
+        two_lines_overlap(line1, line2)
+    return {"call": (time.perf_counter() - start) / calls}
+
+
+def random_versions(count: int, seed: int = 0) -> list:
+    """
+    Builds `count` version strings, between 1 and 4 parts each
+    """
+    rng = random.Random(seed)
+    return [".".join(str(rng.randint(0, 20)) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+def bench_version_strings(sizes=(10 ** 3, 10 ** 4, 10 ** 5)) -> dict:
+    """
+    Times compare_version_strings on pairs of versions, and sorting lists of versions with it, against the bulk
+    helpers, which parse every version once
+    :param sizes: Numbers of versions to try
+    :return: Seconds per comparison, and seconds to sort, find the highest and dedupe each list
+    """
+    results = {}
+    for size in sizes:
+        versions = random_versions(size)
+        others = random_versions(size, seed=1)
+        start = time.perf_counter()
+        for version1, version2 in zip(versions, others):
+            compare_version_strings(version1, version2)
+        results["compare n={}".format(size)] = (time.perf_counter() - start) / size
+        start = time.perf_counter()
+        sorted(versions, key=functools.cmp_to_key(compare_version_strings))
+        results["sort n={}".format(size)] = time.perf_counter() - start
+        for name, function in (("sort_versions", sort_versions), ("max_version", max_version),
+                               ("dedupe_versions", dedupe_versions)):
+            # unique strings, so the cache of parsed versions doesn't hide the parsing
+            unique = ["{}.{}".format(version, i) for i, version in enumerate(versions)]
+            start = time.perf_counter()
+            function(unique)
+            results["{} n={}".format(name, size)] = time.perf_counter() - start
+    return results
+
+
+def bench_version_columns(sizes=(10 ** 4, 10 ** 5, 10 ** 6)) -> dict:
+    """
+    Times comparing two columns of version strings pair by pair, with compare_version_columns, and with a loop calling
+    compare_version_strings
+    :param sizes: Numbers of pairs to try
+    :return: Seconds per pair for each approach, for each size
+    """
+    results = {}
+    for size in sizes:
+        versions = random_versions(size)
+        others = random_versions(size, seed=1)
+        start = time.perf_counter()
+        result = compare_version_columns(versions, others)
+        results["columns n={}".format(size)] = (time.perf_counter() - start) / size
+        start = time.perf_counter()
+        expected = [compare_version_strings(version1, version2) for version1, version2 in zip(versions, others)]
+        results["loop n={}".format(size)] = (time.perf_counter() - start) / size
+        assert result.tolist() == expected
+    return results
+
+
+def bench_version_index(sizes=(10 ** 4, 10 ** 5, 5 * 10 ** 5), queries: int = 100) -> dict:
+    """
+    Times a VersionIndex: building it, loading it saved, answering constraint queries, and inserting versions, against
+    answering the same queries with a loop calling compare_version_strings on every version for every constraint
+    :param sizes: Numbers of versions to try
+    :param queries: How many queries are averaged on the index
+    :return: Seconds to build and to load each index, and seconds per query and per insert
+    """
+    import os
+    import tempfile
+
+    results = {}
+    constraints = [(">=", "5.3"), ("<", "15"), ("!=", "7.4.1")]
+    query = ",".join(operator + version for operator, version in constraints)
+    checks = {">=": lambda result: result >= 0, "<": lambda result: result < 0, "!=": lambda result: result != 0}
+    for size in sizes:
+        # unique strings, so the cache of parsed versions doesn't hide the parsing
+        versions = ["{}.{}".format(version, i) for i, version in enumerate(random_versions(size))]
+        start = time.perf_counter()
+        index = VersionIndex(versions)
+        results["build n={}".format(size)] = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            index.save(path)
+            start = time.perf_counter()
+            VersionIndex.load(path)
+            results["load n={}".format(size)] = time.perf_counter() - start
+
+        results["match n={}".format(size)] = timed(lambda: index.match(query), queries)
+        results["newest n={}".format(size)] = timed(lambda: index.newest(query), queries)
+        start = time.perf_counter()
+        expected = [version for version in versions if all(checks[operator](compare_version_strings(version, bound))
+                                                           for operator, bound in constraints)]
+        results["loop n={}".format(size)] = time.perf_counter() - start
+        assert sorted(expected) == sorted(index.match(query))
+
+        extra = random_versions(queries, seed=1)
+        start = time.perf_counter()
+        for version in extra:
+            index.insert(version)
+        results["insert n={}".format(size)] = (time.perf_counter() - start) / queries
+    return results
+
+
+def bench_summarisers(paragraphs=(10, 100, 1000), depths=(1, 10, 50)) -> dict:
+    """
+    Times the summarisers over synthetic pages of increasing size and nesting depth. The SentenceSummariser is skipped
+    when the punkt models from nltk aren't available.
+    :param paragraphs: Numbers of paragraphs of the pages
+    :param depths: Nesting depths of the paragraphs
+    :return: Seconds to summarise each page
+    """
+    summarisers = {"cosine": CosineSummariser(), "sentence": SentenceSummariser()}
+    try:
+        summarisers["sentence"].warm_up()
+    except LookupError:
+        del summarisers["sentence"]
+
+    results = {}
+    for count in paragraphs:
+        for depth in depths:
+            soup = BeautifulSoup(synthetic_page(count, depth), "html.parser")
+            for name, summariser in summarisers.items():
+                start = time.perf_counter()
+                summariser.summarise(soup, "render page on a browser")
+                results["{} paragraphs={} depth={}".format(name, count, depth)] = time.perf_counter() - start
+    return results
+
+
+class StaticSearcher(Searcher):
+    """
+    Searcher that always returns the same URLs
+    """
+
+    def __init__(self, urls: list):
+        super().__init__(len(urls))
+        self.static_urls = urls
+
+    def fetch_urls(self, query: str, **kwargs) -> list:
+        return self.static_urls
+
+
+def bench_text_insight(latency: float = 0.05, pages: int = 5, workers=(1, 5), repeat: int = 5) -> dict:
+    """
+    Times TextInsight.get end to end, against a loopback server that waits `latency` seconds before every response
+    :param latency: Seconds the server waits before answering
+    :param pages: How many pages each query summarises
+    :param workers: Numbers of workers to try
+    :param repeat: How many queries are averaged
+    :return: Seconds per query for each number of workers
+    """
+    results = {}
+    with LoopbackServer(synthetic_page(100, depth=5).encode(), latency=latency) as server:
+        searcher = StaticSearcher([server.page_url(i) for i in range(pages)])
+        for count in workers:
+            text_insighter = TextInsight(searcher, SimpleWebScraper(), CosineSummariser(), workers=count)
+            text_insighter.get("warm up")
+            results["workers={}".format(count)] = timed(lambda: text_insighter.get("render page"), repeat)
+            text_insighter.scraper.close()
+    return results
+
+
+def bench_flaky_upstream(pages: int = 5, latency: float = 0.01, straggler: float = 0.5, probability: float = 0.05,
+                         repeat: int = 40, workers: int = 5) -> dict:
+    """
+    Times TextInsight.get against a loopback server where every request has a small chance of being a straggler, that
+    takes `straggler` seconds more to answer, without any limit, with a deadline, and with hedged requests
+    :param pages: How many pages each query summarises
+    :param latency: Seconds the server waits before answering
+    :param straggler: Seconds a straggler request waits on top of the latency
+    :param probability: Chance of each request of being a straggler
+    :param repeat: How many queries are made
+    :param workers: Number of workers
+    :return: Mean and 95th percentile seconds per query for each approach
+    """
+    results = {}
+    cases = {
+        "no limit": {},
+        "deadline": {"deadline": straggler / 2, "partial": True},
+        "hedged": {"hedge_after": 5 * latency, "partial": True},
+    }
+    with LoopbackServer(synthetic_page(100, depth=5).encode(), latency=latency) as server:
+        searcher = StaticSearcher([server.page_url(i) for i in range(pages)])
+        for name, kwargs in cases.items():
+            text_insighter = TextInsight(searcher, SimpleWebScraper(), CosineSummariser(), workers=workers, **kwargs)
+            stragglers = random.Random(0)
+
+            def getter(url, **get_kwargs):
+                if stragglers.random() < probability:
+                    time.sleep(straggler)
+                return text_insighter.scraper.session.get(url, **get_kwargs)
+
+            text_insighter.get("warm up")
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                text_insighter.get("render page", getter)
+                times.append(time.perf_counter() - start)
+            times.sort()
+            results[name + " mean"] = sum(times) / repeat
+            results[name + " p95"] = times[int(0.95 * (repeat - 1))]
+            text_insighter.scraper.close()
+    return results
+
+
+class OverlappingSearcher(Searcher):
+    """
+    Searcher whose results for different queries share most of their URLs, like related queries do
+    """
+
+    def __init__(self, urls: list, n_results: int = 5):
+        super().__init__(n_results)
+        self.all_urls = urls
+
+    def fetch_urls(self, query: str, **kwargs) -> list:
+        start = int(query.split()[-1]) % len(self.all_urls)
+        return [self.all_urls[(start + i) % len(self.all_urls)] for i in range(self.n_results)]
+
+
+def bench_get_many(queries: int = 50, pages: int = 10, latency: float = 0.01, workers: int = 5) -> dict:
+    """
+    Times a batch of related queries, whose results share their pages, with TextInsight.get_many and with a call to
+    TextInsight.get for each query
+    :param queries: Number of queries of the batch
+    :param pages: Number of distinct pages found by the whole batch, each query finds 5 of them
+    :param latency: Seconds the server waits before answering
+    :param workers: Number of workers downloading the pages
+    :return: Seconds per query of each approach
+    """
+    results = {}
+    batch = ["render page {}".format(i) for i in range(queries)]
+    with LoopbackServer(synthetic_page(100, depth=5).encode(), latency=latency) as server:
+        searcher = OverlappingSearcher([server.page_url(i) for i in range(pages)])
+        text_insighter = TextInsight(searcher, SimpleWebScraper(), CosineSummariser(), workers=workers)
+        text_insighter.get("warm up 0")
+        results["get"] = timed(lambda: [text_insighter.get(query) for query in batch], 1) / queries
+        results["get_many"] = timed(lambda: text_insighter.get_many(batch), 1) / queries
+        text_insighter.scraper.close()
+    return results
+
+
+def bench_corpus(pages: int = 5, repeat: int = 5) -> dict:
+    """
+    Times repeated queries on the same pages with TextInsight, without a corpus, with a corpus, where the pages are
+    downloaded but not parsed again, and offline, only from the corpus
+    :param pages: How many pages each query summarises
+    :param repeat: How many queries are averaged
+    :return: Seconds per query of each approach
+    """
+    results = {}
+    with LoopbackServer(synthetic_page(100, depth=5).encode()) as server:
+        searcher = StaticSearcher([server.page_url(i) for i in range(pages)])
+        for name, corpus in (("no corpus", None), ("corpus", PageCorpus())):
+            text_insighter = TextInsight(searcher, SimpleWebScraper(), CosineSummariser(), corpus=corpus)
+            text_insighter.get("warm up")
+            results[name] = timed(lambda: text_insighter.get("render page"), repeat)
+            if corpus is not None:
+                results["offline"] = timed(lambda: text_insighter.get("render page", offline=True), repeat)
+            text_insighter.scraper.close()
+    return results
+
+
+def bench_summary_memory(pages: int = 5, paragraphs: int = 1000, repeat: int = 5) -> dict:
+    """
+    Measures the memory of each request on big pages: the peak while the pages are parsed and summarised, the memory
+    still held by the results once the request is done, and their size pickled
+    :param pages: How many pages each query summarises
+    :param paragraphs: Paragraphs of each page
+    :param repeat: How many requests are averaged
+    :return: Bytes per request of each measure
+    """
+    import gc
+    import pickle
+    import tracemalloc
+
+    with LoopbackServer(synthetic_page(paragraphs, depth=5).encode()) as server:
+        searcher = StaticSearcher([server.page_url(i) for i in range(pages)])
+        text_insighter = TextInsight(searcher, SimpleWebScraper(), CosineSummariser())
+        text_insighter.get("warm up")
+        peak = retained = pickled = 0
+        for _ in range(repeat):
+            gc.collect()
+            tracemalloc.start()
+            insights = text_insighter.get("render page")
+            peak += tracemalloc.get_traced_memory()[1]
+            gc.collect()
+            retained += tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            pickled += len(pickle.dumps([summary.summary for summary in insights]))
+            del insights
+        text_insighter.scraper.close()
+    return {"peak bytes": peak / repeat, "retained bytes": retained / repeat, "pickled bytes": pickled / repeat}
+
+
+def benchmarks(full: bool = False) -> dict:
+    """
+    Returns every benchmark of the suite, by name
+    :param full: Whether to use the biggest sizes
+    """
+    line_sizes = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6) + ((10 ** 7,) if full else ())
+    version_sizes = (10 ** 3, 10 ** 4, 10 ** 5) + ((10 ** 6,) if full else ())
+    version_index_sizes = (10 ** 4, 10 ** 5, 5 * 10 ** 5) + ((5 * 10 ** 6,) if full else ())
+    return {
+        "lines_overlap": lambda: bench_lines_overlap(line_sizes),
+        "line_construction": lambda: bench_line_construction(line_sizes),
+        "line_set": lambda: bench_line_set(line_sizes),
+        "line_index": bench_line_index,
+        "streaming_overlaps": bench_streaming_overlaps,
+        "two_lines_overlap": bench_two_lines_overlap,
+        "version_strings": lambda: bench_version_strings(version_sizes),
+        "version_columns": bench_version_columns,
+        "version_index": lambda: bench_version_index(version_index_sizes),
+        "summarisers": bench_summarisers,
+        "cosine_summariser_reuse": bench_cosine_summariser_reuse,
+        "session_pooling": bench_session_pooling,
+        "text_insight": bench_text_insight,
+        "flaky_upstream": bench_flaky_upstream,
+        "get_many": bench_get_many,
+        "corpus": bench_corpus,
+        "summary_memory": bench_summary_memory,
+        "process_summariser": bench_process_summariser,
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names: list = None, full: bool = False) -> dict:
+    """
+    Runs the benchmarks, printing each result as it finishes
+    :param names: Names of the benchmarks to run, None runs all of them
+    :param full: Whether to use the biggest sizes
+    :return: Results, with the commit and machine they were measured on
+    """
+    suite = benchmarks(full)
+    results = {}
+    for name in names or suite:
+        results[name] = suite[name]()
+        for label, value in results[name].items():
+            print("{:<25} {:<35} {:.6g}".format(name, label, value))
+    return {
+        "meta": {"commit": current_commit(), "python": platform.python_version(), "machine": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "full": full},
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float = 1.1) -> list:
+    """
+    Compares the results of two runs, returning the ratio new / old for every result present on both
+    :param old: Results of the previous run
+    :param new: Results of the current run
+    :param threshold: Ratio above which a result is marked as a regression
+    :return: List of (benchmark, label, old value, new value, ratio, regressed)
+    """
+    comparison = []
+    for name, labels in new["results"].items():
+        for label, value in labels.items():
+            previous = old["results"].get(name, {}).get(label)
+            if previous:
+                ratio = value / previous
+                comparison.append((name, label, previous, value, ratio, ratio > threshold))
+    return comparison
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the benchmark suite")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all: " + ", ".join(benchmarks()))
+    parser.add_argument("--full", action="store_true", help="use the biggest sizes")
+    parser.add_argument("--output", help="file to store the results on, as JSON")
+    parser.add_argument("--compare", help="JSON file of a previous run to compare to")
+    parser.add_argument("--threshold", type=float, default=1.1, help="slowdown ratio reported as a regression")
+    arguments = parser.parse_args()
+    unknown = set(arguments.names) - set(benchmarks())
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+
+    run_results = run(arguments.names, arguments.full)
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump(run_results, output, indent=2)
+    if arguments.compare:
+        with open(arguments.compare) as previous_file:
+            previous_results = json.load(previous_file)
+        regressions = 0
+        for row in compare(previous_results, run_results, arguments.threshold):
+            regressions += row[5]
+            print("{:<25} {:<35} {:>12.6g} {:>12.6g} {:>7.2f}x{}".format(*row[:5], "  REGRESSION" if row[5] else ""))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,369 @@
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class Cache:
+    """
+    Base interface for a key value cache. Every entry can have its own time to live, and a size, which is used by the
+    caches that are bounded by size instead of by number of entries.
+
+    Subclasses implement `lookup` and `store`, while the base class takes care of the expiration dates, of counting
+    the hits and misses, that can be used to size the cache, and of collapsing concurrent computations of the same
+    missing key on `get_or_set`. Callers that look entries up themselves, with `lookup`, count them with
+    `count_lookup`, and stale entries that were confirmed to still be current with `count_revalidation`.
+    """
+
+    def __init__(self, ttl: float = None):
+        """
+        :param ttl: Default time to live of the entries, in seconds. None means the entries never expire
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self._stats_lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Fraction of the lookups that found a valid entry
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored for the key, or default if there is no valid entry for it
+        :param key: Key to look for
+        :param default: Value returned on a miss
+        :return: Stored value or default
+        """
+        entry = self.lookup(key)
+        self.count_lookup(entry is not None)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, ttl: float = None, size: int = 1):
+        """
+        Stores the value for the key
+        :param key: Key of the entry
+        :param value: Value to store
+        :param ttl: Time to live of this entry in seconds, defaults to the cache ttl
+        :param size: Size of the entry, used by caches bounded by size
+        """
+        ttl = self.ttl if ttl is None else ttl
+        self.store(key, value, None if ttl is None else time.time() + ttl, size)
+
+    def get_or_set(self, key, factory, ttl: float = None, size: int = 1):
+        """
+        Returns the value stored for the key, or calls factory to compute it and stores it. If other threads ask for the
+        same key while it is being computed, they wait for that computation instead of calling factory again.
+        :param key: Key to look for
+        :param factory: Function without arguments that computes the value on a miss
+        :param ttl: Time to live of the computed entry in seconds, defaults to the cache ttl
+        :param size: Size of the computed entry
+        :return: Stored or computed value
+        """
+        with self._in_flight_lock:
+            entry = self.lookup(key)
+            future = self._in_flight.get(key) if entry is None else None
+            computes = entry is None and future is None
+            if computes:
+                future = self._in_flight[key] = Future()
+
+        self.count_lookup(not computes)
+        if entry is not None:
+            return entry[0]
+        if not computes:
+            return future.result()
+
+        try:
+            value = factory()
+            self.set(key, value, ttl, size)
+            future.set_result(value)
+            return value
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+    def lookup(self, key):
+        """
+        Returns the (value, expires, size) entry for the key, or None if there is no valid entry
+        """
+        raise NotImplementedError
+
+    def store(self, key, value, expires: float, size: int):
+        """
+        Stores the entry for the key, expiring at the `expires` timestamp, or never if it is None
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def count_evictions(self, count: int):
+        with self._stats_lock:
+            self.evictions += count
+
+    def count_lookup(self, hit: bool):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def count_revalidation(self):
+        """
+        Counts a stale entry that didn't need to be computed again, apart from the hits and the misses
+        """
+        with self._stats_lock:
+            self.revalidations += 1
+
+
+class LRUCache(Cache):
+    """
+    In memory cache, that evicts the least recently used entries once it holds more than `max_entries` entries, or once
+    the sum of the entries sizes is higher than `max_size`.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_size: int = None, ttl: float = None):
+        """
+        :param max_entries: Maximum number of entries
+        :param max_size: Maximum sum of the entries sizes, None means it is only bounded by the number of entries
+        :param ttl: Default time to live of the entries, in seconds
+        """
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key, value, expires: float, size: int):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if self.max_size is not None and size > self.max_size:
+                return
+            self._entries[key] = (value, expires, size)
+            self.size += size
+
+            evicted = 0
+            while len(self._entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+                self._remove(next(iter(self._entries)))
+                evicted += 1
+        if evicted:
+            self.count_evictions(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[2]
+
+
+# access times a SqliteCache keeps in memory before writing them to the database in a single statement
+_ACCESS_BATCH = 100
+
+
+class SqliteCache(Cache):
+    """
+    On disk cache, backed by a sqlite database, so the entries survive between runs of the program. Values are stored
+    pickled, and keys by their repr. Like the LRUCache, it evicts the least recently used entries once it is over
+    `max_entries` or `max_size`.
+
+    Lookups don't write to the database: the access times of the entries found are kept in memory, and written
+    together once `_ACCESS_BATCH` of them are pending, before evicting, and on `close`. The number of entries and their
+    total size are also kept in memory, read from the database when it is opened, so a database should only be used by
+    one cache at a time.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, max_size: int = None, ttl: float = None):
+        """
+        :param path: Path to the sqlite database, it is created if it does not exist
+        :param max_entries: Maximum number of entries
+        :param max_size: Maximum sum of the entries sizes, None means it is only bounded by the number of entries
+        :param ttl: Default time to live of the entries, in seconds
+        """
+        super().__init__(ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._accessed = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, "
+                                     "expires REAL, size INTEGER, accessed REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self._count, self._size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def lookup(self, key):
+        key = repr(key)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires, size FROM entries WHERE key = ?",
+                                           (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                with self._connection:
+                    self._remove(key)
+                return None
+            self._accessed[key] = now
+            if len(self._accessed) >= _ACCESS_BATCH:
+                with self._connection:
+                    self._write_accesses()
+        return pickle.loads(row[0]), row[1], row[2]
+
+    def store(self, key, value, expires: float, size: int):
+        if self.max_size is not None and size > self.max_size:
+            self.delete(key)
+            return
+        key = repr(key)
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._connection:
+            self._remove(key)
+            self._connection.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                                     (key, value, expires, size, time.time()))
+            self._count += 1
+            self._size += size
+            evicted = self._evict()
+        if evicted:
+            self.count_evictions(evicted)
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            self._remove(repr(key))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+            self._accessed.clear()
+            self._count = self._size = 0
+
+    def close(self):
+        with self._lock, self._connection:
+            self._write_accesses()
+        self._connection.close()
+
+    def _remove(self, key: str):
+        """
+        Removes the entry stored with the key, if there is one
+        """
+        row = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._accessed.pop(key, None)
+            self._count -= 1
+            self._size -= row[0]
+
+    def _write_accesses(self):
+        """
+        Writes the access times kept in memory to the database
+        """
+        if self._accessed:
+            self._connection.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                         [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed.clear()
+
+    def _evict(self) -> int:
+        """
+        Removes the least recently used entries until the cache is within its bounds. Only the entries removed are
+        read, in the order of the index on the access time
+        :return: how many entries were removed
+        """
+        excess_count = self._count - self.max_entries
+        excess_size = 0 if self.max_size is None else self._size - self.max_size
+        if excess_count <= 0 and excess_size <= 0:
+            return 0
+
+        self._write_accesses()
+        keys = []
+        freed = 0
+        cursor = self._connection.execute("SELECT key, size FROM entries ORDER BY accessed")
+        for key, entry_size in cursor:
+            if len(keys) >= excess_count and freed >= excess_size:
+                break
+            keys.append((key,))
+            freed += entry_size
+        cursor.close()
+        self._connection.executemany("DELETE FROM entries WHERE key = ?", keys)
+        self._count -= len(keys)
+        self._size -= freed
+        return len(keys)
+
+
+class TieredCache(Cache):
+    """
+    Cache made of other caches, usually a small and fast one in memory in front of a bigger one on disk. Lookups go
+    through the tiers in order, and an entry found in a slower tier is copied to the faster ones. Entries are stored in
+    every tier.
+    """
+
+    def __init__(self, *tiers: Cache, ttl: float = None):
+        """
+        :param tiers: Caches to use, from the fastest to the slowest
+        :param ttl: Default time to live of the entries, in seconds
+        """
+        super().__init__(ttl)
+        self.tiers = tiers
+
+    def lookup(self, key):
+        for i, tier in enumerate(self.tiers):
+            entry = tier.lookup(key)
+            if entry is not None:
+                for faster_tier in self.tiers[:i]:
+                    faster_tier.store(key, *entry)
+                return entry
+        return None
+
+    def store(self, key, value, expires: float, size: int):
+        for tier in self.tiers:
+            tier.store(key, value, expires, size)
+
+    def delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
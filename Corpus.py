@@ -0,0 +1,144 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class CorpusBlock:
+    """
+    Block of text of a page stored on the corpus, with the count of each of its terms, as the summariser counts them
+    """
+
+    def __init__(self, url: str, position: int, tag: str, text: str, terms: Dict[str, int], path: str = None,
+                 extent: Tuple[int, int] = None):
+        """
+        :param url: URL of the page of the block
+        :param position: Position of the block on the page
+        :param tag: Name of the tag of the block
+        :param text: Text of the block
+        :param terms: Number of times each term appears on the block
+        :param path: Path of the tag of the block on the page
+        :param extent: Character offsets where the tag of the block starts and ends on the text of the page, including
+        the blocks nested in it
+        """
+        self.url = url
+        self.position = position
+        self.tag = tag
+        self.text = text
+        self.terms = terms
+        self.path = path
+        self.extent = extent
+
+
+class PageCorpus:
+    """
+    Local store of the pages already scraped, backed by a sqlite database, so a new query on pages fetched before can
+    be answered without downloading or parsing them again. Each page is stored by its URL and the hash of its content,
+    with its blocks of text, and an inverted index from each term to the blocks that contain it.
+
+    A page is only indexed again when its content changes, which replaces its blocks, so the index is kept up to date
+    one page at a time.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        """
+        :param path: Path to the sqlite database, it is created if it does not exist. Defaults to a database in memory
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, hash TEXT, indexed REAL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS blocks (id INTEGER PRIMARY KEY, url TEXT, "
+                                     "position INTEGER, tag TEXT, text TEXT, path TEXT, start INTEGER, end INTEGER)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS blocks_url ON blocks (url, position)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT, block INTEGER, count INTEGER)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS postings_term ON postings (term)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS postings_block ON postings (block)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def __contains__(self, url: str) -> bool:
+        return self.content_hash(url) is not None
+
+    def content_hash(self, url: str) -> Optional[str]:
+        """
+        Returns the hash of the content of the page when it was indexed, or None if the page is not on the corpus
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT hash FROM pages WHERE url = ?", (url,)).fetchone()
+        return None if row is None else row[0]
+
+    def add(self, url: str, content_hash: str, blocks: List[CorpusBlock]) -> bool:
+        """
+        Stores the blocks of the page, replacing the ones stored before, unless the page was already indexed with the
+        same content
+        :param url: URL of the page
+        :param content_hash: Hash of the content of the page
+        :param blocks: Blocks of text of the page, in the order they appear
+        :return: Whether the page was indexed, False if it was already on the corpus with the same content
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT hash FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is not None and row[0] == content_hash:
+                return False
+            self._delete(url)
+            self._connection.execute("INSERT INTO pages VALUES (?, ?, ?)", (url, content_hash, time.time()))
+            for position, block in enumerate(blocks):
+                block_id = self._connection.execute(
+                    "INSERT INTO blocks (url, position, tag, text, path, start, end) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, position, block.tag, block.text, block.path, *(block.extent or (None, None)))).lastrowid
+                self._connection.executemany("INSERT INTO postings VALUES (?, ?, ?)",
+                                             [(term, block_id, count) for term, count in block.terms.items()])
+        return True
+
+    def remove(self, url: str):
+        """
+        Removes the page and its blocks from the corpus
+        """
+        with self._lock, self._connection:
+            self._delete(url)
+
+    def blocks(self, url: str) -> List[CorpusBlock]:
+        """
+        Returns the blocks of the page, with their terms, in the order they appear on the page
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT id, position, tag, text, path, start, end FROM blocks "
+                                            "WHERE url = ? ORDER BY position", (url,)).fetchall()
+            postings = self._connection.execute("SELECT p.block, p.term, p.count FROM postings p JOIN blocks b "
+                                                "ON p.block = b.id WHERE b.url = ?", (url,)).fetchall()
+        terms = {row[0]: {} for row in rows}
+        for block_id, term, count in postings:
+            terms[block_id][term] = count
+        return [CorpusBlock(url, position, tag, text, terms[block_id], path, None if start is None else (start, end))
+                for block_id, position, tag, text, path, start, end in rows]
+
+    def search(self, terms: List[str], limit: int = None) -> List[str]:
+        """
+        Finds the pages that contain any of the terms, using the inverted index
+        :param terms: Terms to look for
+        :param limit: Maximum number of pages to return, None returns every page found
+        :return: URLs of the pages, first the ones with more of the distinct terms, then the ones where they appear more
+        """
+        terms = list(dict.fromkeys(terms))
+        if not terms:
+            return []
+        query = ("SELECT b.url FROM postings p JOIN blocks b ON p.block = b.id WHERE p.term IN ({}) GROUP BY b.url "
+                 "ORDER BY COUNT(DISTINCT p.term) DESC, SUM(p.count) DESC, b.url".format(", ".join("?" * len(terms))))
+        parameters = terms
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters = terms + [limit]
+        with self._lock:
+            return [row[0] for row in self._connection.execute(query, parameters).fetchall()]
+
+    def close(self):
+        self._connection.close()
+
+    def _delete(self, url: str):
+        self._connection.execute("DELETE FROM postings WHERE block IN (SELECT id FROM blocks WHERE url = ?)", (url,))
+        self._connection.execute("DELETE FROM blocks WHERE url = ?", (url,))
+        self._connection.execute("DELETE FROM pages WHERE url = ?", (url,))
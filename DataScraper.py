@@ -1,47 +1,386 @@
+import codecs
+import hashlib
+import inspect
+import multiprocessing
 import re
-from typing import List
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Iterator, List, Tuple
 
-import nltk
-import numpy as np
 import requests
-from bs4 import BeautifulSoup, Tag
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer, Tag
+from bs4.element import PreformattedString
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from Caches import Cache
+from Corpus import CorpusBlock, PageCorpus
+from Instrumentation import Metrics, NullTrace, Trace
 from Searchers import Searcher
 
-# This package is needed to use the tokenize functions from nltk
-nltk.download("punkt")
+# Tags whose text is never shown to the user
+NON_CONTENT_TAGS = frozenset(["script", "style", "noscript", "template"])
+
+
+def best_parser() -> str:
+    """
+    Returns the fastest parser available for BeautifulSoup, lxml if it is installed, or the built-in html.parser
+    """
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "html.parser"
+
+
+def drop_partial_character(content: bytes, encoding: str) -> bytes:
+    """
+    Drops the bytes at the end of the content that are only the start of a character in the encoding, as left when
+    the content is cut at an arbitrary byte. Otherwise the parser can't decode it with the encoding, and guesses
+    another one for the whole page. Content that isn't valid in the encoding is returned as it is
+    :param content: Content cut at an arbitrary byte
+    :param encoding: Encoding of the content
+    :return: Content ending at a whole character
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        decoder.decode(content, final=False)
+    except (LookupError, UnicodeDecodeError):
+        return content
+    pending = decoder.getstate()[0]
+    return content[:len(content) - len(pending)] if pending else content
+
+
+def accepts_timeout(get_soup) -> bool:
+    """
+    Returns whether a scraper `get_soup` can be given a timeout as its third argument. Scrapers written to the original
+    `get_soup(url, getter)` interface can't, and are called without one, and without a getter unless one is given
+    :param get_soup: Bound `get_soup` method of the scraper
+    :return: True when the method accepts a url, a getter and a timeout
+    """
+    try:
+        inspect.signature(get_soup).bind(None, None, None)
+    except TypeError:
+        return False
+    except ValueError:
+        # no signature available, such as on built-in functions, so assume the current interface
+        return True
+    return True
+
+
+@lru_cache(maxsize=None)
+def load_punkt(download: bool = False) -> bool:
+    """
+    Makes sure the punkt models, needed to use the tokenize functions from nltk, are available. The local nltk data path
+    is checked first, and they are only downloaded when asked to. Once they are found, the result is cached, so only the
+    first call pays for the check.
+    :param download: Whether to download the models when they are not found locally
+    :return: True when the models are available
+    """
+    import nltk
+
+    for resource in ("tokenizers/punkt_tab", "tokenizers/punkt"):
+        try:
+            nltk.data.find(resource)
+            return True
+        except LookupError:
+            pass
+
+    if not download:
+        raise LookupError("The punkt models from nltk were not found, download them with nltk.download('punkt') or "
+                          "create the summariser with download=True")
+    # newer versions of nltk use punkt_tab, older ones use punkt
+    for package in ("punkt_tab", "punkt"):
+        nltk.download(package, quiet=True)
+    return True
+
+
+@lru_cache(maxsize=None)
+def sentence_tokenizer(language: str = "english"):
+    """
+    Returns the punkt sentence tokenizer from nltk, the same one used by nltk.sent_tokenize, loading it only once
+    :param language: Language of the punkt model
+    :return: Punkt sentence tokenizer
+    """
+    try:
+        # nltk >= 3.8.2
+        from nltk.tokenize.punkt import PunktTokenizer
+        return PunktTokenizer(language)
+    except ImportError:
+        import nltk
+        return nltk.data.load("tokenizers/punkt/{}.pickle".format(language))
+
+
+class RawPage:
+    """
+    Object to hold the raw bytes downloaded from a URL, before they are parsed into a soup. The source says where they
+    came from: "network", "cache" for a fresh copy on the cache, or "revalidated" for a copy the server said was current
+    """
+
+    def __init__(self, url: str, content: bytes, encoding: str = None, etag: str = None, last_modified: str = None,
+                 source: str = "network"):
+        self.url = url
+        self.content = content
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.source = source
+
+    def copy(self, source: str) -> 'RawPage':
+        """
+        Returns a copy of the page, with another source, sharing the same content
+        """
+        return RawPage(self.url, self.content, self.encoding, self.etag, self.last_modified, source)
 
 
 class Scraper:
     """
-    A simple web-scraper interface
+    A simple web-scraper interface. A scraper downloads a page with `fetch` and turns it into a soup with `parse`,
+    `get_soup` does both.
+
+    Scrapers can also implement only `get_soup`, the original interface. TextInsight then uses it for every page, and
+    parses every page on its own process, since it has no raw page to send to other processes. A `get_soup` that only
+    takes a url and a getter is called without a timeout.
     """
 
-    def get_soup(self, url: str, getter=requests.get) -> BeautifulSoup:
+    def fetch(self, url: str, getter=None, timeout: float = None) -> RawPage:
         raise NotImplementedError
 
+    def parse(self, page: RawPage) -> BeautifulSoup:
+        raise NotImplementedError
+
+    def get_soup(self, url: str, getter=None, timeout: float = None) -> BeautifulSoup:
+        """
+        Returns a BeautifulSoup object to be used on the next steps
+        :param url: URL to extract the info from
+        :param getter: Which function to use for requesting, None uses the scraper default
+        :param timeout: Seconds to wait for the server before giving up, None waits forever
+        :return: Soup containing web info
+        """
+        return self.parse(self.fetch(url, getter, timeout))
+
 
 class SimpleWebScraper(Scraper):
     """
     A simple web-scraper that requests into a URL and returns a BS soup from the page
+
+    Unless another getter is given, requests are made with a session owned by the scraper, so connections are kept
+    alive and reused between pages and between calls, instead of paying a new TCP and TLS handshake for every page.
+    Compressed responses (gzip, deflate, and brotli when the `brotli` package is installed) are decoded by urllib3.
+
+    When a cache is given, downloaded pages are stored in it, keyed by URL. A page is fresh for the max-age sent by the
+    server on Cache-Control, or for `cache_ttl` seconds. Fresh pages are returned without any request, and stale pages
+    with an ETag or Last-Modified are revalidated with a conditional request, so an unchanged page costs a 304 response
+    instead of a full download.
+
+    Big pages can be bounded with `max_bytes`, in which case the response is read in chunks, and the download stops once
+    the budget is spent. To make the soup smaller, `only_tags` restricts the parsed tags to the given ones and their
+    contents, and `strip_tags` removes tags, such as NON_CONTENT_TAGS, right after parsing.
     """
 
-    def __init__(self, parser: str = "html.parser"):
-        self.parser = parser
+    def __init__(self, parser: str = "html.parser", pool_hosts: int = 10, pool_size: int = 10, retries: int = 3,
+                 backoff: float = 0.3, max_bytes: int = None, chunk_size: int = 64 * 1024, cache: Cache = None,
+                 cache_ttl: float = 300, only_tags=None, strip_tags=()):
+        """
+        :param parser: Which parser BeautifulSoup should use, None uses the fastest one installed
+        :param pool_hosts: How many hosts keep a connection pool in the session
+        :param pool_size: How many connections are kept alive for each host
+        :param retries: How many times a request is retried on connection errors and on 429/5xx responses
+        :param backoff: Backoff factor between retries, they wait backoff * 2 ^ (retry - 1) seconds
+        :param max_bytes: Maximum amount of bytes read from each response, anything after that is discarded. None
+        reads the whole response
+        :param chunk_size: Size of the chunks read from the response when max_bytes is set
+        :param cache: Cache for the downloaded pages, None disables caching
+        :param cache_ttl: Seconds a cached page is fresh for, when the server does not say it with max-age
+        :param only_tags: Names of the tags to keep when parsing, None keeps every tag
+        :param strip_tags: Names of the tags to remove from the soup, with everything inside them
+        """
+        self.parser = parser or best_parser()
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.only_tags = only_tags
+        self.strip_tags = strip_tags
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Session used when no getter is given, it is only created on first use
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self.create_session()
+        return self._session
 
-    def get_soup(self, url: str, getter=requests.get) -> BeautifulSoup:
+    def create_session(self) -> requests.Session:
         """
-        Returns a BeautifulSoup object to be used on the next steps
+        Creates a session with a connection pool for http and https and retries with exponential backoff on transient
+        errors. After the last retry, the error response is returned so it is raised by `fetch`.
+        :return: Session configured for this scraper
+        """
+        retry = Retry(total=self.retries, backoff_factor=self.backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.pool_hosts, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def __getstate__(self) -> dict:
+        """
+        Copies of the scraper sent to other processes only keep its settings, they create their own session, and don't
+        share the cache
+        """
+        state = self.__dict__.copy()
+        state.update(_session=None, _session_lock=None, cache=None)
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._session_lock = threading.Lock()
+
+    def close(self):
+        """
+        Closes every connection kept alive by the scraper session
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def fetch(self, url: str, getter=None, timeout: float = None) -> RawPage:
+        """
+        Downloads the content of the URL, or takes it from the cache if there is a fresh copy of it. Only fresh copies
+        count as cache hits, stale copies count as misses when the page is downloaded again, or as revalidations when
+        the server says they are still current
         :param url: URL to extract the info from
-        :param getter: Which function to use for requesting
-        :return: Soup containing web info
+        :param getter: Which function to use for requesting, defaults to the scraper session
+        :param timeout: Seconds to wait for the server before giving up, None waits forever
+        :return: Raw content of the page
         """
-        response = getter(url)
-        response.raise_for_status()
+        if self.cache is None:
+            return self.download(url, getter, timeout)[0]
 
-        return BeautifulSoup(response.text, self.parser)
+        cached = self.cache.lookup(url)
+        cached_page = None
+        if cached is not None:
+            fresh_until, cached_page = cached[0]
+            if fresh_until > time.time():
+                self.cache.count_lookup(True)
+                return cached_page.copy("cache")
+
+        page, max_age = self.download(url, getter, timeout, cached_page)
+        if page.source == "revalidated":
+            self.cache.count_revalidation()
+        else:
+            self.cache.count_lookup(False)
+        if max_age is not None:
+            self.store(page, max_age)
+        return page
+
+    def download(self, url: str, getter=None, timeout: float = None, cached_page: RawPage = None) -> tuple:
+        """
+        Requests the URL. If a cached page is given, the request is conditional on its validators, and the cached page
+        is returned when the server says it has not been modified.
+        :param url: URL to extract the info from
+        :param getter: Which function to use for requesting, defaults to the scraper session
+        :param timeout: Seconds to wait for the server before giving up, None waits forever
+        :param cached_page: Previously downloaded version of the page
+        :return: The page, and how many seconds it can be cached for, which is None if it should not be cached
+        """
+        getter = getter or self.session.get
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if self.max_bytes is not None:
+            kwargs["stream"] = True
+        if cached_page is not None:
+            headers = {}
+            if cached_page.etag:
+                headers["If-None-Match"] = cached_page.etag
+            if cached_page.last_modified:
+                headers["If-Modified-Since"] = cached_page.last_modified
+            if headers:
+                kwargs["headers"] = headers
+
+        response = getter(url, **kwargs)
+        try:
+            response.raise_for_status()
+            if response.status_code == 304 and cached_page is not None:
+                return cached_page.copy("revalidated"), self.max_age(response)
+            content = response.content if self.max_bytes is None else self.read_capped(response)
+        finally:
+            if self.max_bytes is not None:
+                response.close()
+
+        page = RawPage(url, content, response.encoding, response.headers.get("ETag"),
+                       response.headers.get("Last-Modified"))
+        return page, self.max_age(response)
+
+    def max_age(self, response: requests.Response) -> float:
+        """
+        Reads how long the response can be cached for from its Cache-Control header
+        :param response: Response received from the server
+        :return: Seconds the response is fresh for, or None if it should not be cached
+        """
+        cache_control = response.headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control:
+            return None
+        if "no-cache" in cache_control:
+            return 0
+        match = re.search(r"max-age\s*=\s*(\d+)", cache_control)
+        return int(match.group(1)) if match else self.cache_ttl
+
+    def store(self, page: RawPage, max_age: float):
+        """
+        Stores the page on the cache. Pages with validators are kept after they are stale, until they are evicted,
+        since they can still be revalidated. Pages without them are useless once stale, so they expire with it.
+        :param page: Page to store
+        :param max_age: Seconds the page is fresh for
+        """
+        ttl = None if page.etag or page.last_modified else max_age
+        if ttl is not None and ttl <= 0:
+            return
+        self.cache.set(page.url, (time.time() + max_age, page.copy("network")), ttl=ttl, size=len(page.content))
+
+    def read_capped(self, response: requests.Response) -> bytes:
+        """
+        Reads a streamed response in chunks, stopping once `max_bytes` have been read. A character cut in half by the
+        limit is dropped, see `drop_partial_character`
+        :param response: Response requested with stream=True
+        :return: At most `max_bytes` of the response body
+        """
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            chunks.append(chunk[:self.max_bytes - size])
+            size += len(chunk)
+            if size >= self.max_bytes:
+                return drop_partial_character(b"".join(chunks), response.encoding or "utf-8")
+        return b"".join(chunks)
+
+    def parse(self, page: RawPage) -> BeautifulSoup:
+        """
+        Returns a BeautifulSoup object to be used on the next steps
+        :param page: Raw page returned by `fetch`
+        :return: Soup containing web info
+        """
+        parse_only = SoupStrainer(list(self.only_tags)) if self.only_tags else None
+        soup = BeautifulSoup(page.content, self.parser, from_encoding=page.encoding, parse_only=parse_only)
+        if self.strip_tags:
+            for tag in soup.find_all(list(self.strip_tags)):
+                tag.decompose()
+        return soup
 
 
 class TextSummariser:
@@ -57,6 +396,178 @@ class TextSummariser:
     def summarise(self, soup: BeautifulSoup, query: str) -> str:
         raise NotImplementedError
 
+    def warm_up(self):
+        """
+        Loads the libraries and resources the summariser needs, so the first summary doesn't pay for them
+        """
+
+    @property
+    def scores_each_page_alone(self) -> bool:
+        """
+        Whether the summary of a page on `summarise_many` is the same as summarising it on its own. Only then can the
+        pages be summarised one by one on different processes
+        """
+        return True
+
+    def summarise_many(self, soups: List[BeautifulSoup], query: str) -> list:
+        """
+        Summarises every page found for a query. Summarisers that can share work between pages override this, the
+        default just summarises them one by one.
+        :param soups: BeautifulSoup objects received from the scraper
+        :param query: Original user query
+        :return: Summary for each soup, in the same order
+        """
+        return [self.summarise(soup, query) for soup in soups]
+
+    def summarise_queries(self, soups: List[List[BeautifulSoup]], queries: List[str]) -> List[list]:
+        """
+        Summarises the pages found for each of several queries. The same soup can be found by many queries, so
+        summarisers that can share work between queries override this, the default just summarises each query.
+        :param soups: BeautifulSoup objects found for each query
+        :param queries: Original user queries
+        :return: Summary for each soup of each query, in the same order
+        """
+        return [self.summarise_many(query_soups, query) for query_soups, query in zip(soups, queries)]
+
+    def corpus_blocks(self, soup: BeautifulSoup, url: str) -> List[CorpusBlock]:
+        """
+        Splits the page in the blocks of text that are stored on a PageCorpus, for summarisers that can summarise
+        pages from a corpus
+        """
+        raise NotImplementedError
+
+    def summarise_corpus(self, corpus: PageCorpus, urls: List[str], query: str) -> list:
+        """
+        Summarises pages already stored on the corpus, for summarisers that can summarise pages from a corpus
+        """
+        raise NotImplementedError
+
+    def corpus_terms(self, text: str) -> List[str]:
+        """
+        Splits the text in the terms of the inverted index of a PageCorpus, for summarisers that can summarise pages
+        from a corpus
+        """
+        raise NotImplementedError
+
+
+# Tags that start a new block of text, the text inside them belongs to them and not to their parents
+BLOCK_TAGS = frozenset([
+    "address", "article", "aside", "blockquote", "body", "caption", "dd", "details", "div", "dl", "dt", "figcaption",
+    "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "li", "main", "nav", "ol", "p", "pre",
+    "section", "summary", "table", "td", "th", "title", "tr", "ul",
+])
+
+
+class TextBlock:
+    """
+    Object to hold a block of text of the webpage, and the tag it came from. The extent is the (start, end) character
+    offsets of the tag on the text of the page, considering only the tags that have content. It covers the blocks
+    nested in the tag, whose text is not part of the text of the block, so the text is only the slice of the extent
+    for blocks without nested blocks.
+    """
+
+    def __init__(self, tag: Tag, text: str, extent: Tuple[int, int]):
+        self.tag = tag
+        self.text = text
+        self.extent = extent
+
+
+def extract_text_blocks(soup: BeautifulSoup, block_tags=BLOCK_TAGS) -> List[TextBlock]:
+    """
+    Splits the text of the page into blocks, walking the tree a single time. Every string belongs to the closest block
+    tag that contains it, so the text of nested tags is only extracted once, instead of once for every parent tag as
+    when calling get_text on each of them. Strings outside any block tag belong to the soup itself, and the text of
+    scripts, styles and comments is skipped.
+    :param soup: BeautifulSoup object received from the scraper
+    :param block_tags: Names of the tags that start a new block
+    :return: Blocks with text in them, ordered by where their own text starts on the page
+    """
+    blocks = {}
+    offset = 0
+    # the offset where each block tag starts is kept on its frame, to know its extent once all its children are read
+    stack = [(iter(soup.contents), soup, offset)]
+    while stack:
+        children, owner, start = stack[-1]
+        node = next(children, None)
+        if node is None:
+            stack.pop()
+            block = blocks.get(id(owner)) if start is not None else None
+            if block is not None:
+                block[2] = (start, offset)
+        elif isinstance(node, Tag):
+            if node.name in NON_CONTENT_TAGS:
+                continue
+            if node.name in block_tags:
+                stack.append((iter(node.contents), node, offset))
+            else:
+                stack.append((iter(node.contents), owner, None))
+        elif isinstance(node, NavigableString) and not isinstance(node, PreformattedString):
+            block = blocks.get(id(owner))
+            if block is None:
+                block = blocks[id(owner)] = [owner, [], None]
+            block[1].append(node)
+            offset += len(node)
+
+    text_blocks = [TextBlock(tag, "".join(strings), extent) for tag, strings, extent in blocks.values()]
+    return [block for block in text_blocks if not block.text.isspace()]
+
+
+def tag_path(tag: Tag) -> str:
+    """
+    Returns the path of the tag on its soup, like an XPath, e.g. /html/body/div[2]/p[1], where the number is the
+    position of the tag among its siblings with the same name. The path of the soup itself is /
+    :param tag: Tag to find
+    :return: Path of the tag
+    """
+    steps = []
+    while tag is not None and not isinstance(tag, BeautifulSoup):
+        position = 1 + sum(1 for sibling in tag.previous_siblings
+                           if isinstance(sibling, Tag) and sibling.name == tag.name)
+        steps.append("{}[{}]".format(tag.name, position))
+        tag = tag.parent
+    return "/" + "/".join(reversed(steps))
+
+
+class BlockSummary:
+    """
+    Summary of a page: the text of its block that is the most similar to the query, with its similarity, and where it
+    is on the page. It holds no reference to the soup, so the soup can be freed as soon as the page is summarised, and
+    the summary is cheap to pickle, to send it between processes or to cache it.
+    """
+
+    def __init__(self, text: str, score: float, tag: str, path: str, extent: Tuple[int, int]):
+        """
+        :param text: Text of the block
+        :param score: Similarity of the block to the query
+        :param tag: Name of the tag of the block
+        :param path: Path of the tag of the block on the page, see `tag_path`
+        :param extent: Character offsets where the tag of the block starts and ends on the text of the page, including
+        the blocks nested in it, see `TextBlock`
+        """
+        self.text = text
+        self.score = score
+        self.tag = tag
+        self.path = path
+        self.extent = extent
+
+    @classmethod
+    def from_text_block(cls, block: TextBlock, score: float) -> 'BlockSummary':
+        return cls(block.text, score, block.tag.name, tag_path(block.tag), block.extent)
+
+    def get_text(self) -> str:
+        """
+        Returns the text of the block, like the get_text of the tag it came from
+        """
+        return self.text
+
+    def __eq__(self, other: 'BlockSummary') -> bool:
+        if not isinstance(other, BlockSummary):
+            return NotImplemented
+        return vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        return "BlockSummary({!r}, score={:.3f}, path={!r})".format(self.text, self.score, self.path)
+
 
 class CosineTag:
     """
@@ -68,41 +579,224 @@ class CosineTag:
         self.preprocessed = preprocessed
 
 
+NON_LETTERS = re.compile('[^a-zA-Z]')
+WHITESPACE = re.compile(r'\s+')
+
+
 class CosineSummariser(TextSummariser):
     """
-    CosineSummariser, computes similarity of the documents (in this case, tags in the web page), representing them as
-    tfidf vectors.
+    CosineSummariser, computes similarity of the documents (in this case, blocks of text in the web page, as split by
+    `extract_text_blocks`), representing them as tfidf vectors.
+
+    The summariser keeps no state between calls, so a single instance can be reused for every page, and from several
+    threads at the same time.
     """
 
-    def __init__(self):
+    def __init__(self, use_idf: bool = False, block_tags=BLOCK_TAGS):
+        """
+        :param use_idf: Whether to weight the words by their inverse document frequency. On `summarise_many` the
+        frequencies are computed over the blocks of every page, so words common to the whole result set weigh less.
+        Without it, each page gets the same summary and score as summarising it on its own
+        :param block_tags: Names of the tags that start a new block of text
+        """
         super().__init__()
-        self.tags = []
+        self.use_idf = use_idf
+        self.block_tags = block_tags
+        self.warm_up()
+
+    def warm_up(self):
+        """
+        Imports scikit-learn, which is slow to import, so it is only imported once a CosineSummariser is created
+        """
+        import sklearn.feature_extraction.text  # noqa: F401
+        import sklearn.metrics.pairwise  # noqa: F401
 
-    def summarise(self, soup: BeautifulSoup, query: str) -> Tag:
+    @property
+    def scores_each_page_alone(self) -> bool:
         """
-        Consider the text inside each tag as the document. Preprocess the text, removing whitespace and non-letters
-        chars. Create a corpus of every tag, and calculate the tfidf vector. Use the created vector to calculate the
-        distance between the text inside the tag, and the original user query. The tag with the highest similarity is
-        returned as the text insight for the user query.
+        With `use_idf`, the frequencies of the words are computed over every page of `summarise_many`
+        """
+        return not self.use_idf
+
+    def summarise(self, soup: BeautifulSoup, query: str) -> BlockSummary:
+        """
+        Consider each block of text in the page as the document. Preprocess the text, removing whitespace and
+        non-letters chars. Create a corpus of every block, and calculate the tfidf vector. Use the created vector to
+        calculate the distance between the text of the block, and the original user query. The block with the highest
+        similarity is returned as the text insight for the user query, detached from the soup.
         :param soup: BeautifulSoup object received from the scraper
         :param query: Original user query
-        :return: Summary for the given soup
+        :return: Summary for the given soup, or None if the page has no words to score
         """
-        self.soup = soup
-        self.query = query
-        tag: Tag
-        for tag in self.soup():
-            self.tags.append(CosineTag(tag, self.preprocess(tag.get_text().lower())))
+        return self.summarise_many([soup], query)[0]
 
-        training_data = [tag.preprocessed for tag in self.tags]
-        vectorizer = TfidfVectorizer(use_idf=False)
-        tfidf = vectorizer.fit_transform(training_data)
-        tfidf_query = vectorizer.transform([self.preprocess(self.query)])
+    def summarise_many(self, soups: List[BeautifulSoup], query: str) -> List[BlockSummary]:
+        """
+        Summarises every page at once. The tags of all pages are vectorised together, sharing a single vocabulary, so
+        there's one vectorizer fit per query instead of one per page, and their similarity to the query is calculated on
+        a single sparse product. Then, the block with the highest similarity is picked on each page.
+        :param soups: BeautifulSoup objects received from the scraper
+        :param query: Original user query
+        :return: Summary for each soup, None for the pages without words to score
+        """
+        return self.summarise_queries([soups], [query])[0]
+
+    def summarise_queries(self, soups: List[List[BeautifulSoup]], queries: List[str]) -> List[List[BlockSummary]]:
+        """
+        Summarises the pages of several queries at once. The blocks of each distinct page are extracted and their words
+        counted only once, however many queries found it, on a vocabulary shared by every query. Then the counts of the
+        pages of each query are weighted and compared to it, like `summarise_many` does, so the summary of each query
+        is the same as summarising it on its own.
+        :param soups: BeautifulSoup objects found for each query, the same soup can be in many queries
+        :param queries: Original user queries
+        :return: Summary for each soup of each query, None for the pages without words to score
+        """
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        # rows of the counts matrix of the blocks of each distinct soup
+        documents = []
+        rows = {}
+        row = 0
+        for soup in (soup for query_soups in soups for soup in query_soups):
+            if id(soup) not in rows:
+                tags = [CosineTag(block, self.preprocess(block.text.lower()))
+                        for block in extract_text_blocks(soup, self.block_tags)]
+                documents.append(tags)
+                rows[id(soup)] = (row, row + len(tags), [tag.original for tag in tags])
+                row += len(tags)
+        training_data = [tag.preprocessed for tags in documents for tag in tags]
+        if not training_data:
+            return [[None] * len(query_soups) for query_soups in soups]
+
+        # counting and then weighting the words is the same TfidfVectorizer does
+        vectorizer = CountVectorizer()
+        try:
+            counts = vectorizer.fit_transform(training_data)
+        except ValueError:
+            # raised when there's not a single word in the pages
+            return [[None] * len(query_soups) for query_soups in soups]
+
+        summaries = []
+        for query_soups, query in zip(soups, queries):
+            best = self.best_blocks(counts, vectorizer.transform([self.preprocess(query)]),
+                                    [rows[id(soup)] for soup in query_soups])
+            summaries.append([None if block is None else BlockSummary.from_text_block(*block) for block in best])
+        return summaries
+
+    def best_blocks(self, counts, query_counts, pages: List[tuple]) -> list:
+        """
+        Picks the block of each page with the highest similarity to a query
+        :param counts: Sparse matrix with the count of each word on each block, of every page
+        :param query_counts: Sparse matrix with the count of each word on the query, on the same vocabulary
+        :param pages: (start, end, blocks) of each page, its blocks are the rows from start to end of the counts
+        :return: (block, similarity) of the block of each page with the highest similarity, None for the pages without
+        words to score
+        """
+        import numpy as np
+        from sklearn.feature_extraction.text import TfidfTransformer
+        from sklearn.metrics.pairwise import linear_kernel
+
+        # rows without any word in the vocabulary are empty
+        words_per_tag = np.diff(counts.indptr)
+        query_rows = np.concatenate([np.arange(start, end) for start, end, _ in pages] + [np.arange(0)])
+        if not words_per_tag[query_rows].any():
+            return [None] * len(pages)
+
+        # the weights of the words only depend on the pages of this query
+        transformer = TfidfTransformer(use_idf=self.use_idf)
+        tfidf = transformer.fit_transform(counts[query_rows])
+        tfidf_query = transformer.transform(query_counts)
 
         # this is faster than using cosine_similarity
         # Reference : https://scikit-learn.org/stable/modules/metrics.html#cosine-similarity
         cosine_similarity = linear_kernel(tfidf_query, tfidf).flatten()
-        return self.tags[np.argmax(cosine_similarity)].original
+
+        # blocks of each page are contiguous
+        summaries = []
+        offset = 0
+        for start, end, blocks in pages:
+            similarity = cosine_similarity[offset:offset + end - start]
+            offset += end - start
+            # the query is normalised only over the words of the page, as if the page was vectorised on its own, so
+            # words of the query that only appear on other pages don't lower its scores
+            on_page = np.isin(tfidf_query.indices, counts.indices[counts.indptr[start]:counts.indptr[end]])
+            query_norm = np.sqrt(np.sum(tfidf_query.data[on_page] ** 2))
+            if query_norm > 0:
+                similarity = similarity / query_norm
+            if words_per_tag[start:end].any():
+                best = np.argmax(similarity)
+                summaries.append((blocks[best], float(similarity[best])))
+            else:
+                summaries.append(None)
+        return summaries
+
+    def corpus_blocks(self, soup: BeautifulSoup, url: str) -> List[CorpusBlock]:
+        """
+        Splits the page in blocks of text, and counts their words the same way `summarise` does, to store them on a
+        PageCorpus
+        :param soup: BeautifulSoup object received from the scraper
+        :param url: URL of the page
+        :return: Blocks of the page, in the order they appear
+        """
+        return [CorpusBlock(url, position, block.tag.name, block.text, dict(Counter(self.corpus_terms(block.text))),
+                            tag_path(block.tag), block.extent)
+                for position, block in enumerate(extract_text_blocks(soup, self.block_tags))]
+
+    def corpus_terms(self, text: str) -> List[str]:
+        """
+        Splits the text in words, the same way the vectorizer of `summarise` does
+        :param text: Text to split
+        :return: Words of the text, repeated as many times as they appear
+        """
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        return CountVectorizer().build_analyzer()(self.preprocess(text.lower()))
+
+    def summarise_corpus(self, corpus: PageCorpus, urls: List[str], query: str) -> List[BlockSummary]:
+        """
+        Summarises pages already stored on the corpus, without downloading or parsing them. The words of the blocks
+        were counted when the pages were stored, so only their weights and their similarity to the query are
+        calculated, which gives the same summaries as summarising the pages.
+        :param corpus: Corpus with the pages
+        :param urls: URLs of the pages to summarise, they must be on the corpus
+        :param query: Original user query
+        :return: Summary for each page, None for the pages without words to score
+        """
+        from scipy.sparse import csr_matrix
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        pages = []
+        blocks_per_url = {}
+        start = 0
+        for url in urls:
+            if url not in blocks_per_url:
+                blocks_per_url[url] = corpus.blocks(url)
+            blocks = blocks_per_url[url]
+            pages.append((start, start + len(blocks), blocks))
+            start += len(blocks)
+
+        # same vocabulary, sorted, as fitting a CountVectorizer on the blocks
+        vocabulary = {term: column for column, term in enumerate(sorted(
+            {term for _, _, blocks in pages for block in blocks for term in block.terms}))}
+        if not vocabulary:
+            return [None] * len(urls)
+        data, indices, indptr = [], [], [0]
+        for _, _, blocks in pages:
+            for block in blocks:
+                columns = sorted((vocabulary[term], count) for term, count in block.terms.items())
+                indices.extend(column for column, _ in columns)
+                data.extend(count for _, count in columns)
+                indptr.append(len(indices))
+        counts = csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(vocabulary)), dtype="int64")
+        vectorizer = CountVectorizer(vocabulary=vocabulary)
+        summaries = []
+        for best in self.best_blocks(counts, vectorizer.transform([self.preprocess(query)]), pages):
+            if best is None:
+                summaries.append(None)
+            else:
+                block, score = best
+                summaries.append(BlockSummary(block.text, score, block.tag, block.path, block.extent))
+        return summaries
 
     def preprocess(self, text) -> str:
         """
@@ -110,8 +804,8 @@ class CosineSummariser(TextSummariser):
         :param text: Text to process
         :return: processed text
         """
-        formatted_text = re.sub('[^a-zA-Z]', ' ', text)
-        return re.sub(r'\s+', ' ', formatted_text)
+        formatted_text = NON_LETTERS.sub(' ', text)
+        return WHITESPACE.sub(' ', formatted_text)
 
 
 class SentenceSummariser(TextSummariser):
@@ -119,107 +813,718 @@ class SentenceSummariser(TextSummariser):
     * NOTE: This is a naive implementation of a sentence summariser, it should not be used, it is here only to the sole
     purpose of demonstrating how it is possible to extend the current API to use another summariser and give other
     results to the text insight.
+
+    The punkt models from nltk are only looked for on the first summary, and only downloaded if `download` is True. The
+    summariser keeps no state between calls, every call returns a new summary.
     """
 
-    def __init__(self, pre: int = 5, pos: int = 5):
+    def __init__(self, pre: int = 5, pos: int = 5, download: bool = False):
         super().__init__()
-        self.text = ""
-        self.summary = ""
         self.pre = pre
         self.pos = pos
+        self.download = download
+
+    def warm_up(self):
+        """
+        Imports nltk and loads its punkt models
+        """
+        load_punkt(self.download)
+        sentence_tokenizer()
 
     def summarise(self, soup: BeautifulSoup, query: str) -> str:
         """
-        The sentence summarizer works as follows: Tokenize each sequence in the text of the webpage, using sent_tokenize
-        from nltk. For each sentence, iterate through each word, and once we find a word that belonged to the user original
-        query, we append to the summary `pre` words, which defaults to 5, that came before the first word we found, and
-        append `pos` words after, which also defaults to five. If during the appending of the `pos` words we get to
-        encounter another word belonging to the original user query, we add + `pos` words, and double the value of words in
-        the `pos`. That is because, the more words we find belonging to the query, the more relevant the sentence is. So
-        this is a basic heuristic to return some summary.
+        The sentence summarizer works as follows: Tokenize each sequence in the text of the webpage, using the punkt
+        tokenizer from nltk. For each sentence, iterate through each word, and once we find a word that belonged to the
+        user original query, we append to the summary `pre` words, which defaults to 5, that came before the first word
+        we found, and append `pos` words after, which also defaults to five. If during the appending of the `pos` words
+        we get to encounter another word belonging to the original user query, we add + `pos` words, and double the
+        value of words in the `pos`. That is because, the more words we find belonging to the query, the more relevant
+        the sentence is. So this is a basic heuristic to return some summary.
+
+        The parts of the summary are gathered in a list and joined once at the end, so the time it takes grows linearly
+        with the size of the page.
         :param soup: BeautifulSoup object received from the scraper
         :param query: Original user query
         :return: Summary for the given soup
         """
-        self.text = soup.text.lower()
-        self.text = re.sub("[\t\n\r\f\v]+", '\n', self.text)
-        self.text = re.sub("[ ]{2,}", '\n', self.text)
-        self.text = re.sub("[.]{2,}", "", self.text)
-        self.query = query
-        self.soup = soup
-        query_tokens = self.get_as_tokens(self.query)
-        sentences = nltk.sent_tokenize(self.text)
-        for sentence in sentences:
+        self.warm_up()
+        import nltk
+
+        text = soup.text.lower()
+        text = re.sub("[\t\n\r\f\v]+", '\n', text)
+        text = re.sub("[ ]{2,}", '\n', text)
+        text = re.sub("[.]{2,}", "", text)
+        query_tokens = set(self.get_as_tokens(query))
+        summary = []
+        for sentence in self.iter_sentences(text):
             words = nltk.word_tokenize(sentence)
             pos = 0
             for i, word in enumerate(words):
                 if word in query_tokens:
                     if pos == 0:
-                        self.add_retroactively(self.pre, words, i)
+                        summary.append(self.get_retroactively(self.pre, words, i))
                         pos = self.pos
                     else:
                         pos += self.pos
                         pos *= 2
-                    self.summary += " " + word
+                    summary.append(" " + word)
                 elif pos > 0:
                     pos -= 1
-                    self.summary += " " + word
+                    summary.append(" " + word)
 
-        return self.summary
+        return "".join(summary)
 
-    def add_retroactively(self, count, tokens, i):
+    def iter_sentences(self, text: str):
         """
-        Add to the summary the last `count` words from the tokens
+        Splits the text into sentences, yielding them one at a time instead of building the list of every sentence
+        :param text: text to split
+        :return: Generator of the sentences of the text
+        """
+        for start, end in sentence_tokenizer().span_tokenize(text):
+            yield text[start:end]
+
+    def get_retroactively(self, count, tokens, i) -> str:
+        """
+        Returns the part of the summary with the last `count` words from the tokens
         :param count: how many words to add retroactively
         :param tokens: the list of tokens
         :param i: pointer to the actual token
+        :return: the words, preceded by a mark that the summary skipped part of the text
         """
-        self.summary += "\n[...]" + " ".join([tokens[i] for i in range(max(i - count, 0), i)])
+        return "\n[...]" + " ".join(tokens[max(i - count, 0):i])
 
     def get_as_tokens(self, text: str) -> List[str]:
         """
         Preprocess the text, and return it as a list of tokens
         :param text: text to process
-        :return: List containing each token
+        :return: List containing each token, without empty ones
         """
         alphanum_text = re.sub("[^0-9a-zA-Z]+", " ", text)
-        return alphanum_text.split(" ")
+        return [token for token in alphanum_text.split(" ") if token]
 
 
 class Summary:
     """
-    Base object to hold the result of a summary, which includes the summary of the webpage, and its url
+    Base object to hold the result of a summary, which includes the summary of the webpage, its url, and the position
+    of the url on the search results. The summary is what the summariser returned, such as a BlockSummary, which keeps
+    no reference to the soup of the page.
+
+    The status says how the page went: "ok", "error" if it failed, or "timeout" if it timed out or didn't finish before
+    the deadline of the request. When it is not "ok", the summary is None and the error describes what happened.
     """
 
-    def __init__(self, summary: str, url: str):
+    def __init__(self, summary, url: str, rank: int = None, status: str = "ok", error: str = None):
         self.summary = summary
         self.url = url
+        self.rank = rank
+        self.status = status
+        self.error = error
+
+
+# Scraper and summariser of a ProcessSummariser worker process, set once when the process starts
+_worker_state = {}
+
+
+def _init_summary_worker(scraper: Scraper, summariser: TextSummariser):
+    summariser.warm_up()
+    _worker_state["scraper"] = scraper
+    _worker_state["summariser"] = summariser
+
+
+def _summarise_in_worker(page: RawPage, query: str):
+    return _worker_state["summariser"].summarise(_worker_state["scraper"].parse(page), query)
+
+
+def _summarise_queries_in_worker(page: RawPage, queries: List[str]) -> list:
+    soup = _worker_state["scraper"].parse(page)
+    return [summary for summary, in _worker_state["summariser"].summarise_queries([[soup]] * len(queries), queries)]
+
+
+class ProcessSummariser:
+    """
+    Parses and summarises pages on a pool of processes, so the CPU bound work of parsing and scoring the pages is not
+    serialised by the GIL. The workers receive the raw bytes of each page, and send back its summary, which is detached
+    from the soup, so it's small to pickle.
+
+    Each worker receives a copy of the scraper, which is only used to parse, and of the summariser, once when it starts,
+    and warms the summariser up, so the libraries and resources it needs are loaded before the first page.
+
+    Workers are started from a fork server, or spawned where there is none, and never forked from this process, since
+    they are started on the first page, often from a thread of a TextInsight, and forking a process with threads can
+    deadlock the child.
+    """
+
+    def __init__(self, scraper: Scraper, summariser: TextSummariser, processes: int = None):
+        """
+        :param scraper: Scraper used to parse the pages
+        :param summariser: Summariser used on each page
+        :param processes: Number of worker processes, defaults to the number of cores
+        """
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(start_method),
+                                            initializer=_init_summary_worker, initargs=(scraper, summariser))
+
+    def summarise(self, page: RawPage, query: str):
+        """
+        Parses and summarises the page on one of the workers
+        :param page: Raw page returned by the scraper
+        :param query: Original user query
+        :return: Summary for the page
+        """
+        return self.executor.submit(_summarise_in_worker, page, query).result()
+
+    def summarise_many(self, pages: List[RawPage], query: str) -> list:
+        """
+        Parses and summarises every page, spreading them over the workers
+        :param pages: Raw pages returned by the scraper
+        :param query: Original user query
+        :return: Summary for each page, in the same order
+        """
+        futures = [self.executor.submit(_summarise_in_worker, page, query) for page in pages]
+        return [future.result() for future in futures]
+
+    def summarise_queries(self, page: RawPage, queries: List[str]) -> list:
+        """
+        Parses the page once on one of the workers, and summarises it for every query
+        :param page: Raw page returned by the scraper
+        :param queries: Original user queries that found the page
+        :return: Summary of the page for each query, in the same order
+        """
+        return self.executor.submit(_summarise_queries_in_worker, page, queries).result()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class Insights(list):
+    """
+    List of the Summary objects of a request, with the trace of the time and work each stage of the pipeline took
+    """
+
+    def __init__(self, summaries: List[Summary], trace: Trace):
+        super().__init__(summaries)
+        self.trace = trace
 
 
 class TextInsight:
     """
     Class that unites every part of the text insight API, it calls every needed method that are available on the
     searcher, scraper and summariser and returns a list with the Summary object for each page
+
+    When created with a PageCorpus, the blocks of every page downloaded are stored on it, and the pages are summarised
+    from the corpus, so pages whose content didn't change since they were stored are not parsed again, and queries can
+    be answered offline, only with the pages on the corpus.
+
+    When created with a Metrics object, every request is traced: the wall and CPU time of each stage (search, fetch,
+    parse and summarise), the bytes downloaded, the number of tags parsed, and the cache hits of the searcher and of the
+    scraper. The trace is attached to the result of each request, and aggregated on the Metrics. Without it, nothing is
+    measured.
+
+    Slow and failing pages can be bounded: `deadline` is the most a request waits, pages that didn't finish by then are
+    given up on, and `hedge_after` makes a second request for a page once the first one has taken that long, keeping
+    whichever finishes first. With `partial`, a page that fails or times out doesn't fail the request, it gets a Summary
+    with its status and error, and every other page is still summarised.
     """
 
-    def __init__(self, searcher: Searcher, scraper: Scraper, summariser: TextSummariser):
+    def __init__(self, searcher: Searcher, scraper: Scraper, summariser: TextSummariser, workers: int = 1,
+                 timeout: float = None, processes: int = 0, metrics: Metrics = None, corpus: PageCorpus = None,
+                 deadline: float = None, hedge_after: float = None, partial: bool = False):
+        """
+        :param searcher: Searcher used to find the URLs for the query
+        :param scraper: Scraper used to download each URL
+        :param summariser: Summariser used on each downloaded page
+        :param workers: How many pages can be downloaded at the same time, 1 downloads them one after the other
+        :param timeout: Seconds to wait for each URL before giving up, None waits forever, or up to the deadline if
+        there is one
+        :param processes: How many processes parse and summarise the pages, with a ProcessSummariser. 0 does it on
+        this process, as do scrapers that only implement `get_soup`, and summarisers whose scores depend on every page
+        of the request, see `summarises_in_processes`. When used, at least `processes` pages are downloaded at the same
+        time, so every process has work to do
+        :param metrics: Metrics that aggregate the trace of every request, None disables the instrumentation
+        :param corpus: Corpus where the pages are stored and summarised from, it needs a summariser that supports it,
+        such as the CosineSummariser. Pages are then always parsed on this process
+        :param deadline: Seconds a request can take, counting from the call, pages that didn't finish by then are
+        given up on. None waits for every page
+        :param hedge_after: Seconds after which a page that is still being downloaded is requested a second time, the
+        first of both to finish is used. None never hedges
+        :param partial: Whether pages that fail or time out are returned as a Summary with their status and error,
+        instead of raising their error
+        """
         self.searcher = searcher
         self.scraper = scraper
         self.summariser = summariser
+        self.workers = workers
+        self.timeout = timeout
+        self.processes = processes
+        self.metrics = metrics
+        self.corpus = corpus
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.partial = partial
+        self._process_summariser = None
+        self._process_lock = threading.Lock()
+        self._soup_timeout = accepts_timeout(scraper.get_soup)
 
-    def get(self, query: str, getter=requests.get) -> List[Summary]:
+    @property
+    def process_summariser(self) -> ProcessSummariser:
+        """
+        ProcessSummariser used when `processes` is set, its processes are only started on first use
+        """
+        if self._process_summariser is None:
+            with self._process_lock:
+                if self._process_summariser is None:
+                    self._process_summariser = ProcessSummariser(self.scraper, self.summariser, self.processes)
+        return self._process_summariser
+
+    def close(self):
+        """
+        Stops the worker processes, if they were started
+        """
+        if self._process_summariser is not None:
+            self._process_summariser.close()
+            self._process_summariser = None
+
+    def trace(self) -> Trace:
+        """
+        Creates the trace for a new request, which does nothing if there are no metrics
+        """
+        return NullTrace() if self.metrics is None else self.metrics.trace()
+
+    def get(self, query: str, getter=None, offline: bool = False) -> Insights:
         """
         Performs the text insight collection, given the set of searcher, scraper and summariser given. This is done so
         any of those are swappable to a new/different version of each.
-        :param getter: Getter function to request to webpage on scraper
+        :param getter: Getter function to request to webpage on scraper, defaults to the scraper own session
         :param query: Original user query
+        :param offline: Answer only with the pages on the corpus, without searching or downloading anything. The
+        pages are the ones on the corpus with more words of the query, up to the number of results of the searcher
         :return: List containing summarisation of the first n responses of a search in a web engine
         """
+        deadline = None if self.deadline is None else time.monotonic() + self.deadline
+        trace = self.trace()
         query = query.lower()
-        summary_list = []
-        self.searcher.search(query)
-        for url in self.searcher.urls:
-            soup = self.scraper.get_soup(url, getter)
-            summary = self.summariser.summarise(soup, query)
-            summary_list.append(Summary(summary, url))
-        return summary_list
+        if offline:
+            if self.corpus is None:
+                raise ValueError("Offline queries need a corpus")
+            with trace.span("search"):
+                urls = self.corpus.search(self.summariser.corpus_terms(query), self.searcher.n_results)
+        else:
+            urls = self.search(query, trace)
+
+        if self.corpus is not None:
+            if offline:
+                outcomes = [(None, "ok", None)] * len(urls)
+            else:
+                outcomes = self.map_outcomes(lambda url: self.index_url(url, getter, trace), urls, trace, deadline)
+            summaries = self.summarise_outcomes(
+                urls, outcomes, lambda ok_urls, _: self.summariser.summarise_corpus(self.corpus, ok_urls, query), trace)
+        elif self.summarises_in_processes:
+            outcomes = self.map_outcomes(lambda url: self.summarise_url(url, query, getter, trace), urls, trace,
+                                         deadline)
+            summaries = [summary for summary, _, _ in outcomes]
+        else:
+            outcomes = self.map_outcomes(lambda url: self.load_page(url, getter, trace), urls, trace, deadline)
+            summaries = self.summarise_outcomes(
+                urls, outcomes, lambda _, soups: self.summariser.summarise_many(soups, query), trace)
+        return self.insights(urls, summaries, outcomes, trace)
+
+    def get_many(self, queries: List[str], getter=None) -> List[Insights]:
+        """
+        Performs the text insight collection of several queries at once. Each query is searched, and then every distinct
+        URL found is downloaded and parsed only once, however many queries found it, and summarised for each of those
+        queries, with `summarise_queries` of the summariser.
+
+        The result of each query is the same as calling `get` with it. The stages of the whole batch are recorded on a
+        single trace, shared by the results of every query, and the deadline is for the whole batch.
+        :param queries: Original user queries
+        :param getter: Getter function to request to webpage on scraper, defaults to the scraper own session
+        :return: List containing the summaries of each query, in the same order
+        """
+        deadline = None if self.deadline is None else time.monotonic() + self.deadline
+        trace = self.trace()
+        queries = [query.lower() for query in queries]
+        urls = []
+        for query in queries:
+            urls.append(self.search(query, trace))
+        unique_urls = list(dict.fromkeys(url for query_urls in urls for url in query_urls))
+
+        if self.corpus is not None:
+            outcomes = dict(zip(unique_urls, self.map_outcomes(lambda url: self.index_url(url, getter, trace),
+                                                               unique_urls, trace, deadline)))
+            summaries = [self.summarise_outcomes(
+                query_urls, [outcomes[url] for url in query_urls],
+                lambda ok_urls, _: self.summariser.summarise_corpus(self.corpus, ok_urls, query), trace)
+                for query, query_urls in zip(queries, urls)]
+        elif self.summarises_in_processes:
+            queries_per_url = {url: [] for url in unique_urls}
+            for query, query_urls in zip(queries, urls):
+                for url in dict.fromkeys(query_urls):
+                    queries_per_url[url].append(query)
+
+            def summarise_url(url: str) -> dict:
+                page = self.fetch_page(url, getter, trace)
+                with trace.span("summarise", url):
+                    summaries = self.process_summariser.summarise_queries(page, queries_per_url[url])
+                return dict(zip(queries_per_url[url], summaries))
+
+            outcomes = dict(zip(unique_urls, self.map_outcomes(summarise_url, unique_urls, trace, deadline)))
+            summaries = [[outcomes[url][0] and outcomes[url][0][query] for url in query_urls]
+                         for query, query_urls in zip(queries, urls)]
+        else:
+            outcomes = dict(zip(unique_urls, self.map_outcomes(lambda url: self.load_page(url, getter, trace),
+                                                               unique_urls, trace, deadline)))
+            with trace.span("summarise"):
+                ok_summaries = self.summariser.summarise_queries(
+                    [[outcomes[url][0] for url in query_urls if outcomes[url][1] == "ok"] for query_urls in urls],
+                    queries)
+            summaries = []
+            for query_urls, query_summaries in zip(urls, ok_summaries):
+                query_summaries = iter(query_summaries)
+                summaries.append([next(query_summaries) if outcomes[url][1] == "ok" else None for url in query_urls])
+        return [self.insights(query_urls, query_summaries, [outcomes[url] for url in query_urls], trace)
+                for query_urls, query_summaries in zip(urls, summaries)]
+
+    def iter_get(self, query: str, getter=None, first: int = None, time_budget: float = None,
+                 trace: Trace = None) -> Iterator[Summary]:
+        """
+        Performs the text insight collection like `get`, but yields each Summary as soon as its page is downloaded and
+        summarised, so the first results can be shown before the slowest page finishes. Summaries come in the order
+        they finish, their rank on the search results is kept on `Summary.rank`.
+
+        Once it stops, either because enough summaries were found, the time budget or the deadline is over, or the
+        caller stopped iterating, the downloads that haven't started yet are cancelled. Slow pages are hedged like on
+        `get`. With `partial`, pages that fail are yielded with their status and error, instead of raising it, and once
+        the time is over, the pages that didn't finish are yielded as timed out.
+        :param query: Original user query
+        :param getter: Getter function to request to webpage on scraper, defaults to the scraper own session
+        :param first: Stop after this many pages with a summary, None waits for every page
+        :param time_budget: Stop after this many seconds, counting from the call, None waits for every page, or up to
+        the deadline if there is one
+        :param trace: Trace to record the request on, defaults to a new one
+        :return: Generator of the summaries
+        """
+        budgets = [budget for budget in (time_budget, self.deadline) if budget is not None]
+        deadline = time.monotonic() + min(budgets) if budgets else None
+        trace = trace or self.trace()
+        query = query.lower()
+        urls = self.search(query, trace)
+
+        finished = set()
+        found = 0
+        for rank, (result, status, error) in self.iter_attempts(
+                lambda url: self.summarise_url(url, query, getter, trace), urls, trace, deadline):
+            if error is not None and not self.partial:
+                raise error
+            finished.add(rank)
+            yield Summary(result, urls[rank], rank, status, self.describe_error(error))
+            if result is not None:
+                found += 1
+                if first is not None and found >= first:
+                    return
+
+        if self.partial:
+            for rank, url in enumerate(urls):
+                if rank not in finished:
+                    _, status, error = self.deadline_outcome(url, trace)
+                    yield Summary(None, url, rank, status, self.describe_error(error))
+
+    def search(self, query: str, trace: Trace) -> List[str]:
+        """
+        Searches the query with the searcher, tracing it. The URLs are the ones returned by the search, so requests
+        sharing the searcher don't see the URLs of each other, except for searchers written to the original interface,
+        whose search returns anything other than a (urls, cache_hit) tuple, and only keeps the URLs on `urls`
+        :return: URLs found for the query
+        """
+        with trace.span("search"):
+            result = self.searcher.search(query)
+        if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], bool):
+            urls, cache_hit = result
+        else:
+            urls, cache_hit = self.searcher.urls, getattr(self.searcher, "cache_hit", False)
+        if trace.enabled and getattr(self.searcher, "cache", None) is not None:
+            trace.count("search.cache_hits" if cache_hit else "search.cache_misses")
+        return list(urls)
+
+    def summarise_url(self, url: str, query: str, getter=None, trace: Trace = None):
+        """
+        Downloads a single URL, and summarises it
+        :param url: URL to summarise
+        :param query: Original user query
+        :param getter: Getter function to request to webpage on scraper, defaults to the scraper own session
+        :param trace: Trace to record the stages on
+        :return: Summary for the page
+        """
+        trace = trace or NullTrace()
+        if self.corpus is not None:
+            self.index_url(url, getter, trace)
+            with trace.span("summarise", url):
+                return self.summariser.summarise_corpus(self.corpus, [url], query)[0]
+
+        if self.processes and self.fetches_pages:
+            page = self.fetch_page(url, getter, trace)
+            # parsing happens on the worker, so this span covers both parse and summarise
+            with trace.span("summarise", url):
+                return self.process_summariser.summarise(page, query)
+
+        soup = self.load_page(url, getter, trace)
+        with trace.span("summarise", url):
+            return self.summariser.summarise(soup, query)
+
+    def index_url(self, url: str, getter=None, trace: Trace = None):
+        """
+        Downloads a single URL, and stores its blocks on the corpus, unless its content didn't change since it was
+        stored, in which case it isn't parsed. Scrapers that only implement `get_soup` always parse the page, and its
+        content is hashed from the soup.
+        :param url: URL to index
+        :param getter: Getter function to request to webpage on scraper, defaults to the scraper own session
+        :param trace: Trace to record the stages on
+        """
+        trace = trace or NullTrace()
+        if self.fetches_pages:
+            page = self.fetch_page(url, getter, trace)
+            content_hash = hashlib.sha256(page.content).hexdigest()
+            if self.corpus.content_hash(url) == content_hash:
+                trace.count("corpus.hits")
+                return
+            soup = self.parse_page(page, trace)
+        else:
+            soup = self.load_page(url, getter, trace)
+            content_hash = hashlib.sha256(str(soup).encode()).hexdigest()
+            if self.corpus.content_hash(url) == content_hash:
+                trace.count("corpus.hits")
+                return
+        with trace.span("index", url):
+            self.corpus.add(url, content_hash, self.summariser.corpus_blocks(soup, url))
+        trace.count("corpus.indexed")
+
+    @property
+    def fetches_pages(self) -> bool:
+        """
+        Whether the scraper implements `fetch` and `parse`. Scrapers that only implement `get_soup`, the original
+        interface, are used through it, so their pages are always parsed on this process, and the download and parse
+        are traced as a single fetch stage.
+        """
+        scraper_type = type(self.scraper)
+        return scraper_type.fetch is not Scraper.fetch and scraper_type.parse is not Scraper.parse
+
+    @property
+    def summarises_in_processes(self) -> bool:
+        """
+        Whether `get` and `get_many` summarise each page on the ProcessSummariser, which needs `processes`, a scraper
+        that implements `fetch` and `parse`, and a summariser that scores each page alone. Summarisers whose scores
+        depend on every page of the request, such as a CosineSummariser with `use_idf`, summarise them all together on
+        this process instead, so they get the same scores with and without processes.
+        """
+        return bool(self.processes) and self.fetches_pages and self.summariser.scores_each_page_alone
+
+    @property
+    def page_timeout(self) -> float:
+        """
+        Seconds each page can take to download. Without a timeout of its own, a page waits at most for the deadline,
+        so threads given up on don't hang forever
+        """
+        return self.deadline if self.timeout is None else self.timeout
+
+    def load_page(self, url: str, getter, trace: Trace) -> BeautifulSoup:
+        """
+        Downloads and parses a single URL with the scraper, with `get_soup` if it doesn't implement `fetch` and `parse`
+        """
+        if self.fetches_pages:
+            return self.parse_page(self.fetch_page(url, getter, trace), trace)
+        with trace.span("fetch", url):
+            if self._soup_timeout:
+                return self.scraper.get_soup(url, getter, self.page_timeout)
+            # scrapers of the original interface have their own default getter, which None would replace
+            if getter is None:
+                return self.scraper.get_soup(url)
+            return self.scraper.get_soup(url, getter)
+
+    def fetch_page(self, url: str, getter, trace: Trace) -> RawPage:
+        """
+        Downloads a single URL with the scraper, tracing the time, the bytes downloaded, and whether it was cached
+        """
+        with trace.span("fetch", url):
+            page = self.scraper.fetch(url, getter, self.page_timeout)
+        if trace.enabled:
+            trace.count("fetch.bytes", len(page.content))
+            trace.count("fetch." + page.source)
+        return page
+
+    def parse_page(self, page: RawPage, trace: Trace) -> BeautifulSoup:
+        """
+        Parses a single page with the scraper, tracing the time and the number of tags on the soup
+        """
+        with trace.span("parse", page.url):
+            soup = self.scraper.parse(page)
+        if trace.enabled:
+            trace.count("parse.tags", len(soup.find_all()))
+        return soup
+
+    def map(self, function, urls: List[str]) -> list:
+        """
+        Calls the function for every URL, on a thread pool when more than one worker is configured
+        :param function: Function receiving a single URL
+        :param urls: URLs to call the function with
+        :return: List containing the result for each URL, in the same order
+        """
+        workers = max(self.workers, self.processes)
+        if workers <= 1 or len(urls) <= 1:
+            return [function(url) for url in urls]
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+            return list(executor.map(function, urls))
+
+    def map_outcomes(self, function, urls: List[str], trace: Trace, deadline: float = None) -> List[tuple]:
+        """
+        Calls the function for every URL like `map`, but returns the outcome of each call as a tuple (result, status,
+        error), where the status is "ok", "error" or "timeout". Unless the request is partial, the error of the first
+        URL that failed is raised instead.
+        :param function: Function receiving a single URL
+        :param urls: URLs to call the function with
+        :param trace: Trace to count the errors, timeouts and hedged requests on
+        :param deadline: time.monotonic() value after which the URLs not finished are given up on
+        :return: List containing the outcome for each URL, in the same order
+        """
+        if deadline is None and self.hedge_after is None and not self.partial:
+            return [(result, "ok", None) for result in self.map(function, urls)]
+
+        outcomes = self.attempt(function, urls, trace, deadline)
+        if not self.partial:
+            for _, status, error in outcomes:
+                if status != "ok":
+                    raise error
+        return outcomes
+
+    def attempt(self, function, urls: List[str], trace: Trace, deadline: float = None) -> List[tuple]:
+        """
+        Calls the function for every URL with `iter_attempts`, and waits for all of them
+        :param function: Function receiving a single URL
+        :param urls: URLs to call the function with
+        :param trace: Trace to count the errors, timeouts and hedged requests on
+        :param deadline: time.monotonic() value after which the URLs not finished are given up on
+        :return: List containing the (result, status, error) outcome for each URL, in the same order, the URLs that
+        didn't finish before the deadline time out
+        """
+        outcomes = [None] * len(urls)
+        for i, outcome in self.iter_attempts(function, urls, trace, deadline):
+            outcomes[i] = outcome
+        return [self.deadline_outcome(url, trace) if outcome is None else outcome
+                for url, outcome in zip(urls, outcomes)]
+
+    def iter_attempts(self, function, urls: List[str], trace: Trace, deadline: float = None) -> Iterator[tuple]:
+        """
+        Calls the function for every URL on a thread pool, up to the deadline, making a second call for the URLs still
+        running after `hedge_after` seconds on a pool of its own. The first call of a URL that succeeds is used, and a
+        URL only fails once all of its calls failed. Calls still running at the deadline, or when the caller stops
+        iterating, are abandoned, not stopped, they end with the timeout of the scraper.
+        :param function: Function receiving a single URL
+        :param urls: URLs to call the function with
+        :param trace: Trace to count the errors, timeouts and hedged requests on
+        :param deadline: time.monotonic() value after which the URLs not finished are given up on
+        :return: Generator of (position of the URL, (result, status, error) outcome), in the order they finish. It
+        stops at the deadline, without the URLs that didn't finish
+        """
+        outcomes = [None] * len(urls)
+        if not urls:
+            return
+
+        workers = max(1, min(max(self.workers, self.processes), len(urls)))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        hedge_executor = ThreadPoolExecutor(max_workers=workers) if self.hedge_after is not None else None
+        started = {}
+        started_lock = threading.Lock()
+
+        def run(i: int):
+            with started_lock:
+                started[i] = time.monotonic()
+            return function(urls[i])
+
+        calls = {executor.submit(run, i): i for i in range(len(urls))}
+        hedged = set()
+        remaining = len(urls)
+        try:
+            while remaining:
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    break
+                timeout = None if deadline is None else deadline - now
+                if hedge_executor is not None:
+                    with started_lock:
+                        running = [(start + self.hedge_after, i) for i, start in started.items()
+                                   if i not in hedged and outcomes[i] is None]
+                    for hedge_at, i in running:
+                        if hedge_at <= now:
+                            hedged.add(i)
+                            calls[hedge_executor.submit(function, urls[i])] = i
+                            trace.count("fetch.hedged")
+                    # pages that haven't started yet are only seen on the next wake up
+                    next_hedge = min([hedge_at for hedge_at, _ in running if hedge_at > now] or
+                                     [now + self.hedge_after])
+                    timeout = next_hedge - now if timeout is None else min(timeout, next_hedge - now)
+
+                for call in wait(calls, timeout=timeout, return_when=FIRST_COMPLETED)[0]:
+                    i = calls.pop(call)
+                    if outcomes[i] is not None:
+                        continue
+                    error = call.exception()
+                    if error is None:
+                        outcomes[i] = (call.result(), "ok", None)
+                    elif i in calls.values():
+                        # the other call of the URL may still succeed
+                        continue
+                    else:
+                        outcomes[i] = (None, self.error_status(error), error)
+                        trace.count("fetch.errors" if outcomes[i][1] == "error" else "fetch.timeouts")
+                    remaining -= 1
+                    yield i, outcomes[i]
+        finally:
+            for call in calls:
+                call.cancel()
+            executor.shutdown(wait=False)
+            if hedge_executor is not None:
+                hedge_executor.shutdown(wait=False)
+
+    @staticmethod
+    def deadline_outcome(url: str, trace: Trace) -> tuple:
+        """
+        Returns the outcome of a URL that didn't finish before the deadline
+        """
+        trace.count("fetch.timeouts")
+        return None, "timeout", TimeoutError("{} didn't finish before the deadline".format(url))
+
+    def summarise_outcomes(self, urls: List[str], outcomes: List[tuple], summarise, trace: Trace) -> list:
+        """
+        Summarises the URLs that succeeded all at once
+        :param urls: URLs of the outcomes
+        :param outcomes: Outcome of each URL, as returned by `map_outcomes`
+        :param summarise: Function receiving the URLs that succeeded and their results, returning their summaries
+        :param trace: Trace to record the stage on
+        :return: List containing the summary of each URL, None for the ones that didn't succeed
+        """
+        ok_urls = [url for url, (_, status, _) in zip(urls, outcomes) if status == "ok"]
+        with trace.span("summarise"):
+            summaries = summarise(ok_urls, [result for result, status, _ in outcomes if status == "ok"])
+        summaries = iter(summaries)
+        return [next(summaries) if status == "ok" else None for _, status, _ in outcomes]
+
+    def insights(self, urls: List[str], summaries: list, outcomes: List[tuple], trace: Trace) -> Insights:
+        """
+        Builds the result of a request, with a Summary for each URL, in search rank order
+        """
+        return Insights([Summary(summary, url, rank, status, self.describe_error(error))
+                         for rank, (url, summary, (_, status, error)) in enumerate(zip(urls, summaries, outcomes))],
+                        trace)
+
+    @staticmethod
+    def error_status(error: BaseException) -> str:
+        """
+        Returns the status of a page that failed with the error, "timeout" or "error"
+        """
+        return "timeout" if isinstance(error, (requests.Timeout, TimeoutError)) else "error"
+
+    @staticmethod
+    def describe_error(error: BaseException) -> str:
+        """
+        Returns a short description of the error, kept on the Summary so it can be pickled and logged
+        """
+        return None if error is None else "{}: {}".format(type(error).__name__, error)
@@ -0,0 +1,210 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List
+
+# Upper bounds, in seconds, of the buckets of the timing histograms
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Span:
+    """
+    Object to hold how long a stage of the pipeline took, on the wall clock and on the CPU of the thread that ran it
+    """
+
+    def __init__(self, stage: str, url: str, wall: float, cpu: float):
+        self.stage = stage
+        self.url = url
+        self.wall = wall
+        self.cpu = cpu
+
+    def as_dict(self) -> dict:
+        return {"stage": self.stage, "url": self.url, "wall": self.wall, "cpu": self.cpu}
+
+
+class Histogram:
+    """
+    Cumulative histogram of the observed values, in the same shape Prometheus uses, so it can be scraped
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self) -> dict:
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"buckets": cumulative, "count": self.count, "sum": self.sum}
+
+
+class Metrics:
+    """
+    Aggregates the traces of every request into histograms of the time of each stage, and counters, such as bytes
+    downloaded or cache hits. Every observation is also sent to the hooks, which are functions receiving the name of the
+    metric, its value and a dict of labels, so they can be forwarded to another metrics system.
+    """
+
+    def __init__(self, hooks: List[Callable] = (), buckets=DEFAULT_BUCKETS):
+        """
+        :param hooks: Functions called as hook(name, value, labels) for every observation
+        :param buckets: Upper bounds of the buckets of the histograms
+        """
+        self.hooks = list(hooks)
+        self.buckets = buckets
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def trace(self) -> 'Trace':
+        """
+        Creates the trace of a new request, reporting to these metrics
+        """
+        return Trace(self)
+
+    def observe(self, name: str, value: float, labels: dict = None):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(value)
+        for hook in self.hooks:
+            hook(name, value, labels or {})
+
+    def increment(self, name: str, value: float = 1, labels: dict = None):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook(name, value, labels or {})
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current value of every histogram and counter
+        """
+        with self._lock:
+            return {
+                "histograms": {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+                "counters": dict(self.counters),
+            }
+
+    def exposition(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            name = name.replace(".", "_")
+            lines.append("# TYPE {} histogram".format(name))
+            for bound, count in histogram["buckets"]:
+                lines.append('{}_bucket{{le="{}"}} {}'.format(name, "+Inf" if bound == float("inf") else bound, count))
+            lines.append("{}_sum {}".format(name, histogram["sum"]))
+            lines.append("{}_count {}".format(name, histogram["count"]))
+        for name, value in sorted(snapshot["counters"].items()):
+            name = name.replace(".", "_")
+            lines.append("# TYPE {} counter".format(name))
+            lines.append("{} {}".format(name, value))
+        return "\n".join(lines) + "\n"
+
+
+class SpanTimer:
+    """
+    Context manager that times a stage, and adds it to the trace when it exits
+    """
+
+    def __init__(self, trace: 'Trace', stage: str, url: str):
+        self.trace = trace
+        self.stage = stage
+        self.url = url
+        self.wall = 0.0
+        self.cpu = 0.0
+
+    def __enter__(self) -> 'SpanTimer':
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(Span(self.stage, self.url, time.perf_counter() - self.wall, time.thread_time() - self.cpu))
+
+
+class Trace:
+    """
+    Structured trace of a single request, with a span for each stage of the pipeline, and the counters of the request.
+    If created from a Metrics, everything is also reported to it.
+    """
+
+    enabled = True
+
+    def __init__(self, metrics: Metrics = None):
+        self.metrics = metrics
+        self.spans: List[Span] = []
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def span(self, stage: str, url: str = None) -> SpanTimer:
+        """
+        Times the code inside the with block as a stage of the pipeline
+        :param stage: Name of the stage, e.g. search, fetch, parse or summarise
+        :param url: URL being processed, if the stage works on a single page
+        """
+        return SpanTimer(self, stage, url)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+        if self.metrics is not None:
+            labels = {"stage": span.stage}
+            self.metrics.observe(span.stage + ".wall", span.wall, labels)
+            self.metrics.observe(span.stage + ".cpu", span.cpu, labels)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.metrics is not None:
+            self.metrics.increment(name, value)
+
+    def total(self, stage: str) -> float:
+        """
+        Returns the wall time spent on the stage, adding every span of it
+        """
+        return sum(span.wall for span in self.spans if span.stage == stage)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"spans": [span.as_dict() for span in self.spans], "counters": dict(self.counters)}
+
+
+class NullSpan:
+    def __enter__(self) -> 'NullSpan':
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullTrace(Trace):
+    """
+    Trace used when instrumentation is disabled, it records nothing, so its cost is a method call for each stage
+    """
+
+    enabled = False
+    _span = NullSpan()
+
+    def span(self, stage: str, url: str = None) -> NullSpan:
+        return self._span
+
+    def add(self, span: Span):
+        pass
+
+    def count(self, name: str, value: float = 1):
+        pass
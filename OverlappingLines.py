@@ -1,4 +1,13 @@
+import gc
+import heapq
 import numbers
+import operator
+import pickle
+import tempfile
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
 
 
 class Line:
@@ -6,8 +15,13 @@ class Line:
     Class for a Line object, which contains two points x1, x2.
     :param x1: The leftmost point of the line
     :param x2: The rightmost point of the line
+
+    Lines only hold their two points, in slots, so millions of them can be kept in memory. Two lines are equal when
+    they have the same points, and they are ordered by their leftmost point, then by their rightmost point.
     """
 
+    __slots__ = ("x1", "x2")
+
     def __init__(self, x1: numbers.Number, x2: numbers.Number):
         """
         Creates a line from point x1 to point x2.
@@ -17,7 +31,9 @@ class Line:
         :param x1: first point of the line
         :param x2: second point of the line
         """
-        if not isinstance(x1, numbers.Number) or not isinstance(x2, numbers.Number):
+        # checking the exact type first avoids the slower check against the Number ABC for ints and floats
+        if (type(x1) not in _BUILTIN_NUMBERS and not isinstance(x1, numbers.Number)) or \
+                (type(x2) not in _BUILTIN_NUMBERS and not isinstance(x2, numbers.Number)):
             raise RuntimeError("Line created using non-numbers")
 
         if x1 < x2:
@@ -29,14 +45,151 @@ class Line:
         else:
             raise RuntimeError("Line ({}, {}) is not a line, but a point.".format(x1, x2))
 
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[numbers.Number, numbers.Number]]) -> List['Line']:
+        """
+        Creates many lines at once, from (x1, x2) pairs, see `from_arrays`
+        :param pairs: First and second point of each line
+        :return: List with a line for each pair
+        """
+        pairs = pairs if isinstance(pairs, (list, tuple)) else list(pairs)
+        try:
+            lengths = set(map(len, pairs))
+        except TypeError:
+            lengths = None
+        if lengths is None or lengths - {2}:
+            raise ValueError("pairs should be a sequence of (x1, x2) pairs")
+        return cls._from_points(list(map(operator.itemgetter(0), pairs)), list(map(operator.itemgetter(1), pairs)))
+
+    @classmethod
+    def from_arrays(cls, x1, x2) -> List['Line']:
+        """
+        Creates many lines at once, from the first and the second points of each line. The points are checked like in
+        the constructor, but all at once, with numpy for numeric arrays, and the lines are then created without going
+        through the constructor. The points of numpy arrays are converted to python numbers.
+
+        This is close to the speed of calling the constructor for each line, and `from_pairs` is somewhat slower, see
+        `bench_line_construction`. Most of the time of creating millions of lines, either way, is taken by the garbage
+        collector, which runs over and over while they are created, so creating them inside `paused_gc` is several
+        times faster.
+        :param x1: array like with the first point of each line
+        :param x2: array like with the second point of each line
+        :return: List with a line for each pair of points
+        """
+        if not isinstance(x1, np.ndarray) and not isinstance(x2, np.ndarray):
+            return cls._from_points(list(x1), list(x2))
+
+        x1 = np.asarray(x1)
+        x2 = np.asarray(x2)
+        if x1.ndim != 1 or x1.shape != x2.shape:
+            raise ValueError("x1 and x2 should be one dimensional and have the same size")
+        if x1.dtype == object or x2.dtype == object or \
+                not np.issubdtype(x1.dtype, np.number) or not np.issubdtype(x2.dtype, np.number):
+            # numbers numpy can't hold, such as huge ints or Decimals, and things that are not numbers, are checked
+            # as python objects
+            return cls._from_points(x1.tolist(), x2.tolist())
+        points = np.flatnonzero(~((x1 < x2) | (x2 < x1)))
+        if points.size:
+            raise RuntimeError("Line ({}, {}) is not a line, but a point.".format(x1[points[0]], x2[points[0]]))
+        return cls._from_valid_points(np.minimum(x1, x2).tolist(), np.maximum(x1, x2).tolist())
+
+    @classmethod
+    def _from_points(cls, x1: list, x2: list) -> List['Line']:
+        """
+        Checks python lists of points in a few passes over all of them, and creates the lines
+        """
+        if len(x1) != len(x2):
+            raise ValueError("x1 and x2 should be one dimensional and have the same size")
+        types = set(map(type, x1))
+        types.update(map(type, x2))
+        if not types <= _BUILTIN_NUMBERS and not all(issubclass(point_type, numbers.Number) for point_type in types):
+            raise RuntimeError("Line created using non-numbers")
+        ordered = list(map(operator.lt, x1, x2))
+        reversed_ = list(map(operator.lt, x2, x1))
+        # points that are neither lower nor higher than the other, the same or NaN, are not lines
+        if not all(map(operator.or_, ordered, reversed_)):
+            i = next(i for i, (lower, higher) in enumerate(zip(ordered, reversed_)) if not lower and not higher)
+            raise RuntimeError("Line ({}, {}) is not a line, but a point.".format(x1[i], x2[i]))
+        if not any(reversed_):
+            return cls._from_valid_points(x1, x2)
+        return cls._from_valid_points(list(map(_swap, x1, x2, reversed_)), list(map(_swap, x2, x1, reversed_)))
+
+    @classmethod
+    def _from_valid_points(cls, x1: list, x2: list) -> List['Line']:
+        """
+        Creates the lines from points already known to be valid, and in order, skipping the constructor checks
+        """
+        new = object.__new__
+        lines = []
+        append = lines.append
+        for point1, point2 in zip(x1, x2):
+            line = new(cls)
+            line.x1 = point1
+            line.x2 = point2
+            append(line)
+        return lines
+
+    def __repr__(self) -> str:
+        return "Line({!r}, {!r})".format(self.x1, self.x2)
+
+    def __eq__(self, other: 'Line') -> bool:
+        if not isinstance(other, Line):
+            return NotImplemented
+        return self.x1 == other.x1 and self.x2 == other.x2
+
+    def __hash__(self) -> int:
+        return hash((self.x1, self.x2))
+
     def __lt__(self, other: 'Line') -> bool:
         """
-        Used to compare two lines which is the smallest. We're taking into comparison only the leftmost point of each
-        line.
+        Used to compare two lines which is the smallest. We're taking into comparison the leftmost point of each line,
+        and the rightmost point when they start on the same point.
         :param other: other Line to compare to this one.
         :return: True if this line is smaller, False if the other line is smaller
         """
-        return self.x1 < other.x1
+        if not isinstance(other, Line):
+            return NotImplemented
+        return self.x1 < other.x1 or (self.x1 == other.x1 and self.x2 < other.x2)
+
+    def __le__(self, other: 'Line') -> bool:
+        if not isinstance(other, Line):
+            return NotImplemented
+        return self.x1 < other.x1 or (self.x1 == other.x1 and self.x2 <= other.x2)
+
+    def __gt__(self, other: 'Line') -> bool:
+        if not isinstance(other, Line):
+            return NotImplemented
+        return other.x1 < self.x1 or (self.x1 == other.x1 and other.x2 < self.x2)
+
+    def __ge__(self, other: 'Line') -> bool:
+        if not isinstance(other, Line):
+            return NotImplemented
+        return other.x1 < self.x1 or (self.x1 == other.x1 and other.x2 <= self.x2)
+
+
+# types whose instances are always numbers, checked before the slower isinstance check against numbers.Number
+_BUILTIN_NUMBERS = frozenset((int, float))
+
+
+def _swap(point: numbers.Number, other: numbers.Number, swapped: bool) -> numbers.Number:
+    return other if swapped else point
+
+
+@contextmanager
+def paused_gc():
+    """
+    Pauses the garbage collector inside the block, and resumes it after, if it was running. Creating millions of
+    lines makes the collector run over and over, while none of them can be garbage, so creating them inside this block
+    is several times faster, with the constructor or with `Line.from_arrays`. The collector is paused for the whole
+    process, including its other threads, so the block should be kept to the creation of the lines.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 
 def two_lines_overlap(line1: Line, line2: Line):
@@ -75,3 +228,502 @@ def lines_overlap(*lines: Line) -> bool:
                 return True
         except IndexError:
             return False
+
+
+def iter_overlaps(lines: Iterable[Line], presorted: bool = False,
+                  chunk_size: int = 100000) -> Iterator[Tuple[Line, Line]]:
+    """
+    Yields every pair of lines that overlap, as soon as each pair is found, reading the lines from any iterable, so
+    they don't need to fit in memory.
+
+    It sweeps the lines sorted by their leftmost point, keeping the lines that haven't ended yet on a heap ordered by
+    their rightmost point. Each new line first drops the lines that ended before it starts, and overlaps every line
+    left. With `presorted` the lines are read one by one, and the memory used is only the lines that are open at the
+    same time, otherwise they are first sorted with `sort_lines`, using about `chunk_size` lines of memory.
+
+    This takes O(n log n + k) time for k pairs.
+    :param lines: Lines to check, in any iterable
+    :param presorted: Whether the lines are already sorted by their leftmost point. A ValueError is raised if they
+    turn out not to be.
+    :param chunk_size: Lines kept in memory while sorting
+    :return: Iterator of (earlier, later) pairs of overlapping lines, in the order the later line starts
+    """
+    active = []
+    for i, line in enumerate(_sorted_lines(lines, presorted, chunk_size)):
+        while active and active[0][0] < line.x1:
+            heapq.heappop(active)
+        for _, _, other in active:
+            yield other, line
+        heapq.heappush(active, (line.x2, i, line))
+
+
+def first_overlap(lines: Iterable[Line], presorted: bool = False,
+                  chunk_size: int = 100000) -> Optional[Tuple[Line, Line]]:
+    """
+    Returns the first pair of lines that overlap, stopping as soon as it is found. Like `lines_overlap`, it only needs
+    to remember the line that ends the furthest so far, so with `presorted` it takes O(1) memory.
+    :param lines: Lines to check, in any iterable
+    :param presorted: Whether the lines are already sorted by their leftmost point. A ValueError is raised if they
+    turn out not to be.
+    :param chunk_size: Lines kept in memory while sorting
+    :return: (earlier, later) pair of overlapping lines, or None if no lines overlap
+    """
+    furthest = None
+    for line in _sorted_lines(lines, presorted, chunk_size):
+        if furthest is not None and furthest.x2 >= line.x1:
+            return furthest, line
+        if furthest is None or line.x2 > furthest.x2:
+            furthest = line
+    return None
+
+
+def sort_lines(lines: Iterable[Line], chunk_size: int = 100000) -> Iterator[Line]:
+    """
+    Sorts the lines by their leftmost point, keeping about `chunk_size` of them in memory. This is an external merge
+    sort: the lines are read in chunks, each chunk is sorted and spilled as a run to a temporary file, and the runs
+    are then merged, at most `_MERGE_FAN_IN` at a time, over as many passes as needed. Each run being merged only
+    reads its share of `chunk_size` lines from disk at a time, and every run shares the same two files, so neither the
+    memory nor the open files grow with the number of runs. If every line fits in a single chunk nothing is written to
+    disk, otherwise the lines are read back from disk as copies of the original Line objects.
+    :param lines: Lines to sort, in any iterable
+    :param chunk_size: Maximum number of lines sorted in memory at once
+    :return: Iterator of the sorted lines
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size should be positive")
+    fan_in = max(2, min(_MERGE_FAN_IN, chunk_size))
+    batch_size = max(1, chunk_size // fan_in)
+    lines = iter(lines)
+    runs = []
+    spill = merged = None
+    try:
+        while True:
+            chunk = [line for _, line in zip(range(chunk_size), lines)]
+            chunk.sort(key=_leftmost)
+            if len(chunk) < chunk_size and not runs:
+                yield from chunk
+                return
+            if spill is None:
+                spill = tempfile.TemporaryFile()
+            if chunk:
+                runs.append(_spill(spill, chunk, batch_size))
+            if len(chunk) < chunk_size:
+                break
+            del chunk
+        while len(runs) > fan_in:
+            if merged is None:
+                merged = tempfile.TemporaryFile()
+            merged.seek(0)
+            merged.truncate()
+            runs = [_spill(merged, _merge_runs(spill, runs[start:start + fan_in]), batch_size)
+                    for start in range(0, len(runs), fan_in)]
+            spill, merged = merged, spill
+        yield from _merge_runs(spill, runs)
+    finally:
+        for run_file in (spill, merged):
+            if run_file is not None:
+                run_file.close()
+
+
+# most runs merged at once, each more run costs a smaller read batch for every run, and more seeks on the spill file
+_MERGE_FAN_IN = 64
+
+
+def _leftmost(line: Line) -> numbers.Number:
+    return line.x1
+
+
+def _spill(run_file, lines: Iterable[Line], batch_size: int) -> Tuple[int, int]:
+    """
+    Appends sorted lines to the file as a run, pickled in batches of `batch_size` lines, returning its offsets
+    """
+    run_file.seek(0, 2)
+    start = run_file.tell()
+    lines = iter(lines)
+    while True:
+        batch = [line for _, line in zip(range(batch_size), lines)]
+        if not batch:
+            break
+        pickle.dump(batch, run_file, protocol=pickle.HIGHEST_PROTOCOL)
+    return start, run_file.tell()
+
+
+def _merge_runs(run_file, runs: List[Tuple[int, int]]) -> Iterator[Line]:
+    return heapq.merge(*(_read_run(run_file, start, end) for start, end in runs), key=_leftmost)
+
+
+def _read_run(run_file, start: int, end: int) -> Iterator[Line]:
+    # runs share the file, so each batch is read from where this run stopped, not from where the file is
+    position = start
+    while position < end:
+        run_file.seek(position)
+        batch = pickle.load(run_file)
+        position = run_file.tell()
+        yield from batch
+
+
+def _sorted_lines(lines: Iterable[Line], presorted: bool, chunk_size: int) -> Iterator[Line]:
+    if not presorted:
+        yield from sort_lines(lines, chunk_size)
+        return
+    previous = None
+    for line in lines:
+        if previous is not None and line.x1 < previous.x1:
+            raise ValueError("Lines are not sorted, {} starts before {}".format(line.x1, previous.x1))
+        previous = line
+        yield line
+
+
+class LineSet:
+    """
+    Columnar set of lines, which keeps the x1 and the x2 of every line on two contiguous numpy arrays, instead of a Line
+    object for each of them. Checking for overlaps is done on the whole arrays at once, so it scales to millions of
+    lines, and takes a fraction of the memory of a list of Line objects.
+
+    Like Line, the points of each line can be given in any order, and lines that are just a point are not valid.
+    """
+
+    def __init__(self, x1, x2):
+        """
+        Creates the set from the first and second points of each line.
+        :param x1: array like with the first point of each line
+        :param x2: array like with the second point of each line
+        """
+        x1 = np.asarray(x1)
+        x2 = np.asarray(x2)
+        if x1.ndim != 1 or x1.shape != x2.shape:
+            raise ValueError("x1 and x2 should be one dimensional and have the same size")
+        if x1.size and (not np.issubdtype(x1.dtype, np.number) or not np.issubdtype(x2.dtype, np.number)):
+            raise RuntimeError("Line created using non-numbers")
+        # like the constructor, points that are neither lower nor higher than the other, such as NaN, are rejected
+        points = np.flatnonzero(~((x1 < x2) | (x2 < x1)))
+        if points.size:
+            raise RuntimeError("Line ({}, {}) is not a line, but a point.".format(x1[points[0]], x2[points[0]]))
+
+        self.x1 = np.minimum(x1, x2)
+        self.x2 = np.maximum(x1, x2)
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[Line]) -> 'LineSet':
+        """
+        Creates the set from Line objects
+        :param lines: Lines to add to the set
+        :return: Set with the lines, in the same order
+        """
+        lines = list(lines)
+        return cls(np.array([line.x1 for line in lines]), np.array([line.x2 for line in lines]))
+
+    @classmethod
+    def _from_valid_points(cls, x1: np.ndarray, x2: np.ndarray) -> 'LineSet':
+        """
+        Creates the set from arrays that are already known to be valid lines, skipping the validation
+        """
+        line_set = cls.__new__(cls)
+        line_set.x1 = x1
+        line_set.x2 = x2
+        return line_set
+
+    def __len__(self) -> int:
+        return len(self.x1)
+
+    def __getitem__(self, i: int) -> Line:
+        return Line(self.x1[i].item(), self.x2[i].item())
+
+    def __iter__(self) -> Iterator[Line]:
+        return map(Line, self.x1.tolist(), self.x2.tolist())
+
+    def to_lines(self) -> List[Line]:
+        """
+        Returns the lines of the set as Line objects, created in bulk with `Line.from_arrays`
+        """
+        return Line.from_arrays(self.x1, self.x2)
+
+    def sort_order(self) -> np.ndarray:
+        """
+        Returns the indexes of the lines, sorted by their leftmost point, like sorting Line objects
+        """
+        return np.argsort(self.x1, kind="stable")
+
+    def overlaps(self) -> bool:
+        """
+        Checks whether any two lines of the set overlap, the same way as `lines_overlap`: once sorted by the leftmost
+        point, if any lines overlap, then some line overlaps the next one, so only neighbours are compared. Both the
+        sort and the comparison of neighbours run on the arrays.
+
+        This takes O(n log n) time and O(n) space.
+        :return: True if the lines overlap, False if they do not.
+        """
+        order = self.sort_order()
+        return bool(np.any(self.x2[order[:-1]] >= self.x1[order[1:]]))
+
+    def overlapping_pairs(self) -> np.ndarray:
+        """
+        Returns every pair of lines that overlap. Once the lines are sorted by their leftmost point, a line overlaps
+        every following line that starts before it ends, which are found with a binary search of its end.
+
+        This takes O(n log n + k) time and O(n + k) space, for k pairs, which can be up to n^2 when every line overlaps.
+        :return: Array of shape (k, 2), with the indexes on the set of the lines of each pair
+        """
+        order = self.sort_order()
+        sorted_x1 = self.x1[order]
+        positions = np.arange(len(order))
+        ends = np.searchsorted(sorted_x1, self.x2[order], side="right")
+        counts = ends - positions - 1
+
+        first = np.repeat(positions, counts)
+        pair_starts = np.repeat(np.cumsum(counts) - counts, counts)
+        second = first + 1 + np.arange(len(first)) - pair_starts
+        return np.column_stack((order[first], order[second]))
+
+    def merged(self) -> 'LineSet':
+        """
+        Merges the lines that overlap, returning the smallest set of lines covering the same points. Once sorted by
+        their leftmost point, a line starts a new merged line when it starts after every line before it has ended.
+
+        This takes O(n log n) time and O(n) space.
+        :return: Set of the merged lines, sorted by their leftmost point
+        """
+        if not len(self):
+            return self._from_valid_points(self.x1.copy(), self.x2.copy())
+
+        order = self.sort_order()
+        sorted_x1 = self.x1[order]
+        sorted_x2 = self.x2[order]
+        reach = np.maximum.accumulate(sorted_x2)
+        starts = np.flatnonzero(np.concatenate(([True], sorted_x1[1:] > reach[:-1])))
+        return self._from_valid_points(sorted_x1[starts], np.maximum.reduceat(sorted_x2, starts))
+
+
+class _IndexNode:
+    """
+    Node of the LineIndex tree, which also keeps the height of its subtree, to keep it balanced, and the rightmost point
+    of every line in its subtree, to skip the subtrees that can't overlap a query.
+    """
+
+    __slots__ = ("key", "line", "left", "right", "height", "max_end")
+
+    def __init__(self, key: tuple, line: Line):
+        self.key = key
+        self.line = line
+        self.left = None
+        self.right = None
+        self.height = 1
+        self.max_end = line.x2
+
+    def update(self):
+        left, right = self.left, self.right
+        self.height = 1 + max(left.height if left else 0, right.height if right else 0)
+        max_end = self.line.x2
+        if left is not None and left.max_end > max_end:
+            max_end = left.max_end
+        if right is not None and right.max_end > max_end:
+            max_end = right.max_end
+        self.max_end = max_end
+
+
+def _height(node: _IndexNode) -> int:
+    return node.height if node is not None else 0
+
+
+class LineIndex:
+    """
+    Index over a set of lines, to check many lines against the same set without comparing them to every line of it.
+
+    It is an interval tree: a balanced binary search tree (AVL) of the lines sorted by their leftmost point, where every
+    node also keeps the rightmost point of the lines below it, so the searches skip every subtree whose lines end before
+    the query starts, or start after it ends. Lines can be added and removed at any time.
+
+    The index holds line objects, not values: membership, `insert` and `delete` go by the identity of the line, so two
+    equal lines can both be indexed, and `Line(1, 2) in index` is False unless that very object was added.
+    """
+
+    def __init__(self, lines: Iterable[Line] = ()):
+        """
+        Creates the index with the given lines. The lines are sorted and the tree built already balanced, which takes
+        O(n log n) time, instead of inserting them one by one.
+        :param lines: Lines to index
+        """
+        self._root = None
+        self._keys = {}
+        self._sequence = 0
+        # a line passed twice is only indexed once, like `insert` does
+        nodes = [self._node(line) for line in lines if id(line) not in self._keys]
+        nodes.sort(key=lambda node: node.key)
+        self._root = self._build(nodes, 0, len(nodes))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, line: Line) -> bool:
+        """
+        Whether this line object was added to the index, an equal line that wasn't added is not on it
+        """
+        return id(line) in self._keys
+
+    def __iter__(self):
+        """
+        Iterates the lines sorted by their leftmost point
+        """
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.line
+            node = node.right
+
+    def insert(self, line: Line):
+        """
+        Adds the line to the index, in O(log n) time. Adding a line already on the index does nothing
+        :param line: Line to add
+        """
+        if id(line) in self._keys:
+            return
+        self._root = self._insert(self._root, self._node(line))
+
+    def delete(self, line: Line):
+        """
+        Removes the line from the index, in O(log n) time. Raises KeyError if the line was not added to the index, even
+        if an equal line was.
+        :param line: Line to remove, the same object that was added
+        """
+        key = self._keys.pop(id(line))
+        self._root = self._delete(self._root, key)
+
+    def overlaps(self, line: Line) -> bool:
+        """
+        Checks whether the line overlaps any line of the index, in O(log n) time.
+
+        The search goes down a single path: if some line of the left subtree ends after the query starts, either one of
+        them overlaps it, or they all start after the query ends, and so do the lines of the right subtree.
+        :param line: Line to check
+        :return: True if it overlaps any line of the index, False otherwise
+        """
+        node = self._root
+        while node is not None:
+            if node.line.x1 <= line.x2 and line.x1 <= node.line.x2:
+                return True
+            if node.left is not None and node.left.max_end >= line.x1:
+                node = node.left
+            else:
+                node = node.right
+        return False
+
+    def find_overlapping(self, line: Line) -> List[Line]:
+        """
+        Returns every line of the index that overlaps the line, sorted by their leftmost point. This takes
+        O(min(n, k log n)) time for k lines found, so it is O(log n) when the query overlaps just a few lines.
+        :param line: Line to check
+        :return: Lines of the index that overlap it
+        """
+        return self._search(line.x1, line.x2)
+
+    def stab(self, point: numbers.Number) -> List[Line]:
+        """
+        Returns every line of the index that contains the point, including the lines that start or end on it, sorted by
+        their leftmost point. Takes the same time as `find_overlapping`.
+        :param point: Point to check
+        :return: Lines of the index that contain it
+        """
+        return self._search(point, point)
+
+    def _search(self, x1: numbers.Number, x2: numbers.Number) -> List[Line]:
+        found = []
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            # go left while the left subtree may still have lines ending after x1
+            while node is not None and node.max_end >= x1:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            if node.line.x1 > x2:
+                # every line from here on starts after x2
+                break
+            if node.line.x2 >= x1:
+                found.append(node.line)
+            node = node.right
+        return found
+
+    def _node(self, line: Line) -> _IndexNode:
+        if not isinstance(line, Line):
+            raise RuntimeError("Only lines can be added to the index")
+        key = (line.x1, line.x2, self._sequence)
+        self._sequence += 1
+        self._keys[id(line)] = key
+        return _IndexNode(key, line)
+
+    def _build(self, nodes: List[_IndexNode], start: int, end: int):
+        if start >= end:
+            return None
+        middle = (start + end) // 2
+        node = nodes[middle]
+        node.left = self._build(nodes, start, middle)
+        node.right = self._build(nodes, middle + 1, end)
+        node.update()
+        return node
+
+    def _insert(self, node: _IndexNode, new: _IndexNode) -> _IndexNode:
+        if node is None:
+            return new
+        if new.key < node.key:
+            node.left = self._insert(node.left, new)
+        else:
+            node.right = self._insert(node.right, new)
+        return self._balance(node)
+
+    def _delete(self, node: _IndexNode, key: tuple) -> _IndexNode:
+        if node is None:
+            raise KeyError(key)
+        if key < node.key:
+            node.left = self._delete(node.left, key)
+        elif node.key < key:
+            node.right = self._delete(node.right, key)
+        else:
+            if node.left is None:
+                return node.right
+            if node.right is None:
+                return node.left
+            # replace the node by the leftmost node of its right subtree
+            successor = node.right
+            while successor.left is not None:
+                successor = successor.left
+            successor.right = self._delete(node.right, successor.key)
+            successor.left = node.left
+            node = successor
+        return self._balance(node)
+
+    def _balance(self, node: _IndexNode) -> _IndexNode:
+        node.update()
+        balance = _height(node.left) - _height(node.right)
+        if balance > 1:
+            if _height(node.left.left) < _height(node.left.right):
+                node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+        if balance < -1:
+            if _height(node.right.right) < _height(node.right.left):
+                node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+        return node
+
+    @staticmethod
+    def _rotate_left(node: _IndexNode) -> _IndexNode:
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        node.update()
+        pivot.update()
+        return pivot
+
+    @staticmethod
+    def _rotate_right(node: _IndexNode) -> _IndexNode:
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        node.update()
+        pivot.update()
+        return pivot
@@ -1,46 +1,95 @@
+from typing import List, Tuple
+
 from googlesearch import search
 
+from Caches import Cache
+
 
 class Searcher:
     """
     Searcher is a base class for all searchers, it has a method search, which will populate a list of urls, that can be
     then queried for its results.
 
-    If needed, one can extend this to perform searches on other engines too.
+    If needed, one can extend this to perform searches on other engines too, by implementing `fetch_urls`. Every
+    searcher can be given a cache, in which case the results are memoised by the normalised query and the number of
+    results, and concurrent searches for the same query make a single call to the search engine.
     """
 
-    def __init__(self, n_results: int = 5):
+    def __init__(self, n_results: int = 5, cache: Cache = None, cache_ttl: float = 3600):
         """
         Initialises the Searcher class, storing the amount of results needed and the URLS in a list.
         :param n_results: Number of results to get the URL
+        :param cache: Cache for the search results, None disables caching. Use a SqliteCache to persist them on disk
+        :param cache_ttl: Seconds a search result is kept on the cache
         """
         self.urls = []
         self.n_results = n_results
         self.query = ""
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        # whether the last search was answered by the cache, without calling the search engine
+        self.cache_hit = False
 
-    def search(self, query: str):
+    def search(self, query: str, **kwargs) -> Tuple[List[str], bool]:
         """
-        Perform a search on the given platform given the query, and populate the list of URLs.
+        Perform a search on the given platform given the query, and return the list of URLs. The URLs and whether they
+        came from the cache are also kept on `urls` and `cache_hit`, as in the original interface, but a search running
+        at the same time on the same searcher can overwrite them, so the returned ones should be used.
+        :param query: Original user query
+        :param kwargs: Extra arguments for `fetch_urls`
+        :return: Tuple (urls, cache_hit), with the URLs and whether they were answered by the cache
+        """
+        self.query = query
+
+        assert query is not None and query != "", "Query should not be empty"
+        assert isinstance(query, str), "Query should be a string"
+        if self.cache is None:
+            urls = list(self.fetch_urls(query, **kwargs))
+            cache_hit = False
+        else:
+            searched = []
+
+            def fetch_urls():
+                searched.append(query)
+                return list(self.fetch_urls(query, **kwargs))
+
+            key = (type(self).__name__, self.normalise(query), self.n_results)
+            urls = list(self.cache.get_or_set(key, fetch_urls, self.cache_ttl))
+            cache_hit = not searched
+
+        self.urls = urls
+        self.cache_hit = cache_hit
+        return urls, cache_hit
+
+    def fetch_urls(self, query: str, **kwargs) -> List[str]:
+        """
+        Calls the search engine, and returns the URLs of the first `n_results` results
         """
         raise NotImplementedError
 
+    @staticmethod
+    def normalise(query: str) -> str:
+        """
+        Normalises the query, so queries that only differ in case or whitespace share the same cache entry
+        :param query: Original user query
+        :return: Normalised query
+        """
+        return " ".join(query.lower().split())
+
 
 class GoogleSearcher(Searcher):
     """
     Implementation of the searcher on the Google web search engine. The search is made with the python binding of Google
     web search, more info here : https://pypi.org/project/google/
     """
-    def __init__(self):
-        super().__init__()
+    def __init__(self, n_results: int = 5, cache: Cache = None, cache_ttl: float = 3600):
+        super().__init__(n_results, cache, cache_ttl)
 
-    def search(self, query: str, searcher=search):
+    def fetch_urls(self, query: str, searcher=search) -> List[str]:
         """
         Calls to the python binding to google search and performs a search using the given parameters
         :param query: Original user query
         :param searcher: which function to use to search the web
+        :return: URLs of the results
         """
-        self.query = query
-
-        assert self.query is not None and self.query != "", "Query should not be empty"
-        assert isinstance(self.query, str), "Query should be a string"
-        self.urls = [url for url in searcher(self.query, stop=self.n_results)]
+        return [url for url in searcher(query, stop=self.n_results)]
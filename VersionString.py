@@ -1,3 +1,13 @@
+import bisect
+import json
+from functools import lru_cache
+from itertools import accumulate
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
 def compare_version_strings(version_str1: str, version_str2: str, sep: str = ".", sep2: str = None) -> int:
     """
     Compares two strings containing version strings. Version strings should be of the following format
@@ -18,23 +28,417 @@ def compare_version_strings(version_str1: str, version_str2: str, sep: str = "."
     smaller
     """
 
-    # transform them in an array of ints, e.g. "2.00.01" -> [2, 0, 1]
-    versions_1 = [int(v) for v in version_str1.split(sep)]
-    versions_2 = [int(v) for v in version_str2.split(sep if not sep2 else sep2)]
+    # every string is parsed once into a tuple of ints without the trailing zeros, e.g. "2.00.01.0" -> (2, 0, 1), and
+    # tuples compare like versions padded with zeros: a shorter tuple that is a prefix of a longer one is smaller, since
+    # the longer one doesn't end with a zero.
+    versions_1 = parse_version(version_str1, sep)
+    versions_2 = parse_version(version_str2, sep if not sep2 else sep2)
+    if versions_1 > versions_2:
+        return 1
+    if versions_2 > versions_1:
+        return -1
+    return 0
+
+
+def parse_version(version_str: str, sep: str = ".") -> Tuple[int, ...]:
+    """
+    Parses a version string into the tuple of its numbers, without the trailing zeros, so "2.0.1", "02.00.01" and
+    "2.0.1.0" are all (2, 0, 1). The tuples can be compared, hashed and sorted as the versions they represent.
+
+    Strings are parsed once, and then taken from a cache, since the same versions tend to be compared many times.
+    :param version_str: version string to parse
+    :param sep: separator of the numbers of the version string
+    :return: tuple with the numbers of the version
+    """
+    if type(version_str) is str:
+        return _parse_version_cached(version_str, sep)
+    return _parse_version(version_str, sep)
+
 
-    # if the versions are different in sizes, append 0 so they can compare to each other
-    versions_1 += [0] * max(0, len(versions_2) - len(versions_1))
-    versions_2 += [0] * max(0, len(versions_1) - len(versions_2))
+def _parse_version(version_str: str, sep: str) -> Tuple[int, ...]:
+    # transform them in an array of ints, e.g. "2.00.01" -> [2, 0, 1]
+    versions = [int(v) for v in version_str.split(sep)]
 
     # When parsing int values, we could end up with a negative value. This is an error, since we don't want negative
     # versions on the version string.
-    if len([v for v in versions_1 if v < 0]) > 0 or len([v for v in versions_2 if v < 0]) > 0:
+    if any(v < 0 for v in versions):
         raise ValueError("Invalid value for version string. Should be higher or equal than 0.")
 
-    # iterate over them, and compare them using lt and gt operators.
-    for v1, v2 in zip(versions_1, versions_2):
-        if v1 > v2:
-            return 1
-        if v2 > v1:
-            return -1
-    return 0
+    # trailing zeros don't change the version, "2.1" and "2.1.0" are the same
+    while versions and versions[-1] == 0:
+        versions.pop()
+    return tuple(versions)
+
+
+_parse_version_cached = lru_cache(maxsize=2 ** 16)(_parse_version)
+
+
+class Version:
+    """
+    Parsed version string, that can be compared, hashed and sorted as a version. The string is parsed only once, when
+    the Version is created, so it is the key to use when the same versions are compared many times.
+
+    Versions that only differ in leading or trailing zeros, such as "2.1" and "02.01.0", are equal and have the same
+    hash.
+    """
+
+    __slots__ = ("string", "parts", "_hash")
+
+    def __init__(self, version_str: str, sep: str = "."):
+        """
+        :param version_str: version string to parse
+        :param sep: separator of the numbers of the version string
+        """
+        self.string = version_str
+        self.parts = parse_version(version_str, sep)
+        self._hash = hash(self.parts)
+
+    def __repr__(self) -> str:
+        return "Version({!r})".format(self.string)
+
+    def __str__(self) -> str:
+        return self.string
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __eq__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self._hash == other._hash and self.parts == other.parts
+
+    def __lt__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.parts < other.parts
+
+    def __le__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.parts <= other.parts
+
+    def __gt__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.parts > other.parts
+
+    def __ge__(self, other: 'Version') -> bool:
+        if not isinstance(other, Version):
+            return NotImplemented
+        return self.parts >= other.parts
+
+
+def sort_versions(versions: Iterable[str], sep: str = ".", reverse: bool = False) -> List[str]:
+    """
+    Sorts the version strings from the smallest to the highest version, parsing each of them once. Equal versions keep
+    their order.
+    :param versions: version strings to sort
+    :param sep: separator of the numbers of the version strings
+    :param reverse: sort from the highest to the smallest version instead
+    :return: list with the sorted version strings
+    """
+    return sorted(versions, key=lambda version_str: parse_version(version_str, sep), reverse=reverse)
+
+
+def max_version(versions: Iterable[str], sep: str = ".") -> str:
+    """
+    Returns the highest version string, parsing each of them once. If several strings are the highest version, the first
+    of them is returned. Raises ValueError if there are no versions.
+    :param versions: version strings to check
+    :param sep: separator of the numbers of the version strings
+    :return: highest version string
+    """
+    return max(versions, key=lambda version_str: parse_version(version_str, sep))
+
+
+def dedupe_versions(versions: Iterable[str], sep: str = ".") -> List[str]:
+    """
+    Removes the version strings that are the same version as a previous one, such as "2.1" after "02.01.0", parsing
+    each of them once.
+    :param versions: version strings to dedupe
+    :param sep: separator of the numbers of the version strings
+    :return: list with the first version string of each version, in their original order
+    """
+    seen = set()
+    deduped = []
+    for version_str in versions:
+        parts = parse_version(version_str, sep)
+        if parts not in seen:
+            seen.add(parts)
+            deduped.append(version_str)
+    return deduped
+
+
+# operators of the constraints, the ones that are a prefix of another come after it
+_OPERATORS = ("==", "!=", ">=", "<=", ">", "<")
+
+
+def parse_constraints(constraints: Union[str, Iterable[str]], sep: str = ".") -> List[Tuple[str, Tuple[int, ...]]]:
+    """
+    Parses a set of version constraints, such as ">=2.3,<3.0,!=2.4.1", into a list of (operator, parsed version). The
+    operators are ==, !=, >=, <=, > and <, and a version without operator means ==.
+    :param constraints: constraints separated by commas, or a list with a constraint on each string, which is needed
+    when the separator of the versions is a comma, since a string would be ambiguous and raises ValueError
+    :param sep: separator of the numbers of the version strings
+    :return: list with the operator and the parsed version of each constraint
+    """
+    if isinstance(constraints, str):
+        if sep == ",":
+            raise ValueError("Constraints of versions separated by commas should be given as a list")
+        constraints = constraints.split(",")
+    parsed = []
+    for constraint in constraints:
+        constraint = constraint.strip()
+        if not constraint:
+            continue
+        operator = next((operator for operator in _OPERATORS if constraint.startswith(operator)), None)
+        version_str = constraint if operator is None else constraint[len(operator):].strip()
+        try:
+            parsed.append((operator or "==", parse_version(version_str, sep)))
+        except ValueError:
+            raise ValueError("Invalid version constraint: {!r}".format(constraint))
+    return parsed
+
+
+class VersionIndex:
+    """
+    Sorted index of version strings, parsed once when they are added, to find the versions that satisfy a set of
+    constraints, such as ">=2.3,<3.0,!=2.4.1", or the newest of them. Every constraint is resolved with a binary search
+    on the sorted versions, so a query takes O(log n) for each constraint, plus the number of versions returned,
+    instead of comparing every version with every constraint.
+
+    Versions can be added at any time, and the index can be saved to a JSON file with the versions already parsed, so
+    loading it doesn't parse them again.
+    """
+
+    def __init__(self, versions: Iterable[str] = (), sep: str = "."):
+        """
+        :param versions: version strings to index
+        :param sep: separator of the numbers of the version strings, also used on the constraints
+        """
+        self.sep = sep
+        # the parsed versions, sorted, and the version string of each of them. Equal versions keep the order they were
+        # added in
+        self._keys: List[Tuple[int, ...]] = []
+        self._strings: List[str] = []
+        self.update(versions)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterates over the version strings, from the smallest to the highest version
+        """
+        return iter(self._strings)
+
+    def __contains__(self, version_str: str) -> bool:
+        """
+        Whether the index has the same version as the string, even if it is written differently, e.g. "2.1" and "02.01"
+        """
+        key = parse_version(version_str, self.sep)
+        i = bisect.bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def insert(self, version_str: str):
+        """
+        Adds a version string to the index, it takes O(log n) to find its position, and a shift of the versions after it
+        """
+        key = parse_version(version_str, self.sep)
+        i = bisect.bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._strings.insert(i, version_str)
+
+    def update(self, versions: Iterable[str]):
+        """
+        Adds many version strings to the index at once, which is faster than inserting them one by one
+        """
+        versions = list(versions)
+        if not versions:
+            return
+        # big batches are mostly distinct strings, which would only churn the cache of parse_version
+        keys = [_parse_version(version_str, self.sep) for version_str in versions]
+        # the index is already sorted, so sorting it with the new versions is mostly a merge
+        entries = sorted(zip(self._keys + keys, self._strings + versions), key=itemgetter(0))
+        self._keys = [key for key, _ in entries]
+        self._strings = [version_str for _, version_str in entries]
+
+    def match(self, constraints: Union[str, Iterable[str]]) -> List[str]:
+        """
+        Returns the version strings that satisfy every constraint
+        :param constraints: constraints as taken by `parse_constraints`, no constraints match every version
+        :return: list with the matching version strings, from the smallest to the highest version
+        """
+        return [version_str for start, end in self._ranges(constraints) for version_str in self._strings[start:end]]
+
+    def count(self, constraints: Union[str, Iterable[str]]) -> int:
+        """
+        Returns how many version strings satisfy every constraint, without listing them
+        """
+        return sum(end - start for start, end in self._ranges(constraints))
+
+    def newest(self, constraints: Union[str, Iterable[str]] = ()) -> Optional[str]:
+        """
+        Returns the highest version string that satisfies every constraint, or None if there is none. If the highest
+        version was added several times, the last one added is returned.
+        """
+        ranges = self._ranges(constraints)
+        return self._strings[ranges[-1][1] - 1] if ranges else None
+
+    def save(self, path: str):
+        """
+        Saves the index to a JSON file, with the version strings and their parsed versions. The numbers of every
+        parsed version are stored on a single flat list, which loads a lot faster than a list for each version.
+        """
+        with open(path, "w") as file:
+            json.dump({"sep": self.sep, "strings": self._strings, "lengths": [len(key) for key in self._keys],
+                       "numbers": [number for key in self._keys for number in key]}, file)
+
+    @classmethod
+    def load(cls, path: str) -> 'VersionIndex':
+        """
+        Loads an index saved with `save`, without parsing its version strings again
+        """
+        with open(path) as file:
+            data = json.load(file)
+        index = cls(sep=data["sep"])
+        index._strings = data["strings"]
+        numbers = data["numbers"]
+        ends = list(accumulate(data["lengths"]))
+        index._keys = [tuple(numbers[start:end]) for start, end in zip([0] + ends[:-1], ends)]
+        return index
+
+    def _ranges(self, constraints: Union[str, Iterable[str]]) -> List[Tuple[int, int]]:
+        """
+        Resolves the constraints into the ranges of positions of the versions that satisfy them, in order. The bounds
+        narrow a single range, and each != removes the range of its version from it.
+        """
+        keys = self._keys
+        start, end = 0, len(keys)
+        excluded = []
+        for operator, key in parse_constraints(constraints, self.sep):
+            if operator == "==":
+                start = max(start, bisect.bisect_left(keys, key))
+                end = min(end, bisect.bisect_right(keys, key))
+            elif operator == "!=":
+                excluded.append((bisect.bisect_left(keys, key), bisect.bisect_right(keys, key)))
+            elif operator == ">=":
+                start = max(start, bisect.bisect_left(keys, key))
+            elif operator == ">":
+                start = max(start, bisect.bisect_right(keys, key))
+            elif operator == "<=":
+                end = min(end, bisect.bisect_right(keys, key))
+            else:
+                end = min(end, bisect.bisect_left(keys, key))
+
+        ranges = []
+        for excluded_start, excluded_end in sorted(excluded):
+            if start >= end:
+                break
+            if excluded_start > start:
+                ranges.append((start, min(excluded_start, end)))
+            start = max(start, excluded_end)
+        if start < end:
+            ranges.append((start, end))
+        return ranges
+
+
+def compare_version_columns(column1: Sequence[str], column2: Sequence[str], sep: str = ".",
+                            sep2: str = None) -> np.ndarray:
+    """
+    Compares two columns of version strings pair by pair, like calling `compare_version_strings` on each pair, with the
+    same separators and the same validation, but parsing each column at once into a matrix of ints, padded with zeros,
+    and comparing the matrices with numpy.
+    :param column1: first version strings to compare
+    :param column2: second version strings to compare, the same number as on the first column
+    :param sep: default separator if sep2 is None, else the separator for the first column
+    :param sep2: separator for the second column
+    :return: array with 0 where the versions are the same, 1 where the first version string is higher, and -1 where the
+    first version string is smaller
+    """
+    if len(column1) != len(column2):
+        raise ValueError("The columns should have the same number of version strings")
+    sep2 = sep if not sep2 else sep2
+    try:
+        versions_1 = _parse_column(column1, sep)
+        versions_2 = _parse_column(column2, sep2)
+    except (TypeError, OverflowError):
+        # values that aren't strings, or numbers too big for int64, are compared one by one
+        return np.array([compare_version_strings(version_str1, version_str2, sep, sep2)
+                         for version_str1, version_str2 in zip(column1, column2)], dtype=np.int8)
+
+    width = max(versions_1.shape[1], versions_2.shape[1])
+    versions_1 = np.pad(versions_1, ((0, 0), (0, width - versions_1.shape[1])), mode="constant")
+    versions_2 = np.pad(versions_2, ((0, 0), (0, width - versions_2.shape[1])), mode="constant")
+
+    # the result of each pair is the sign of the first number that differs
+    differ = versions_1 != versions_2
+    first = differ.argmax(axis=1)
+    rows = np.arange(len(first))
+    return np.sign(versions_1[rows, first] - versions_2[rows, first]).astype(np.int8)
+
+
+def _parse_column(column: Sequence[str], sep: str) -> np.ndarray:
+    """
+    Parses the version strings into a matrix with a row for each of them, padded with zeros
+    """
+    if not len(column):
+        return np.zeros((0, 1), dtype=np.int64)
+    # splitting every string joined together is a lot faster than splitting them one by one
+    joined = sep.join(column)
+    parsed = _parse_digits(joined, sep, column)
+    if parsed is None:
+        lengths = np.array([version_str.count(sep) + 1 for version_str in column], dtype=np.int64)
+        numbers = joined.split(sep)
+        values = np.fromiter(map(int, numbers), dtype=np.int64, count=len(numbers))
+    else:
+        lengths, values = parsed
+    if (values < 0).any():
+        raise ValueError("Invalid value for version string. Should be higher or equal than 0.")
+
+    rows = np.repeat(np.arange(len(column)), lengths)
+    columns = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix = np.zeros((len(column), lengths.max()), dtype=np.int64)
+    matrix[rows, columns] = values
+    return matrix
+
+
+# numbers with more digits could overflow an int64
+_MAX_DIGITS = 18
+_POWERS_OF_TEN = 10 ** np.arange(_MAX_DIGITS, dtype=np.int64)
+
+
+def _parse_digits(joined: str, sep: str, column: Sequence[str]):
+    """
+    Parses the joined version strings on their bytes with numpy, for the common case of version strings made only of
+    ascii digits and a single character separator. Returns None for any other strings, which are then parsed with int.
+    :return: the number of numbers of each version string, and the numbers of every version string
+    """
+    if len(sep) != 1 or not joined.isascii():
+        return None
+    data = np.frombuffer(joined.encode("ascii"), dtype=np.uint8)
+    is_sep = data == ord(sep)
+    # bytes below "0" wrap around, so anything that is not a digit is above 9
+    digits = data - np.uint8(ord("0"))
+    is_digit = digits <= 9
+    if not (is_sep | is_digit).all():
+        return None
+
+    separators = np.flatnonzero(is_sep)
+    ends = np.append(separators, len(data))
+    starts = np.insert(separators + 1, 0, 0)
+    number_lengths = ends - starts
+    if number_lengths.min() == 0 or number_lengths.max() > _MAX_DIGITS:
+        return None
+
+    # each digit is multiplied by its power of ten, and the digits of each number added together
+    numbers_before = np.cumsum(is_sep)
+    positions = np.flatnonzero(is_digit)
+    powers = ends[numbers_before[is_digit]] - 1 - positions
+    values = np.add.reduceat(digits[is_digit] * _POWERS_OF_TEN[powers], starts - np.arange(len(starts)))
+
+    # the separators inside each version string tell how many numbers it has. Before the end of each string there are
+    # the separators inside it and the previous strings, plus one joining each of the previous strings.
+    string_ends = np.cumsum(np.fromiter(map(len, column), dtype=np.int64, count=len(column)) + 1) - 1
+    separators_inside = np.concatenate(([0], numbers_before))[string_ends] - np.arange(len(column))
+    return np.diff(np.concatenate(([0], separators_inside))) + 1, values
@@ -1,14 +1,34 @@
+import gc
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import threading
 import unittest
-from unittest.mock import MagicMock
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import cmp_to_key
+from unittest.mock import MagicMock, patch
 
 import googlesearch
+import numpy as np
 import requests
 import requests_mock
+from bs4 import BeautifulSoup
 
-from DataScraper import SimpleWebScraper, CosineSummariser, SentenceSummariser, TextInsight
-from OverlappingLines import Line, two_lines_overlap, lines_overlap
+from Caches import LRUCache, SqliteCache, TieredCache
+from Corpus import CorpusBlock, PageCorpus
+from DataScraper import SimpleWebScraper, CosineSummariser, SentenceSummariser, TextInsight, extract_text_blocks, \
+    NON_CONTENT_TAGS, ProcessSummariser, RawPage, Scraper, best_parser
+from Instrumentation import Metrics, NullTrace
+from OverlappingLines import Line, LineIndex, LineSet, first_overlap, iter_overlaps, paused_gc, sort_lines, \
+    two_lines_overlap, lines_overlap
 from Searchers import GoogleSearcher, Searcher
-from VersionString import compare_version_strings
+from VersionString import Version, VersionIndex, compare_version_columns, compare_version_strings, dedupe_versions, \
+    max_version, parse_constraints, parse_version, sort_versions
 
 
 class TestingLineCreation(unittest.TestCase):
@@ -31,6 +51,45 @@ class TestingLineCreation(unittest.TestCase):
         self.assertRaises(RuntimeError, Line, "a", "b")
         self.assertRaises(RuntimeError, Line, 3, "4")
         self.assertRaises(RuntimeError, Line, "3", 2)
+        self.assertRaises(RuntimeError, Line, 3, 3.0)
+
+    def test_line_equality_and_order(self):
+        self.assertEqual(Line(1, 5), Line(5, 1))
+        self.assertNotEqual(Line(1, 5), Line(1, 6))
+        self.assertNotEqual(Line(1, 5), (1, 5))
+        self.assertEqual(len({Line(1, 5), Line(5, 1), Line(1.0, 5.0)}), 1)
+        self.assertEqual(sorted([Line(2, 3), Line(1, 9), Line(1, 4)]), [Line(1, 4), Line(1, 9), Line(2, 3)])
+        self.assertTrue(Line(1, 4) <= Line(1, 4) < Line(1, 5) <= Line(2, 3))
+        self.assertTrue(Line(2, 3) >= Line(1, 5) > Line(1, 4) >= Line(1, 4))
+        self.assertEqual(repr(Line(5, 1)), "Line(1, 5)")
+        self.assertFalse(hasattr(Line(1, 5), "__dict__"))
+
+    def test_bulk_line_creation(self):
+        self.assertEqual(Line.from_pairs([(1, 5), (7, 5), (2.5, 2)]), [Line(1, 5), Line(5, 7), Line(2, 2.5)])
+        self.assertEqual(Line.from_pairs(iter([(1, 5)])), [Line(1, 5)])
+        self.assertEqual(Line.from_arrays(np.array([1, 7]), np.array([5, 5])), [Line(1, 5), Line(5, 7)])
+        self.assertEqual(Line.from_pairs([]), [])
+        # the points are python numbers, not numpy scalars
+        self.assertIs(type(Line.from_arrays([1], [5])[0].x1), int)
+        # numbers numpy can't hold are checked one by one
+        self.assertEqual(Line.from_pairs([(2 ** 70, 1)]), [Line(1, 2 ** 70)])
+
+        self.assertRaises(RuntimeError, Line.from_pairs, [(1, 1)])
+        self.assertRaises(RuntimeError, Line.from_pairs, [("a", "b")])
+        self.assertRaises(RuntimeError, Line.from_pairs, [(1, "b")])
+        self.assertRaises(ValueError, Line.from_pairs, [(1, 2, 3)])
+        self.assertRaises(ValueError, Line.from_arrays, [1, 2], [3])
+        self.assertRaises(ValueError, Line.from_arrays, np.ones((2, 2)), np.zeros((2, 2)))
+        # the garbage collector is left alone
+        self.assertTrue(gc.isenabled())
+        with paused_gc():
+            self.assertFalse(gc.isenabled())
+            self.assertEqual(Line.from_pairs([(2, 1)]), [Line(1, 2)])
+        self.assertTrue(gc.isenabled())
+        with self.assertRaises(RuntimeError), paused_gc():
+            Line.from_pairs([(1, 1)])
+        self.assertTrue(gc.isenabled())
+        self.assertEqual(LineSet([1, 7], [5, 5]).to_lines(), [Line(1, 5), Line(5, 7)])
 
 
 class TestOverlappingLines(unittest.TestCase):
@@ -93,6 +152,183 @@ class TestOverlappingLines(unittest.TestCase):
         self.assertFalse(lines_overlap(line1, line2, line3, line4))
 
 
+class TestStreamingOverlaps(unittest.TestCase):
+    @staticmethod
+    def points(pairs):
+        return sorted(tuple(sorted(((line1.x1, line1.x2), (line2.x1, line2.x2)))) for line1, line2 in pairs)
+
+    def test_iter_overlaps(self):
+        rng = random.Random(0)
+        lines = [Line(x, x + rng.uniform(0.1, 3)) for x in (rng.uniform(0, 500) for _ in range(1000))]
+        expected = self.points((line1, line2) for i, line1 in enumerate(lines) for line2 in lines[i + 1:]
+                               if two_lines_overlap(line1, line2))
+        # in memory, spilling sorted chunks to disk, and already sorted
+        self.assertEqual(self.points(iter_overlaps(iter(lines))), expected)
+        self.assertEqual(self.points(iter_overlaps(iter(lines), chunk_size=64)), expected)
+        self.assertEqual(self.points(iter_overlaps(sorted(lines), presorted=True)), expected)
+
+        # pairs are reported while an unbounded sorted stream is read
+        pairs = iter_overlaps((Line(x, x + 1) for x in range(0, 10 ** 12, 1)), presorted=True)
+        self.assertEqual(self.points([next(pairs), next(pairs)]), [((0, 1), (1, 2)), ((1, 2), (2, 3))])
+        self.assertEqual(self.points(iter_overlaps([Line(1, 2), Line(3, 4), Line(5, 6), Line(6, 7)])),
+                         [((5, 6), (6, 7))])
+        self.assertEqual(list(iter_overlaps([Line(1, 2), Line(3, 4), Line(5, 6), Line(7, 8)])), [])
+
+    def test_first_overlap(self):
+        # an unbounded sorted stream stops at the first overlap
+        lines = (Line(x, x + 1) if x != 1000 else Line(x, x + 2.5) for x in range(0, 10 ** 12, 2))
+        line1, line2 = first_overlap(lines, presorted=True)
+        self.assertEqual((line1.x1, line1.x2, line2.x1, line2.x2), (1000, 1002.5, 1002, 1003))
+
+        self.assertIsNone(first_overlap([Line(7, 8), Line(1, 2), Line(5, 6), Line(3, 4)], chunk_size=2))
+        self.assertIsNotNone(first_overlap([Line(6, 7), Line(1, 2), Line(5, 6), Line(3, 4)], chunk_size=2))
+        self.assertIsNone(first_overlap([]))
+
+    def test_unsorted_presorted_lines(self):
+        self.assertRaises(ValueError, first_overlap, [Line(3, 4), Line(1, 2)], presorted=True)
+        self.assertRaises(ValueError, list, iter_overlaps([Line(3, 4), Line(1, 2)], presorted=True))
+
+    def test_sort_lines(self):
+        rng = random.Random(1)
+        lines = [Line(rng.randint(0, 100), 101) for _ in range(1000)]
+        self.assertEqual([line.x1 for line in sort_lines(lines, chunk_size=100)], sorted(line.x1 for line in lines))
+        self.assertEqual(list(sort_lines([])), [])
+        self.assertRaises(ValueError, list, sort_lines(lines, chunk_size=0))
+
+    def test_sort_lines_many_runs(self):
+        rng = random.Random(2)
+        lines = [Line(rng.randint(0, 1000), 1001) for _ in range(1000)]
+        # hundreds of runs are merged over several passes, all of them kept on two files
+        for chunk_size in (1, 3, 7):
+            with self.subTest(chunk_size=chunk_size):
+                with patch("tempfile.TemporaryFile", wraps=tempfile.TemporaryFile) as temporary_file:
+                    self.assertEqual([line.x1 for line in sort_lines(lines, chunk_size)],
+                                     sorted(line.x1 for line in lines))
+                self.assertLessEqual(temporary_file.call_count, 2)
+
+
+class TestLineSet(unittest.TestCase):
+    def test_line_set_creation(self):
+        line_set = LineSet([1, 7, 2.9], [5, 5, 2.901])
+        self.assertEqual([(line.x1, line.x2) for line in line_set], [(1, 5), (5, 7), (2.9, 2.901)])
+        self.assertEqual(len(line_set), 3)
+        self.assertEqual(line_set[1].x2, 7)
+
+        line_set = LineSet.from_lines([Line(1, 5), Line(7, 5)])
+        self.assertEqual(line_set.x1.tolist(), [1, 5])
+        self.assertEqual(line_set.x2.tolist(), [5, 7])
+
+    def test_invalid_line_set_creation(self):
+        self.assertRaises(RuntimeError, LineSet, ["a"], ["b"])
+        self.assertRaises(RuntimeError, LineSet, [1, 3], [2, 3])
+        self.assertRaises(ValueError, LineSet, [1, 3], [2])
+        # NaN is neither lower nor higher than any point, so it is rejected like by the constructor
+        self.assertRaises(RuntimeError, Line, float("nan"), 1.0)
+        self.assertRaises(RuntimeError, LineSet, [float("nan")], [1.0])
+        self.assertRaises(RuntimeError, LineSet, [0.0, 2.0], [1.0, float("nan")])
+        self.assertRaises(RuntimeError, Line.from_arrays, np.array([float("nan")]), np.array([1.0]))
+
+    def test_line_set_overlaps(self):
+        self.assertTrue(LineSet([1, 3, 5, 6], [2, 4, 6, 7]).overlaps())
+        self.assertTrue(LineSet([6.5, 1.5, 5.5, 3.5], [7.5, 2.5, 6.5, 4.5]).overlaps())
+        self.assertFalse(LineSet([1, 3, 5, 7], [2, 4, 6, 8]).overlaps())
+        self.assertFalse(LineSet([7.5, 1.5, 5.5, 3.5], [8.5, 2.5, 6.5, 4.5]).overlaps())
+        self.assertFalse(LineSet([], []).overlaps())
+        self.assertFalse(LineSet([1], [2]).overlaps())
+
+    def test_line_set_overlapping_pairs(self):
+        line_set = LineSet([0, 20, 1, 3, 12], [10, 30, 2, 4, 20])
+        pairs = sorted(tuple(sorted(pair)) for pair in line_set.overlapping_pairs().tolist())
+        self.assertEqual(pairs, [(0, 2), (0, 3), (1, 4)])
+
+        # same pairs as checking every pair of lines
+        x1 = np.random.RandomState(0).randint(0, 100, 200)
+        line_set = LineSet(x1, x1 + np.random.RandomState(1).randint(1, 10, 200))
+        expected = sorted((i, j) for i in range(200) for j in range(i + 1, 200)
+                          if two_lines_overlap(line_set[i], line_set[j]))
+        pairs = sorted(tuple(sorted(pair)) for pair in line_set.overlapping_pairs().tolist())
+        self.assertEqual(pairs, expected)
+        self.assertEqual(LineSet([1, 3], [2, 4]).overlapping_pairs().shape, (0, 2))
+
+    def test_line_set_merged(self):
+        merged = LineSet([5, 0, 1, 12, 20, 40], [6, 10, 2, 20, 30, 41]).merged()
+        self.assertEqual(list(zip(merged.x1.tolist(), merged.x2.tolist())), [(0, 10), (12, 30), (40, 41)])
+        self.assertEqual(len(LineSet([], []).merged()), 0)
+
+
+class TestLineIndex(unittest.TestCase):
+    def test_line_index_queries(self):
+        lines = [Line(1, 5), Line(7, 5), Line(10, 12), Line(20, 25), Line(21, 22)]
+        index = LineIndex(lines)
+        self.assertEqual(len(index), 5)
+        self.assertEqual(list(index), lines)
+
+        self.assertTrue(index.overlaps(Line(4, 4.5)))
+        self.assertTrue(index.overlaps(Line(12, 13)))
+        self.assertFalse(index.overlaps(Line(13, 19.9)))
+        self.assertFalse(LineIndex().overlaps(Line(1, 2)))
+
+        self.assertEqual(index.find_overlapping(Line(4, 11)), lines[:3])
+        self.assertEqual(index.find_overlapping(Line(26, 30)), [])
+        self.assertEqual(index.stab(5), lines[:2])
+        self.assertEqual(index.stab(21.5), lines[3:])
+        self.assertEqual(index.stab(0), [])
+
+    def test_line_index_insert_delete(self):
+        rng = random.Random(0)
+        index = LineIndex()
+        lines = []
+        for i in range(500):
+            if lines and rng.random() < 0.3:
+                line = lines.pop(rng.randrange(len(lines)))
+                index.delete(line)
+                self.assertNotIn(line, index)
+            else:
+                x1 = rng.randint(0, 1000)
+                line = Line(x1, x1 + rng.randint(1, 30))
+                lines.append(line)
+                index.insert(line)
+                self.assertIn(line, index)
+
+            if i % 50 == 0:
+                query = Line(rng.randint(0, 1000), rng.randint(0, 1000) + 0.5)
+                expected = sorted((line for line in lines if two_lines_overlap(line, query)), key=id)
+                self.assertEqual(sorted(index.find_overlapping(query), key=id), expected)
+                self.assertEqual(index.overlaps(query), bool(expected))
+                point = rng.randint(0, 1000)
+                self.assertEqual(sorted(index.stab(point), key=id),
+                                 sorted((line for line in lines if line.x1 <= point <= line.x2), key=id))
+        self.assertEqual(len(index), len(lines))
+        self.assertEqual([line.x1 for line in index], sorted(line.x1 for line in lines))
+
+        self.assertRaises(KeyError, index.delete, Line(1, 2))
+        self.assertRaises(RuntimeError, index.insert, (1, 2))
+
+    def test_line_index_duplicates(self):
+        line = Line(0, 3)
+        index = LineIndex([line, line, Line(5, 6)])
+        self.assertEqual(len(index), 2)
+        self.assertEqual(list(index), [line, Line(5, 6)])
+        index.delete(line)
+        self.assertEqual(len(index), 1)
+        self.assertFalse(index.overlaps(Line(0, 3)))
+        self.assertEqual(list(index), [Line(5, 6)])
+
+    def test_line_index_identity(self):
+        # the index holds line objects, equal lines are different entries
+        line = Line(1, 2)
+        equal = Line(1, 2)
+        index = LineIndex([line])
+        self.assertIn(line, index)
+        self.assertNotIn(equal, index)
+        self.assertRaises(KeyError, index.delete, equal)
+        index.insert(equal)
+        self.assertEqual(len(index), 2)
+        index.delete(line)
+        self.assertEqual(list(index), [equal])
+        self.assertIs(index.stab(1)[0], equal)
+
+
 class TestVersionString(unittest.TestCase):
     def test_valid_strings(self):
         string1 = "2.0.1"
@@ -137,6 +373,121 @@ class TestVersionString(unittest.TestCase):
         self.assertRaises(AttributeError, compare_version_strings, 3, 4)
         self.assertRaises(ValueError, compare_version_strings, "-2.0", "5.1.0")
         self.assertRaises(ValueError, compare_version_strings, "2.0.55", "5.1.0.-9")
+        self.assertRaises(ValueError, compare_version_strings, "2.a", "5.1")
+
+    def test_parse_version(self):
+        self.assertEqual(parse_version("2.0.1"), (2, 0, 1))
+        self.assertEqual(parse_version("02.00.01.0.00"), (2, 0, 1))
+        self.assertEqual(parse_version("0.0"), ())
+        self.assertEqual(parse_version("5;3;0", sep=";"), (5, 3))
+        self.assertRaises(ValueError, parse_version, "1.-2")
+        self.assertRaises(AttributeError, parse_version, 1.2)
+
+    def test_version(self):
+        self.assertEqual(Version("2.1"), Version("02.01.0"))
+        self.assertEqual(hash(Version("2.1")), hash(Version("02.01.0")))
+        self.assertEqual(Version("2,1", sep=","), Version("2.1"))
+        self.assertNotEqual(Version("2.1"), "2.1")
+        self.assertTrue(Version("0.0.021") < Version("0.0.100") <= Version("0.0.100.0") < Version("0.0.100.0.1"))
+        self.assertTrue(Version("0.10") > Version("0.0.0.5") >= Version("0.0.0.5"))
+        self.assertEqual(len({Version("1"), Version("1.0"), Version("1.0.1")}), 2)
+        self.assertEqual(str(Version("02.1")), "02.1")
+        self.assertEqual(repr(Version("02.1")), "Version('02.1')")
+
+    def test_compare_version_columns(self):
+        column1 = ["2.0.1", "5.00.21", "0.0.100", "0.10", "00.25.32.9", "00.025.32.9", "1"]
+        column2 = ["3.9.1", "05.00.021", "0.0.021", "0.0.0.5", "0.25", "0.25.32.09.1", "1.0.0.0.0"]
+        result = compare_version_columns(column1, column2)
+        self.assertIsInstance(result, np.ndarray)
+        self.assertEqual(result.tolist(), [-1, 0, 1, 1, 1, -1, 0])
+        self.assertEqual(result.tolist(), [compare_version_strings(v1, v2) for v1, v2 in zip(column1, column2)])
+
+        self.assertEqual(compare_version_columns(["5,5", "9,3"], ["5,2", "9,3"], sep=",").tolist(), [1, 0])
+        result = compare_version_columns(["5,5", "9,3"], ["9.2", "9.3.1"], sep=",", sep2=".")
+        self.assertEqual(result.tolist(), [-1, -1])
+        self.assertEqual(compare_version_columns([], []).tolist(), [])
+        # strings that are not only digits and separators are parsed with int, like compare_version_strings does
+        self.assertEqual(compare_version_columns([" 1.2", "1.+3"], ["1.2", "1.3"], sep=".").tolist(), [0, 0])
+        # numbers too big for numpy
+        self.assertEqual(compare_version_columns(["1." + str(2 ** 70)], ["1.5"]).tolist(), [1])
+        self.assertEqual(compare_version_columns(["1." + "9" * 18], ["1." + "9" * 17]).tolist(), [1])
+
+    def test_invalid_version_columns(self):
+        self.assertRaises(ValueError, compare_version_columns, ["1.0"], ["1.0", "2.0"])
+        self.assertRaises(ValueError, compare_version_columns, ["-2.0"], ["5.1.0"])
+        self.assertRaises(ValueError, compare_version_columns, ["2.0.55"], ["5.1.0.-9"])
+        self.assertRaises(ValueError, compare_version_columns, ["2.a"], ["5.1"])
+        self.assertRaises(AttributeError, compare_version_columns, [3.9], [4.2])
+
+    def test_bulk_versions(self):
+        versions = ["1.10", "1.2", "01.2.0", "0.9.9", "1.2.0.1", "1.10.0"]
+        self.assertEqual(sort_versions(versions), ["0.9.9", "1.2", "01.2.0", "1.2.0.1", "1.10", "1.10.0"])
+        self.assertEqual(sort_versions(versions, reverse=True)[:2], ["1.10", "1.10.0"])
+        self.assertEqual(sort_versions(["1;2", "1;1"], sep=";"), ["1;1", "1;2"])
+        self.assertEqual(max_version(versions), "1.10")
+        self.assertEqual(max_version(iter(["3", "10", "9"])), "10")
+        self.assertRaises(ValueError, max_version, [])
+        self.assertEqual(dedupe_versions(versions), ["1.10", "1.2", "0.9.9", "1.2.0.1"])
+        self.assertRaises(ValueError, sort_versions, ["1.2", "1.-1"])
+
+        # the bulk helpers agree with compare_version_strings
+        versions = ["{}.{}.{}".format(i % 3, i % 5, i % 2) for i in range(50)]
+        self.assertEqual([parse_version(v) for v in sort_versions(versions)],
+                         [parse_version(v) for v in sorted(versions, key=cmp_to_key(compare_version_strings))])
+
+    def test_parse_constraints(self):
+        self.assertEqual(parse_constraints(">=2.3, <3.0,!= 2.4.1,2"),
+                         [(">=", (2, 3)), ("<", (3,)), ("!=", (2, 4, 1)), ("==", (2,))])
+        self.assertEqual(parse_constraints(["<=1,2", ">0,9"], sep=","), [("<=", (1, 2)), (">", (0, 9))])
+        self.assertEqual(parse_constraints(""), [])
+        self.assertRaises(ValueError, parse_constraints, "~=2.1")
+        self.assertRaises(ValueError, parse_constraints, ">=2.-1")
+        # commas would split the versions themselves
+        self.assertRaises(ValueError, parse_constraints, ">=1,2", sep=",")
+
+    def test_version_index(self):
+        index = VersionIndex(["2.4.1", "3.0", "2.3", "2.10", "02.4.01", "1.9", "2.4"])
+        self.assertEqual(list(index), ["1.9", "2.3", "2.4", "2.4.1", "02.4.01", "2.10", "3.0"])
+        self.assertEqual(index.match(">=2.3,<3.0,!=2.4.1"), ["2.3", "2.4", "2.10"])
+        self.assertEqual(index.count(">=2.3,<3.0,!=2.4.1"), 3)
+        self.assertEqual(index.match("==2.4.1.0"), ["2.4.1", "02.4.01"])
+        self.assertEqual(index.match(">2.4,<=3"), ["2.4.1", "02.4.01", "2.10", "3.0"])
+        self.assertEqual(index.match(">3"), [])
+        self.assertEqual(index.match(">=2.4,<2.4"), [])
+        self.assertEqual(len(index.match("")), 7)
+        self.assertEqual(index.newest("<3,!=2.10"), "02.4.01")
+        self.assertEqual(index.newest(), "3.0")
+        self.assertIsNone(index.newest(">3"))
+        self.assertIn("2.4.1.0", index)
+        self.assertNotIn("2.5", index)
+
+        index.insert("2.5")
+        index.update(["0.1", "2.6", "2.5.0"])
+        self.assertEqual(index.match(">2.4.1,<2.10"), ["2.5", "2.5.0", "2.6"])
+        self.assertEqual(len(index), 11)
+
+        index = VersionIndex(["1;2", "1;10", "2"], sep=";")
+        self.assertEqual(index.match(["<2", "!=1;2"]), ["1;10"])
+
+        # the index agrees with checking every version with compare_version_strings
+        rng = random.Random(0)
+        versions = ["{}.{}.{}".format(rng.randrange(4), rng.randrange(12), rng.randrange(3)) for _ in range(500)]
+        index = VersionIndex(versions)
+        expected = [v for v in sort_versions(versions) if compare_version_strings(v, "1.2") >= 0 and
+                    compare_version_strings(v, "3.1") < 0 and compare_version_strings(v, "2.5.1") != 0]
+        self.assertEqual(index.match(">=1.2,<3.1,!=2.5.1"), expected)
+
+    def test_version_index_persistence(self):
+        index = VersionIndex(["1,2", "1,10", "1,2,0", "0,9"], sep=",")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "index.json")
+            index.save(path)
+            loaded = VersionIndex.load(path)
+        self.assertEqual((list(loaded), loaded.sep), (list(index), ","))
+        self.assertEqual(loaded.match([">=1,2"]), ["1,2", "1,2,0", "1,10"])
+        self.assertRaises(ValueError, loaded.match, ">=1,2")
+        loaded.insert("1,5")
+        self.assertEqual(loaded.newest(["<1,10"]), "1,5")
 
 
 class TestSearcher(unittest.TestCase):
@@ -154,6 +505,41 @@ class TestSearcher(unittest.TestCase):
         searcher.search("query", searcher=thing.search)
         self.assertEqual(searcher.urls, urls)
 
+    def test_search_cache(self):
+        urls = ["http://www.google.com/", "http://www.facebook.com/"]
+        search = MagicMock(return_value=urls)
+        searcher = GoogleSearcher(n_results=2, cache=LRUCache())
+        self.assertEqual(searcher.search("Some  Query", searcher=search), (urls, False))
+        self.assertEqual(searcher.search("some query", searcher=search), (urls, True))
+        self.assertEqual((searcher.urls, searcher.cache_hit), (urls, True))
+        self.assertEqual(search.call_count, 1)
+
+        # the number of results is part of the key
+        searcher.n_results = 3
+        searcher.search("some query", searcher=search)
+        self.assertEqual(search.call_count, 2)
+
+    def test_search_cache_in_flight(self):
+        release = threading.Event()
+        calls = []
+
+        def slow_search(query, stop):
+            calls.append(query)
+            release.wait(1)
+            return ["http://www.google.com/"]
+
+        cache = LRUCache()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            searchers = [GoogleSearcher(cache=cache) for _ in range(4)]
+            futures = [executor.submit(searcher.search, "query", searcher=slow_search) for searcher in searchers]
+            time.sleep(0.05)
+            release.set()
+            for future in futures:
+                future.result()
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(searcher.urls == ["http://www.google.com/"] for searcher in searchers))
+
 
 class TestWebScraper(unittest.TestCase):
     def test_web_scraper(self):
@@ -173,6 +559,252 @@ class TestWebScraper(unittest.TestCase):
         self.assertTrue(len(p_list) is 2)
         self.assertEqual(p_list[0].text, "This webpage is used for testing")
 
+    def test_web_scraper_own_session(self):
+        scraper = SimpleWebScraper(pool_size=4, retries=2)
+        adapter = requests_mock.Adapter()
+        scraper.session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://anyurl.com", text="<html><p>pooled</p></html>")
+
+        # without a getter, the scraper uses its own session, and keeps the same one between calls
+        soup = scraper.get_soup("mock://anyurl.com")
+        self.assertEqual(soup.find('p').text, "pooled")
+        self.assertIs(scraper.session, scraper.session)
+
+        http_adapter = scraper.session.get_adapter("https://anyurl.com")
+        self.assertEqual(http_adapter._pool_maxsize, 4)
+        self.assertEqual(http_adapter.max_retries.total, 2)
+
+        scraper.close()
+        self.assertIsNone(scraper._session)
+
+    def test_web_scraper_max_bytes(self):
+        scraper = SimpleWebScraper(max_bytes=20, chunk_size=8)
+        adapter = requests_mock.Adapter()
+        scraper.session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://anyurl.com", text="<p>short</p><p>" + "long " * 1000 + "</p>")
+
+        page = scraper.fetch("mock://anyurl.com")
+        self.assertEqual(page.content, b"<p>short</p><p>long ")
+
+    def test_web_scraper_max_bytes_multibyte(self):
+        body = "<p>café ünïcode " + "é" * 100 + "</p>"
+        adapter = requests_mock.Adapter()
+        adapter.register_uri(method="GET", url="mock://anyurl.com", content=body.encode(),
+                             headers={"Content-Type": "text/html; charset=utf-8"})
+        # every limit, including the ones that cut a character in half, keeps the page in its encoding
+        for max_bytes in range(20, 30):
+            with self.subTest(max_bytes=max_bytes):
+                scraper = SimpleWebScraper(max_bytes=max_bytes, chunk_size=8)
+                scraper.session.mount('mock', adapter)
+                page = scraper.fetch("mock://anyurl.com")
+                self.assertLessEqual(len(page.content), max_bytes)
+                text = scraper.parse(page).get_text()
+                self.assertTrue(body[3:].startswith(text), text)
+                self.assertGreaterEqual(len(text.encode()), max_bytes - 3 - 1)
+
+    def test_web_scraper_tag_filtering(self):
+        page = RawPage("mock://anyurl.com", b"<html><head><style>p {}</style></head><body><nav>menu</nav>"
+                                            b"<p>first<script>var a;</script></p><div><p>second</p></div>"
+                                            b"</body></html>")
+
+        soup = SimpleWebScraper(strip_tags=NON_CONTENT_TAGS).parse(page)
+        self.assertEqual(soup.find_all(["script", "style"]), [])
+        self.assertEqual(soup.find('p').text, "first")
+
+        soup = SimpleWebScraper(only_tags=["p"]).parse(page)
+        self.assertEqual([tag.name for tag in soup.find_all()], ["p", "script", "p"])
+        self.assertIsNone(soup.find("nav"))
+
+    def test_web_scraper_parser(self):
+        self.assertIn(best_parser(), ("lxml", "html.parser"))
+        self.assertEqual(SimpleWebScraper(parser=None).parser, best_parser())
+        self.assertEqual(SimpleWebScraper().parser, "html.parser")
+
+    def test_web_scraper_error(self):
+        scraper = SimpleWebScraper(retries=0)
+        adapter = requests_mock.Adapter()
+        scraper.session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://anyurl.com", status_code=404)
+        self.assertRaises(requests.HTTPError, scraper.get_soup, "mock://anyurl.com")
+
+    def test_web_scraper_cache(self):
+        cache = LRUCache()
+        scraper = SimpleWebScraper(cache=cache)
+        adapter = requests_mock.Adapter()
+        scraper.session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://anyurl.com", text="<p>cached</p>")
+
+        self.assertEqual(scraper.get_soup("mock://anyurl.com").find('p').text, "cached")
+        self.assertEqual(scraper.get_soup("mock://anyurl.com").find('p').text, "cached")
+        self.assertEqual(adapter.call_count, 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_web_scraper_cache_revalidation(self):
+        cache = LRUCache()
+        scraper = SimpleWebScraper(cache=cache)
+        adapter = requests_mock.Adapter()
+        scraper.session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://anyurl.com", response_list=[
+            {"text": "<p>first</p>", "headers": {"ETag": '"v1"', "Cache-Control": "max-age=0"}},
+            {"status_code": 304, "headers": {"Cache-Control": "max-age=0"}},
+            {"text": "<p>second</p>", "headers": {"ETag": '"v2"'}},
+        ])
+
+        self.assertEqual(scraper.get_soup("mock://anyurl.com").find('p').text, "first")
+        # stale, but not modified on the server
+        self.assertEqual(scraper.get_soup("mock://anyurl.com").find('p').text, "first")
+        self.assertEqual(adapter.last_request.headers["If-None-Match"], '"v1"')
+        # stale, and modified on the server
+        self.assertEqual(scraper.get_soup("mock://anyurl.com").find('p').text, "second")
+        # fresh for the default cache_ttl
+        self.assertEqual(scraper.get_soup("mock://anyurl.com").find('p').text, "second")
+        self.assertEqual(adapter.call_count, 3)
+        # only the fresh copy is a hit, the stale copy downloaded again is a miss
+        self.assertEqual((cache.hits, cache.misses, cache.revalidations), (1, 2, 1))
+
+
+class TestCaches(unittest.TestCase):
+    def test_lru_cache(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        # "b" was the least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (3, 1, 1))
+
+    def test_lru_cache_size(self):
+        cache = LRUCache(max_size=10)
+        cache.set("a", "aaaaa", size=5)
+        cache.set("b", "bbbbb", size=5)
+        cache.set("c", "cc", size=2)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("a"))
+        # bigger than the whole cache, never stored
+        cache.set("d", "d" * 11, size=11)
+        self.assertIsNone(cache.get("d"))
+
+    def test_cache_ttl(self):
+        cache = LRUCache(ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=0.01)
+        time.sleep(0.02)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+
+    def test_sqlite_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite")
+            cache = SqliteCache(path, max_entries=2)
+            cache.set("a", [1, 2])
+            cache.set(("b", 5), {"b": 2})
+            cache.get("a")
+            cache.set("c", 3)
+            cache.close()
+
+            # entries survive between instances
+            cache = SqliteCache(path, max_entries=2)
+            self.assertEqual(cache.get("a"), [1, 2])
+            self.assertIsNone(cache.get(("b", 5)))
+            self.assertEqual(cache.get("c"), 3)
+            cache.close()
+
+    def test_sqlite_cache_bounds(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SqliteCache(os.path.join(directory, "cache.sqlite"), max_entries=3, max_size=10)
+            cache.set("a", "a", size=4)
+            cache.set("b", "b", size=4)
+            # lookups only remember the access time, without writing to the database
+            changes = cache._connection.total_changes
+            self.assertEqual(cache.get("a"), "a")
+            self.assertEqual(cache._connection.total_changes, changes)
+            # b is the least recently used, and removing it is enough to free the space
+            cache.set("c", "c", size=4)
+            self.assertEqual((len(cache), cache.evictions), (2, 1))
+            self.assertIsNone(cache.get("b"))
+            # replacing an entry frees its old size
+            cache.set("c", "c", size=2)
+            cache.set("d", "d", size=2)
+            cache.set("e", "e", size=1)
+            self.assertEqual(len(cache), 3)
+            self.assertEqual([cache.get(key) for key in "acde"], [None, "c", "d", "e"])
+            cache.close()
+
+    def test_tiered_cache(self):
+        memory = LRUCache(max_entries=1)
+        disk = LRUCache(max_entries=10)
+        cache = TieredCache(memory, disk)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertIsNone(memory.get("a"))
+        # found on the slow tier, and copied to the fast one
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(memory.get("a"), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+
+class TestCorpus(unittest.TestCase):
+    def test_page_corpus(self):
+        corpus = PageCorpus()
+        blocks = [CorpusBlock("mock://a.com", 0, "p", "Python snake python", {"python": 2, "snake": 1}),
+                  CorpusBlock("mock://a.com", 1, "p", "1 2", {})]
+        self.assertTrue(corpus.add("mock://a.com", "hash", blocks))
+        # same content, nothing to do
+        self.assertFalse(corpus.add("mock://a.com", "hash", []))
+        self.assertIn("mock://a.com", corpus)
+        self.assertEqual(corpus.content_hash("mock://a.com"), "hash")
+        self.assertEqual([(block.position, block.tag, block.text, block.terms)
+                          for block in corpus.blocks("mock://a.com")],
+                         [(0, "p", "Python snake python", {"python": 2, "snake": 1}), (1, "p", "1 2", {})])
+
+        corpus.add("mock://b.com", "hash",
+                   [CorpusBlock("mock://b.com", 0, "p", "python java", {"python": 1, "java": 1})])
+        corpus.add("mock://c.com", "hash", [CorpusBlock("mock://c.com", 0, "p", "java", {"java": 1})])
+        self.assertEqual(corpus.search(["python", "java"]), ["mock://b.com", "mock://a.com", "mock://c.com"])
+        self.assertEqual(corpus.search(["python"], limit=1), ["mock://a.com"])
+        self.assertEqual(corpus.search(["rust"]), [])
+
+        # a new content replaces the blocks of the page
+        corpus.add("mock://a.com", "new hash", [CorpusBlock("mock://a.com", 0, "p", "rust", {"rust": 1})])
+        self.assertEqual([block.text for block in corpus.blocks("mock://a.com")], ["rust"])
+        self.assertEqual(corpus.search(["python"]), ["mock://b.com"])
+        corpus.remove("mock://b.com")
+        self.assertEqual(len(corpus), 2)
+        self.assertEqual(corpus.blocks("mock://b.com"), [])
+        corpus.close()
+
+    def test_page_corpus_persistence(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "corpus.sqlite")
+            corpus = PageCorpus(path)
+            corpus.add("mock://a.com", "hash", [CorpusBlock("mock://a.com", 0, "p", "python", {"python": 1})])
+            corpus.close()
+            corpus = PageCorpus(path)
+            self.assertEqual(corpus.search(["python"]), ["mock://a.com"])
+            corpus.close()
+
+    def test_cosine_summariser_corpus(self):
+        soups = {
+            "mock://a.com": BeautifulSoup("<p>render it on a browser</p><p>nothing to see</p>", "html.parser"),
+            "mock://b.com": BeautifulSoup("", "html.parser"),
+            "mock://c.com": BeautifulSoup("<p>1 2</p>", "html.parser"),
+            "mock://d.com": BeautifulSoup("<p>something else</p><div>render <b>it</b> somewhere</div>", "html.parser"),
+        }
+        corpus = PageCorpus()
+        for use_idf in (False, True):
+            cosine_summariser = CosineSummariser(use_idf=use_idf)
+            for url, soup in soups.items():
+                corpus.add(url, str(use_idf), cosine_summariser.corpus_blocks(soup, url))
+            for query in ("render it on a browser", "something", "see it"):
+                summaries = cosine_summariser.summarise_corpus(corpus, list(soups), query)
+                self.assertEqual(summaries, cosine_summariser.summarise_many(list(soups.values()), query))
+        self.assertEqual((summaries[3].tag, summaries[3].path), ("div", "/div[1]"))
+        self.assertEqual(cosine_summariser.summarise_corpus(corpus, ["mock://b.com", "mock://x.com"], "query"),
+                         [None, None])
+
 
 class TestTextSummariser(unittest.TestCase):
     def test_cosine_summariser(self):
@@ -193,6 +825,104 @@ class TestTextSummariser(unittest.TestCase):
         self.assertEqual(summary.text, "probably, it wouldn't do much if you render it on a browser, though you can "
                                        "still see the webpage")
 
+    def test_cosine_summariser_reuse(self):
+        cosine_summariser = CosineSummariser()
+        first = BeautifulSoup("<p>render it on a browser</p>", "html.parser")
+        second = BeautifulSoup("<p>something else</p><p>render it somewhere</p>", "html.parser")
+        self.assertEqual(cosine_summariser.summarise(first, "render it on a browser").text, "render it on a browser")
+        # the tags of the first page are not scored again
+        self.assertEqual(cosine_summariser.summarise(second, "render it on a browser").text, "render it somewhere")
+        # pages without words have no summary
+        self.assertIsNone(cosine_summariser.summarise(BeautifulSoup("", "html.parser"), "query"))
+        self.assertIsNone(cosine_summariser.summarise(BeautifulSoup("<p>1 2</p>", "html.parser"), "query"))
+
+    def test_cosine_summariser_many(self):
+        soups = [
+            BeautifulSoup("<p>render it on a browser</p><p>nothing to see</p>", "html.parser"),
+            BeautifulSoup("", "html.parser"),
+            BeautifulSoup("<p>1 2</p>", "html.parser"),
+            BeautifulSoup("<p>something else</p><p>render it somewhere</p>", "html.parser"),
+        ]
+        for use_idf in (False, True):
+            summaries = CosineSummariser(use_idf=use_idf).summarise_many(soups, "render it on a browser")
+            self.assertEqual(summaries[0].text, "render it on a browser")
+            self.assertIsNone(summaries[1])
+            self.assertIsNone(summaries[2])
+            self.assertEqual(summaries[3].text, "render it somewhere")
+
+        # without idf, sharing the vocabulary gives the same result as summarising each page on its own
+        cosine_summariser = CosineSummariser()
+        for query in ("render it", "browser somewhere"):
+            # words of the query that are only on other pages don't change the scores of a page
+            summaries = cosine_summariser.summarise_many(soups, query)
+            expected = [cosine_summariser.summarise(soup, query) for soup in soups]
+            self.assertEqual([summary and summary.text for summary in summaries],
+                             [summary and summary.text for summary in expected])
+            self.assertEqual([summary and round(summary.score, 9) for summary in summaries],
+                             [summary and round(summary.score, 9) for summary in expected])
+        # "browser" is one of the four words of the block
+        self.assertAlmostEqual(summaries[0].score, 0.5)
+
+        # nor do words that are only on the pages of other queries
+        python = BeautifulSoup("<p>python snake</p><p>other words</p>", "html.parser")
+        java = BeautifulSoup("<p>java coffee</p>", "html.parser")
+        batch = cosine_summariser.summarise_queries([[python], [python, java]], ["python java", "python java"])
+        single = cosine_summariser.summarise(python, "python java")
+        self.assertAlmostEqual(single.score, 0.5 ** 0.5)
+        self.assertEqual([batch[0][0].score, batch[1][0].score], [single.score, single.score])
+
+    def test_extract_text_blocks(self):
+        soup = BeautifulSoup("<html><head><title>Title</title><style>p {}</style></head><body>"
+                             "<div>loose <b>bold</b><div><p>first <i>paragraph</i></p></div>"
+                             "<ul><li>item <p>nested</p> tail</li></ul></div>"
+                             "<script>var a = 1;</script><!-- comment --><p>   </p></body></html>", "html.parser")
+        blocks = extract_text_blocks(soup)
+        self.assertEqual([(block.tag.name, block.text) for block in blocks], [
+            ("title", "Title"), ("div", "loose bold"), ("p", "first paragraph"), ("li", "item  tail"), ("p", "nested")
+        ])
+        text = soup.get_text()
+        start, end = blocks[2].extent
+        self.assertEqual(text[start:end], "first paragraph")
+        # the extent of the li block covers the nested paragraph, which is not part of its text
+        start, end = blocks[3].extent
+        self.assertEqual((start, end), (blocks[4].extent[0] - 5, blocks[4].extent[1] + 5))
+        self.assertEqual(text[start:end], "item nested tail")
+        # even when the nested blocks come after all of its own text
+        trailing_soup = BeautifulSoup("<div>Intro <p>para text</p></div>", "html.parser")
+        div, paragraph = extract_text_blocks(trailing_soup)
+        self.assertEqual(div.text, "Intro ")
+        self.assertEqual(trailing_soup.get_text()[div.extent[0]:div.extent[1]], "Intro para text")
+        self.assertEqual(paragraph.extent, (6, 15))
+
+        # nested text is scored only once, on its own block
+        summary = CosineSummariser().summarise(soup, "nested")
+        self.assertEqual(summary.tag, "p")
+        self.assertEqual(summary.text, "nested")
+
+    def test_block_summary(self):
+        soup = BeautifulSoup("<html><body><div>first</div><div><p>skip</p><p>render it on a browser</p></div>"
+                             "</body></html>", "html.parser")
+        summary = CosineSummariser().summarise(soup, "render it on a browser")
+        self.assertEqual((summary.text, summary.tag, summary.path), ("render it on a browser", "p",
+                                                                     "/html[1]/body[1]/div[2]/p[2]"))
+        self.assertEqual(soup.get_text()[summary.extent[0]:summary.extent[1]], "render it on a browser")
+        self.assertAlmostEqual(summary.score, 1.0)
+        self.assertEqual(pickle.loads(pickle.dumps(summary)), summary)
+
+        # the summary keeps nothing of the soup alive
+        soup_reference = weakref.ref(soup)
+        del soup
+        gc.collect()
+        self.assertIsNone(soup_reference())
+        self.assertEqual(summary.get_text(), "render it on a browser")
+
+    def test_lazy_imports(self):
+        # importing the module doesn't import, nor download, anything for the summarisers
+        code = "import sys, DataScraper; print('nltk' in sys.modules, 'sklearn' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, check=True).stdout
+        self.assertEqual(output.split(), [b"False", b"False"])
+
     def test_sentence_summariser(self):
         session = requests.Session()
         adapter = requests_mock.Adapter()
@@ -209,6 +939,15 @@ class TestTextSummariser(unittest.TestCase):
         sentence_summariser = SentenceSummariser()
         summary = sentence_summariser.summarise(soup, "much")
         self.assertEqual(summary, "\n[...], it would n't do much if you render it on")
+        # the summary doesn't accumulate when the summariser is reused
+        self.assertEqual(sentence_summariser.summarise(soup, "much"), summary)
+
+    def test_sentence_summariser_tokens(self):
+        sentence_summariser = SentenceSummariser()
+        self.assertEqual(sentence_summariser.get_as_tokens("  render, it on a  browser!"),
+                         ["render", "it", "on", "a", "browser"])
+        self.assertEqual(sentence_summariser.get_retroactively(2, ["a", "b", "c", "d"], 3), "\n[...]b c")
+        self.assertEqual(sentence_summariser.get_retroactively(5, ["a", "b", "c", "d"], 1), "\n[...]a")
 
 
 class TestTextInsight(unittest.TestCase):
@@ -243,6 +982,395 @@ class TestTextInsight(unittest.TestCase):
         self.assertEqual(insights[0].summary.text, "probably, it wouldn't do much if you render it on a browser, "
                                                    "though you can still see the webpage")
 
+    def test_text_insighter_concurrent(self):
+        searcher = Searcher()
+        searcher.search = MagicMock()
+        searcher.urls = ["mock://slow.com", "mock://medium.com", "mock://fast.com"]
+
+        session = requests.Session()
+        adapter = requests_mock.Adapter()
+        session.mount('mock', adapter)
+        for url in searcher.urls:
+            adapter.register_uri(method="GET", url=url, text="<html><p>page from {}</p></html>".format(url))
+
+        delays = {"mock://slow.com": 0.3, "mock://medium.com": 0.2, "mock://fast.com": 0.1}
+
+        def slow_getter(url, timeout=None):
+            time.sleep(delays[url])
+            return session.get(url, timeout=timeout)
+
+        text_insighter = TextInsight(searcher, SimpleWebScraper(), CosineSummariser(), workers=3, timeout=5)
+        start = time.time()
+        insights = text_insighter.get("page", slow_getter)
+        elapsed = time.time() - start
+
+        # results keep the search rank order, even though the fast page finished first
+        self.assertEqual([insight.url for insight in insights], searcher.urls)
+        self.assertEqual(insights[2].summary.text, "page from mock://fast.com")
+        # the downloads overlap, so it takes about as long as the slowest page and not the sum of all of them
+        self.assertLess(elapsed, 0.55)
+
+    def slow_text_insighter(self, delays: dict, **kwargs) -> tuple:
+        searcher = Searcher()
+        searcher.search = MagicMock()
+        searcher.urls = list(delays)
+
+        session = requests.Session()
+        adapter = requests_mock.Adapter()
+        session.mount('mock', adapter)
+        for url in searcher.urls:
+            adapter.register_uri(method="GET", url=url, text="<html><p>page from {}</p></html>".format(url))
+
+        def slow_getter(url, timeout=None):
+            time.sleep(delays[url])
+            return session.get(url, timeout=timeout)
+
+        return TextInsight(searcher, SimpleWebScraper(), CosineSummariser(), **kwargs), slow_getter
+
+    def test_text_insighter_iter_get(self):
+        delays = {"mock://slow.com": 0.3, "mock://empty.com": 0.0, "mock://fast.com": 0.1}
+        text_insighter, getter = self.slow_text_insighter(delays, workers=3)
+        insights = list(text_insighter.iter_get("page", getter))
+        # in the order they finish, keeping their rank
+        self.assertEqual([(insight.url, insight.rank) for insight in insights],
+                         [("mock://empty.com", 1), ("mock://fast.com", 2), ("mock://slow.com", 0)])
+        self.assertEqual(insights[1].summary.text, "page from mock://fast.com")
+
+    def test_text_insighter_iter_get_first(self):
+        delays = {"mock://slow.com": 0.5, "mock://fast.com": 0.0, "mock://never.com": 0.0}
+        # stops on the first summary, without waiting for the slow page
+        text_insighter, getter = self.slow_text_insighter(delays, workers=2)
+        start = time.time()
+        insights = list(text_insighter.iter_get("page", getter, first=1))
+        self.assertEqual([insight.url for insight in insights], ["mock://fast.com"])
+        self.assertLess(time.time() - start, 0.3)
+
+    def test_text_insighter_iter_get_time_budget(self):
+        delays = {"mock://slow.com": 0.5, "mock://fast.com": 0.0}
+        text_insighter, getter = self.slow_text_insighter(delays, workers=2)
+        start = time.time()
+        insights = list(text_insighter.iter_get("page", getter, time_budget=0.2))
+        self.assertEqual([insight.url for insight in insights], ["mock://fast.com"])
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_text_insighter_processes(self):
+        delays = {"mock://first.com": 0.3, "mock://second.com": 0.0}
+        text_insighter, getter = self.slow_text_insighter(delays, processes=2)
+        try:
+            insights = text_insighter.get("page", getter)
+            self.assertEqual([insight.summary.text for insight in insights],
+                             ["page from mock://first.com", "page from mock://second.com"])
+            insights = list(text_insighter.iter_get("page", getter, first=1))
+            self.assertEqual(insights[0].summary.text, "page from mock://second.com")
+        finally:
+            text_insighter.close()
+
+    def test_text_insighter_processes_idf(self):
+        delays = {"mock://first.com": 0.0, "mock://second.com": 0.0}
+        text_insighter, getter = self.slow_text_insighter(delays)
+        text_insighter.summariser = CosineSummariser(use_idf=True)
+        expected = [insight.summary.score for insight in text_insighter.get("page first", getter)]
+        # the idf is computed over every page of the request, so they are summarised together on this process
+        text_insighter.processes = 2
+        self.assertFalse(text_insighter.summarises_in_processes)
+        self.assertEqual([insight.summary.score for insight in text_insighter.get("page first", getter)], expected)
+        self.assertEqual([insight.summary.score for insight in text_insighter.get_many(["page first"], getter)[0]],
+                         expected)
+        self.assertIsNone(text_insighter._process_summariser)
+
+    def test_text_insighter_get_soup_scraper(self):
+        class SoupScraper(Scraper):
+            def get_soup(self, url, getter=None, timeout=None):
+                return BeautifulSoup("<p>soup of {}</p><p>other</p>".format(url), "html.parser")
+
+        searcher = Searcher()
+        searcher.search = MagicMock()
+        searcher.urls = ["mock://first.com", "mock://second.com"]
+        # scrapers that only implement get_soup are used through it, even when processes are asked for
+        for kwargs in ({}, {"workers": 2, "partial": True}, {"processes": 2}, {"corpus": PageCorpus()}):
+            with self.subTest(**kwargs):
+                text_insighter = TextInsight(searcher, SoupScraper(), CosineSummariser(), **kwargs)
+                self.assertEqual([insight.summary.text for insight in text_insighter.get("soup")],
+                                 ["soup of mock://first.com", "soup of mock://second.com"])
+                self.assertEqual([insights[0].summary.text for insights in text_insighter.get_many(["soup"])],
+                                 ["soup of mock://first.com"])
+                self.assertEqual(sorted(insight.summary.text for insight in text_insighter.iter_get("soup")),
+                                 ["soup of mock://first.com", "soup of mock://second.com"])
+                self.assertIsNone(text_insighter._process_summariser)
+
+    def test_text_insighter_baseline_get_soup_scraper(self):
+        class BaselineScraper(Scraper):
+            def get_soup(self, url, getter=requests.get):
+                return BeautifulSoup(getter(url).text, "html.parser")
+
+        searcher = Searcher()
+        searcher.search = MagicMock()
+        searcher.urls = ["mock://first.com"]
+        # scrapers written to the original two argument interface are called without a timeout, and use their own
+        # default getter unless one is given
+        with requests_mock.Mocker() as mocker:
+            mocker.get("mock://first.com", text="<p>soup of mock://first.com</p><p>other</p>")
+            for kwargs in ({}, {"timeout": 5}, {"deadline": 5, "workers": 2}):
+                with self.subTest(**kwargs):
+                    text_insighter = TextInsight(searcher, BaselineScraper(), CosineSummariser(), **kwargs)
+                    self.assertEqual([insight.summary.text for insight in text_insighter.get("soup")],
+                                     ["soup of mock://first.com"])
+                    self.assertEqual([insight.summary.text for insight in text_insighter.get("soup", requests.get)],
+                                     ["soup of mock://first.com"])
+
+    def test_text_insighter_shared_searcher(self):
+        class InterleavedSearcher(Searcher):
+            def search(self, query, **kwargs):
+                result = super().search(query, **kwargs)
+                # another request sharing the searcher searches before this one gets to its pages
+                super().search("other " + query)
+                return result
+
+        class LegacySearcher(Searcher):
+            def search(self, query, **kwargs):
+                self.urls = ["mock://legacy.com"]
+
+        class SoupScraper(Scraper):
+            def get_soup(self, url, getter=None, timeout=None):
+                return BeautifulSoup("<p>soup of {}</p>".format(url), "html.parser")
+
+        searcher = InterleavedSearcher()
+        searcher.fetch_urls = lambda query: ["mock://{}.com".format(query.replace(" ", "-"))]
+        text_insighter = TextInsight(searcher, SoupScraper(), CosineSummariser())
+        self.assertEqual([insight.url for insight in text_insighter.get("soup")], ["mock://soup.com"])
+        self.assertEqual([[insight.url for insight in insights] for insights in text_insighter.get_many(["a", "b"])],
+                         [["mock://a.com"], ["mock://b.com"]])
+        self.assertEqual([insight.url for insight in text_insighter.iter_get("soup")], ["mock://soup.com"])
+
+        # searchers whose search returns nothing are read from their urls
+        text_insighter = TextInsight(LegacySearcher(), SoupScraper(), CosineSummariser())
+        self.assertEqual([insight.url for insight in text_insighter.get("soup")], ["mock://legacy.com"])
+
+    def flaky_text_insighter(self, **kwargs) -> tuple:
+        delays = {"mock://slow.com": 1.0, "mock://broken.com": 0.0, "mock://fast.com": 0.0}
+        text_insighter, slow_getter = self.slow_text_insighter(delays, **kwargs)
+
+        def getter(url, timeout=None):
+            if url == "mock://broken.com":
+                raise requests.ConnectionError("connection refused")
+            return slow_getter(url, timeout)
+
+        return text_insighter, getter
+
+    def test_text_insighter_partial(self):
+        text_insighter, getter = self.flaky_text_insighter(workers=3, deadline=0.3, partial=True)
+        start = time.time()
+        insights = text_insighter.get("page", getter)
+        # the slow page is given up on at the deadline, and the broken one doesn't fail the others
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual([(insight.url, insight.rank, insight.status) for insight in insights],
+                         [("mock://slow.com", 0, "timeout"), ("mock://broken.com", 1, "error"),
+                          ("mock://fast.com", 2, "ok")])
+        self.assertEqual([insight.summary for insight in insights[:2]], [None, None])
+        self.assertEqual(insights[1].error, "ConnectionError: connection refused")
+        self.assertTrue(insights[0].error.startswith("TimeoutError"))
+        self.assertEqual((insights[2].summary.text, insights[2].error), ("page from mock://fast.com", None))
+
+        statuses = [(insight.url, insight.status) for insight in text_insighter.iter_get("page", getter)]
+        self.assertIn(("mock://broken.com", "error"), statuses)
+
+    def test_text_insighter_iter_get_deadline(self):
+        text_insighter, getter = self.flaky_text_insighter(workers=3, deadline=0.2, hedge_after=0.05, partial=True,
+                                                           metrics=Metrics())
+        trace = text_insighter.trace()
+        start = time.time()
+        insights = list(text_insighter.iter_get("page", getter, trace=trace))
+        # the slow page is hedged, and given up on at the deadline, which is the last summary yielded
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual(sorted((insight.url, insight.status) for insight in insights),
+                         [("mock://broken.com", "error"), ("mock://fast.com", "ok"), ("mock://slow.com", "timeout")])
+        self.assertEqual(insights[-1].url, "mock://slow.com")
+        self.assertEqual(trace.counters["fetch.hedged"], 1)
+
+    def test_text_insighter_not_partial(self):
+        text_insighter, getter = self.flaky_text_insighter()
+        self.assertRaises(requests.ConnectionError, text_insighter.get, "page", getter)
+        self.assertRaises(requests.ConnectionError, lambda: list(text_insighter.iter_get("page", getter)))
+        # the first page that failed, in rank order, is raised
+        text_insighter, getter = self.flaky_text_insighter(workers=3, deadline=0.2)
+        self.assertRaises(TimeoutError, text_insighter.get, "page", getter)
+
+    def test_text_insighter_hedged(self):
+        calls = []
+        text_insighter, slow_getter = self.slow_text_insighter({"mock://straggler.com": 0.0, "mock://fast.com": 0.0},
+                                                               workers=2, hedge_after=0.1, metrics=Metrics())
+
+        def getter(url, timeout=None):
+            calls.append(url)
+            if calls.count(url) == 1 and url == "mock://straggler.com":
+                time.sleep(1.0)
+            return slow_getter(url, timeout)
+
+        start = time.time()
+        insights = text_insighter.get("page", getter)
+        # the second request of the straggler finishes long before the first one
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual([insight.summary.text for insight in insights],
+                         ["page from mock://straggler.com", "page from mock://fast.com"])
+        self.assertEqual(calls.count("mock://straggler.com"), 2)
+        self.assertEqual(calls.count("mock://fast.com"), 1)
+        self.assertEqual(insights.trace.counters["fetch.hedged"], 1)
+
+    def multi_query_text_insighter(self, **kwargs) -> tuple:
+        results = {
+            "python page": ["mock://python.com", "mock://shared.com"],
+            "java page": ["mock://shared.com", "mock://java.com"],
+            "shared page": ["mock://shared.com"],
+        }
+        searcher = Searcher()
+        searcher.fetch_urls = lambda query: results[query]
+
+        session = requests.Session()
+        adapter = requests_mock.Adapter()
+        session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://python.com", text="<p>python page</p><p>other</p>")
+        adapter.register_uri(method="GET", url="mock://java.com", text="<p>java page</p><p>other</p>")
+        adapter.register_uri(method="GET", url="mock://shared.com",
+                             text="<p>a python snake</p><p>java coffee</p><p>shared words</p>")
+        downloads = []
+
+        def getter(url, timeout=None):
+            downloads.append(url)
+            return session.get(url, timeout=timeout)
+
+        return TextInsight(searcher, SimpleWebScraper(), CosineSummariser(), **kwargs), getter, downloads
+
+    def test_text_insighter_get_many(self):
+        text_insighter, getter, downloads = self.multi_query_text_insighter(workers=2)
+        queries = ["Python page", "java page", "shared page"]
+        batch = text_insighter.get_many(queries, getter)
+        # every page is downloaded once, even if many queries found it
+        self.assertEqual(sorted(downloads), ["mock://java.com", "mock://python.com", "mock://shared.com"])
+
+        self.assertEqual(len(batch), 3)
+        for query, insights in zip(queries, batch):
+            single = text_insighter.get(query, getter)
+            self.assertEqual([(insight.url, insight.rank, insight.summary.text, round(insight.summary.score, 9))
+                              for insight in insights],
+                             [(insight.url, insight.rank, insight.summary.text, round(insight.summary.score, 9))
+                              for insight in single])
+        self.assertEqual([insight.summary.text for insight in batch[1]], ["java coffee", "java page"])
+        self.assertEqual(text_insighter.get_many([], getter), [])
+
+    def test_text_insighter_get_many_processes(self):
+        text_insighter, getter, downloads = self.multi_query_text_insighter(processes=2)
+        try:
+            batch = text_insighter.get_many(["python page", "java page"], getter)
+        finally:
+            text_insighter.close()
+        self.assertEqual(sorted(downloads), ["mock://java.com", "mock://python.com", "mock://shared.com"])
+        self.assertEqual([[insight.summary.text for insight in insights] for insights in batch],
+                         [["python page", "a python snake"], ["java coffee", "java page"]])
+
+    def test_text_insighter_get_many_partial(self):
+        for kwargs in ({"workers": 2}, {"corpus": PageCorpus()}):
+            with self.subTest(**kwargs):
+                text_insighter, getter, downloads = self.multi_query_text_insighter(partial=True, **kwargs)
+
+                def broken_getter(url, timeout=None):
+                    if url == "mock://shared.com":
+                        raise requests.ConnectionError("connection refused")
+                    return getter(url, timeout)
+
+                batch = text_insighter.get_many(["python page", "java page", "shared page"], broken_getter)
+                self.assertEqual([[(insight.status, insight.summary and insight.summary.text) for insight in insights]
+                                  for insights in batch],
+                                 [[("ok", "python page"), ("error", None)], [("error", None), ("ok", "java page")],
+                                  [("error", None)]])
+
+    def test_text_insighter_corpus(self):
+        metrics = Metrics()
+        text_insighter, getter, downloads = self.multi_query_text_insighter(metrics=metrics, corpus=PageCorpus())
+        expected = [insight.summary.text for insight in text_insighter.get("java page", getter)]
+        self.assertEqual(expected, ["java coffee", "java page"])
+        self.assertEqual(metrics.counters["corpus.indexed"], 2)
+
+        # pages that didn't change are not parsed again
+        insights = text_insighter.get("java page", getter)
+        self.assertEqual([insight.summary.text for insight in insights], expected)
+        self.assertEqual(metrics.counters["corpus.hits"], 2)
+        self.assertEqual(insights.trace.counters.get("parse.tags"), None)
+        self.assertEqual([summary.summary.text for summary in text_insighter.iter_get("java page", getter)],
+                         expected)
+
+        # offline, only the pages on the corpus are used, without downloading anything
+        downloads.clear()
+        insights = text_insighter.get("python snake", offline=True)
+        self.assertEqual([(insight.url, insight.summary.text) for insight in insights],
+                         [("mock://shared.com", "a python snake")])
+        self.assertEqual(downloads, [])
+        self.assertRaises(ValueError, self.multi_query_text_insighter()[0].get, "python", offline=True)
+
+        batch = text_insighter.get_many(["java page", "python page"], getter)
+        self.assertEqual([insight.summary.text for insight in batch[0]], expected)
+        self.assertEqual([insight.summary.text for insight in batch[1]], ["python page", "a python snake"])
+        self.assertEqual(len(text_insighter.corpus), 3)
+
+    def test_process_summariser(self):
+        cache = LRUCache()
+        scraper = SimpleWebScraper(strip_tags=["b"], cache=cache)
+        scraper.session
+        process_summariser = ProcessSummariser(scraper, CosineSummariser(), processes=2)
+        try:
+            pages = [RawPage("mock://{}.com".format(i), "<p>page <b>bold</b> {}</p>".format(i).encode()) for i in "ab"]
+            summaries = process_summariser.summarise_many(pages, "page")
+            self.assertEqual([summary.text for summary in summaries], ["page  a", "page  b"])
+            self.assertEqual(summaries[0].path, "/p[1]")
+        finally:
+            process_summariser.close()
+        # the scraper on this process keeps its session and cache
+        self.assertIs(scraper.cache, cache)
+        self.assertIsNotNone(scraper._session)
+
+    def test_text_insighter_metrics(self):
+        observed = []
+        metrics = Metrics(hooks=[lambda name, value, labels: observed.append(name)])
+        searcher = GoogleSearcher(cache=LRUCache())
+        searcher.fetch_urls = MagicMock(return_value=["mock://aurl.com", "mock://anyurl.com"])
+        scraper = SimpleWebScraper(cache=LRUCache())
+        adapter = requests_mock.Adapter()
+        scraper.session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://aurl.com", text="<html><p>first page</p></html>")
+        adapter.register_uri(method="GET", url="mock://anyurl.com", text="<p>second</p><p>page</p>")
+
+        text_insighter = TextInsight(searcher, scraper, CosineSummariser(), metrics=metrics)
+        text_insighter.get("page")
+        insights = text_insighter.get("page")
+
+        trace = insights.trace
+        self.assertEqual([(span.stage, span.url) for span in trace.spans], [
+            ("search", None), ("fetch", "mock://aurl.com"), ("parse", "mock://aurl.com"),
+            ("fetch", "mock://anyurl.com"), ("parse", "mock://anyurl.com"), ("summarise", None)
+        ])
+        self.assertEqual(trace.counters, {"search.cache_hits": 1, "fetch.cache": 2, "fetch.bytes": 54,
+                                          "parse.tags": 4})
+        self.assertGreaterEqual(trace.total("fetch"), 0)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["histograms"]["fetch.wall"]["count"], 4)
+        self.assertEqual(snapshot["counters"]["fetch.network"], 2)
+        self.assertEqual(snapshot["counters"]["search.cache_misses"], 1)
+        self.assertIn("fetch.bytes", observed)
+        self.assertIn('fetch_wall_bucket{le="+Inf"} 4', metrics.exposition())
+
+    def test_text_insighter_metrics_disabled(self):
+        searcher = Searcher()
+        searcher.search = MagicMock()
+        searcher.urls = ["mock://aurl.com"]
+        scraper = SimpleWebScraper()
+        adapter = requests_mock.Adapter()
+        scraper.session.mount('mock', adapter)
+        adapter.register_uri(method="GET", url="mock://aurl.com", text="<p>page</p>")
+
+        insights = TextInsight(searcher, scraper, CosineSummariser()).get("page")
+        self.assertIsInstance(insights.trace, NullTrace)
+        self.assertEqual(insights.trace.spans, [])
+
 
 if __name__ == '__main__':
     unittest.main()